@@ -0,0 +1,161 @@
+"""Archiving old orders and reorder logs to a cold SQLite file.
+
+item_orders only grows, and every scan of it pays for the whole history.
+``archive_before`` moves the orders created before a cutoff, and the resolved
+reorder logs logged before it, into the file named by OMS_ARCHIVE_DATABASE.
+That file is attached to every connection as the "archive" schema, with
+tables of the same columns. Rows move in chunks of ``chunk_size``. Each chunk
+is copied to the archive and committed, then deleted from the hot table
+where the archive holds it and committed. SQLite only makes a transaction
+over attached databases atomic per database in WAL mode, so one transaction
+could lose a chunk in a crash. This way a crash between the two commits
+leaves a chunk in both stores, and the next run finishes it.
+
+Archived orders are history, not deletions. Their totals stay in the stats
+tables, ``stats.rebuild`` counts them, and the change feed logs no move.
+Deleting an item or customer detaches its archived rows as it does its
+hot ones (``detach``). Pending reorders and the newest row of each table are
+never archived.
+Keeping the newest row stops SQLite from handing a freed id to a new row
+while the archive still has it.
+
+``all_orders`` and ``all_reorder_logs`` read both stores as one. The list
+endpoints use them with ``include_archive=true``. A row in both stores
+(see above) is read from the hot table.
+"""
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import (
+    Column, DateTime, Index, Integer, MetaData, String, Table, delete, exists, func, insert, select, text, union_all, update,
+)
+from sqlalchemy.orm import Session
+
+import models
+from cache import invalidate_on_commit
+
+SCHEMA = "archive"
+
+metadata = MetaData(schema=SCHEMA)
+
+# Same columns, in the same order, as their hot tables, so rows are copied
+# (and read back in a UNION ALL) column for column. No foreign keys, since
+# items and customers stay in the main database.
+orders = Table(
+    "item_orders",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("item_id", Integer),
+    Column("customer_id", Integer),
+    Column("order_quantity", Integer),
+    Column("created_at", DateTime(timezone=True), index=True),
+    Index("ix_archive_item_orders_customer_id_id", "customer_id", "id"),
+    Index("ix_archive_item_orders_item_id_id", "item_id", "id"),
+)
+
+reorder_logs = Table(
+    "item_reorder_logs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("item_id", Integer),
+    Column("timestamp", DateTime(timezone=True), index=True),
+    Column("status", String, nullable=False),
+    Index("ix_archive_item_reorder_logs_status_id", "status", "id"),
+)
+
+# Hot model, its archive table, which of its rows may be archived before a
+# cutoff, and the cache tags a moved row invalidates (it leaves the nested
+# histories of its item and customer).
+ARCHIVES = {
+    "orders": (
+        models.ItemOrder,
+        orders,
+        lambda cutoff: [models.ItemOrder.created_at < cutoff],
+        lambda row: (f"item:{row.item_id}", f"customer:{row.customer_id}"),
+    ),
+    "reorder_logs": (
+        models.ItemReorderLog,
+        reorder_logs,
+        lambda cutoff: [models.ItemReorderLog.timestamp < cutoff, models.ItemReorderLog.status == "resolved"],
+        lambda row: (f"item:{row.item_id}",),
+    ),
+}
+
+
+def attached(db) -> bool:
+    """Whether db's connection has the archive attached."""
+    return db.execute(text(f"select 1 from pragma_database_list where name = '{SCHEMA}'")).first() is not None
+
+
+def init(connection):
+    """Create the archive tables if the archive is attached."""
+    if attached(connection):
+        metadata.create_all(bind=connection)
+
+
+def detach(db, column: str, ids):
+    """Set `column` ("item_id" or "customer_id") to NULL on the archived rows
+    pointing at the deleted ids, when the archive is attached."""
+    if not attached(db):
+        return
+    for table in (orders, reorder_logs):
+        if column in table.c:
+            db.execute(update(table).where(table.c[column].in_(ids)).values({column: None}))
+
+
+def _both(hot, archived):
+    return union_all(
+        select(hot),
+        select(archived).where(~exists().where(hot.c.id == archived.c.id)),
+    ).subquery()
+
+
+def all_orders():
+    """item_orders and its archive as one subquery with the same columns."""
+    return _both(models.ItemOrder.__table__, orders)
+
+
+def all_reorder_logs():
+    return _both(models.ItemReorderLog.__table__, reorder_logs)
+
+
+def archive_table(db: Session, table: str, cutoff: datetime, chunk_size: int = 5000) -> int:
+    """Move the archivable rows of `table` from before `cutoff`, a chunk at a time, and return how many moved."""
+    model, archived, archivable, tags = ARCHIVES[table]
+    hot = model.__table__
+    moved = 0
+    last_id = 0
+    while True:
+        newest = db.scalar(select(func.max(model.id)))
+        if newest is None:
+            return moved
+        ids = db.scalars(
+            select(model.id)
+            .where(*archivable(cutoff), model.id > last_id, model.id < newest)
+            .order_by(model.id)
+            .limit(chunk_size)
+        ).all()
+        if not ids:
+            return moved
+        last_id = ids[-1]
+        db.execute(
+            insert(archived).prefix_with("OR IGNORE").from_select(
+                [column.key for column in archived.columns], select(hot).where(hot.c.id.in_(ids))
+            )
+        )
+        db.commit()
+        removed = db.execute(
+            delete(hot)
+            .where(hot.c.id.in_(select(archived.c.id).where(archived.c.id.in_(ids))))
+            .returning(*hot.columns)
+        ).all()
+        invalidate_on_commit(db, *(tag for row in removed for tag in tags(row)))
+        db.commit()
+        moved += len(removed)
+
+
+def archive_before(db: Session, cutoff: datetime, chunk_size: int = 5000) -> Dict[str, int]:
+    """Move old orders and resolved reorder logs to the archive; returns how many of each moved."""
+    if not attached(db):
+        raise RuntimeError("No archive is attached; set OMS_ARCHIVE_DATABASE")
+    return {table: archive_table(db, table, cutoff, chunk_size) for table in ARCHIVES}
@@ -0,0 +1,374 @@
+import asyncio
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import archive, bulk_import, changes, crud, crud_async, database, idempotency, models, schemas, stats
+from cache import catalog
+from database import READ_METHODS
+from idempotency import IdempotencyKeyHeader
+from responses import (
+    Fields, batch_report, cached_response, changes_response, changes_stream_response, customer_entry,
+    customer_search_entry, customers_entry, export_response, item_entry, item_search_entry, items_entry,
+    lean_columns, next_cursor_headers, parse_fields, rows_response, validated,
+)
+from write_queue import WriteCoalescer, get_write_coalescer, run_in_transaction
+
+# Async twins of the handlers in main.py, mounted instead of them when
+# OMS_ASYNC_HANDLERS is set. Keep the two in step.
+router = APIRouter()
+
+
+
+# Dependency
+async def get_async_db(request: Request):
+    factory = database.AsyncReadSessionLocal if request.method in READ_METHODS else database.AsyncSessionLocal
+    async with factory() as db:
+        yield db
+
+def _coalesced(writes: WriteCoalescer, operation, schema, *args):
+    return asyncio.wrap_future(writes.submit(validated(operation, schema), *args))
+
+async def _idempotent(db: AsyncSession, writes: Optional[WriteCoalescer], key: str, operation, schema, *args):
+    # The async version of write_queue.write's idempotent path.
+    replay = await db.run_sync(idempotency.lookup, key, operation, args)
+    if replay is not None:
+        return replay
+    operation = idempotency.once(key, operation, schema)
+    if writes is not None:
+        return await asyncio.wrap_future(writes.submit(operation, *args))
+    async with db.bind.connect() as connection:
+        return await connection.run_sync(run_in_transaction, operation, *args)
+
+# List all orders endpoint
+@router.get("/orders/", response_model=list[schemas.ItemOrder], operation_id="read_orders", summary="Retrieve a list of orders, optionally for one customer or item and within a from/to time window.")
+async def read_orders(
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    item_id: Optional[int] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    fields: Fields = None,
+    include_archive: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if include_archive and not await db.run_sync(archive.attached):
+        raise HTTPException(status_code=400, detail="No archive database is configured (OMS_ARCHIVE_DATABASE)")
+    orders = await crud_async.get_orders(
+        db,
+        skip=skip,
+        limit=limit,
+        after_id=after_id,
+        customer_id=customer_id,
+        item_id=item_id,
+        created_from=created_from,
+        created_to=created_to,
+        include_archive=include_archive,
+        columns=lean_columns(models.ItemOrder, parse_fields(models.ItemOrder, fields)),
+    )
+    return rows_response(orders, next_cursor_headers(orders, limit, after_id))
+
+# Delete customer endpoint
+@router.delete("/customers/{customer_id}", response_model=schemas.Customer, operation_id="delete_customer", summary="Delete a customer by their unique ID.")
+async def delete_customer(customer_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_customer = await crud_async.delete_customer(db, customer_id)
+    if db_customer is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return db_customer
+
+# Delete order endpoint
+@router.delete("/orders/{order_id}", response_model=schemas.ItemOrder, operation_id="delete_order", summary="Delete an order by its unique ID.")
+async def delete_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_order = await crud_async.delete_order(db, order_id)
+    if db_order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return db_order
+
+# Delete reorder log endpoint
+@router.delete("/reorder_logs/{log_id}", response_model=schemas.ItemReorderLog, operation_id="delete_reorder_log", summary="Delete a reorder log by its unique ID.")
+async def delete_reorder_log(log_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_log = await crud_async.delete_reorder_log(db, log_id)
+    if db_log is None:
+        raise HTTPException(status_code=404, detail="Reorder log not found")
+    return db_log
+
+# Bulk delete endpoints (crud.delete_bulk)
+@router.post("/orders/bulk_delete", response_model=schemas.BulkDeleteResult, operation_id="delete_orders_bulk", summary="Delete the orders with the given ids and/or in an id range, with set-based statements.")
+async def delete_orders_bulk(selection: schemas.BulkDelete, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.delete_bulk(db, "orders", selection)
+
+@router.post("/customers/bulk_delete", response_model=schemas.BulkDeleteResult, operation_id="delete_customers_bulk", summary="Delete the customers with the given ids and/or in an id range; their orders are kept, detached from them.")
+async def delete_customers_bulk(selection: schemas.BulkDelete, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.delete_bulk(db, "customers", selection)
+
+@router.post("/items/bulk_delete", response_model=schemas.BulkDeleteResult, operation_id="delete_items_bulk", summary="Delete the items with the given ids and/or in an id range; their orders and reorder logs are kept, detached from them.")
+async def delete_items_bulk(selection: schemas.BulkDelete, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.delete_bulk(db, "items", selection)
+
+@router.post("/reorder_logs/bulk_delete", response_model=schemas.BulkDeleteResult, operation_id="delete_reorder_logs_bulk", summary="Delete the reorder logs with the given ids and/or in an id range, with set-based statements.")
+async def delete_reorder_logs_bulk(selection: schemas.BulkDelete, db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.delete_bulk(db, "reorder_logs", selection)
+
+@router.post("/customers/", response_model=schemas.Customer, operation_id="create_customer", summary="Create a new customer.")
+async def create_customer(customer: schemas.CustomerCreate, idempotency_key: IdempotencyKeyHeader = None, db: AsyncSession = Depends(get_async_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    if idempotency_key is not None:
+        return await _idempotent(db, writes, idempotency_key, crud.create_customer, schemas.Customer, customer)
+    if writes is not None:
+        return await _coalesced(writes, crud.create_customer, schemas.Customer, customer)
+    return await crud_async.create_customer(db=db, customer=customer)
+
+@router.post("/items/", response_model=schemas.Item, operation_id="create_item", summary="Create a new item.")
+async def create_item(item: schemas.ItemCreate, idempotency_key: IdempotencyKeyHeader = None, db: AsyncSession = Depends(get_async_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    if idempotency_key is not None:
+        return await _idempotent(db, writes, idempotency_key, crud.create_item, schemas.Item, item)
+    if writes is not None:
+        return await _coalesced(writes, crud.create_item, schemas.Item, item)
+    return await crud_async.create_item(db=db, item=item)
+
+@router.put("/customers/{customer_id}", response_model=schemas.Customer, operation_id="update_customer", summary="Update an existing customer by ID.")
+async def update_customer(customer_id: int, customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_async_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    if writes is not None:
+        db_customer = await _coalesced(writes, crud.update_customer, schemas.Customer, customer_id, customer)
+    else:
+        db_customer = await crud_async.update_customer(db, customer_id, customer)
+    if db_customer is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return db_customer
+
+@router.get("/customers/", response_model=list[schemas.Customer], operation_id="read_customers", summary="Retrieve a list of all customers. Do not use this when searching by customer name. For searching by name use read_customer_by_name.")
+async def read_customers(request: Request, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, embed: schemas.EmbedMode = "full", fields: Fields = None, db: AsyncSession = Depends(get_async_db)):
+    field_names = parse_fields(models.Customer, fields)
+    entry = await catalog.get_or_load_async(("read_customers", skip, limit, after_id, embed, field_names), lambda: db.run_sync(customers_entry, skip, limit, after_id, embed, field_names))
+    return cached_response(request, entry)
+
+@router.get("/customers/{customer_id}", response_model=schemas.Customer, operation_id="read_customer", summary="Retrieve a customer by their unique ID.")
+async def read_customer(request: Request, customer_id: int, embed: schemas.EmbedMode = "full", db: AsyncSession = Depends(get_async_db)):
+    entry = await catalog.get_or_load_async(("read_customer", customer_id, embed), lambda: db.run_sync(customer_entry, customer_id, embed))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return cached_response(request, entry)
+
+@router.get("/customers/by_name/{name}", response_model=list[schemas.Customer], operation_id="read_customer_by_name", summary="Search customers by name or address, best match first. Use match=substring for a plain partial name match.")
+async def read_customer_by_name(request: Request, name: str, limit: int = 100, match: schemas.SearchMode = "ranked", embed: schemas.EmbedMode = "full", db: AsyncSession = Depends(get_async_db)):
+    entry = await catalog.get_or_load_async(("read_customer_by_name", name, limit, match, embed), lambda: db.run_sync(customer_search_entry, name, limit, match, embed))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No customers found")
+    return cached_response(request, entry)
+
+
+
+@router.put("/items/{item_id}", response_model=schemas.Item, operation_id="update_item", summary="Update an existing item by ID.")
+async def update_item(item_id: int, item: schemas.ItemCreate, db: AsyncSession = Depends(get_async_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    if writes is not None:
+        db_item = await _coalesced(writes, crud.update_item, schemas.Item, item_id, item)
+    else:
+        db_item = await crud_async.update_item(db, item_id, item)
+    if db_item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return db_item
+
+@router.get("/items/", response_model=list[schemas.Item], operation_id="read_items", summary="Retrieve a list of all items. Do not use this when searching by item name. For searching by name use read_item_by_name.")
+async def read_items(request: Request, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, embed: schemas.EmbedMode = "full", fields: Fields = None, db: AsyncSession = Depends(get_async_db)):
+    field_names = parse_fields(models.Item, fields)
+    entry = await catalog.get_or_load_async(("read_items", skip, limit, after_id, embed, field_names), lambda: db.run_sync(items_entry, skip, limit, after_id, embed, field_names))
+    return cached_response(request, entry)
+
+# Declared before /items/{item_id} so "low_stock" is not parsed as an id.
+@router.get("/items/low_stock", response_model=list[schemas.ItemSummary], operation_id="read_low_stock_items", summary="Items whose stock is under their reorder quantity, largest shortfall first.")
+async def read_low_stock_items(skip: int = 0, limit: int = 100, fields: Fields = None, db: AsyncSession = Depends(get_async_db)):
+    columns = lean_columns(models.Item, parse_fields(models.Item, fields))
+    return rows_response(await crud_async.get_low_stock_items(db, skip=skip, limit=limit, columns=columns))
+
+@router.get("/items/{item_id}", response_model=schemas.Item, operation_id="read_item", summary="Retrieve an item by its unique ID.")
+async def read_item(request: Request, item_id: int, embed: schemas.EmbedMode = "full", db: AsyncSession = Depends(get_async_db)):
+    entry = await catalog.get_or_load_async(("read_item", item_id, embed), lambda: db.run_sync(item_entry, item_id, embed))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return cached_response(request, entry)
+
+@router.get("/items/by_name/{name}", response_model=list[schemas.Item], operation_id="read_item_by_name", summary="Search items by name, description or manufacturer, best match first. Use match=substring for a plain partial name match.")
+async def read_item_by_name(request: Request, name: str, limit: int = 100, match: schemas.SearchMode = "ranked", embed: schemas.EmbedMode = "full", db: AsyncSession = Depends(get_async_db)):
+    entry = await catalog.get_or_load_async(("read_item_by_name", name, limit, match, embed), lambda: db.run_sync(item_search_entry, name, limit, match, embed))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No items found")
+    return cached_response(request, entry)
+
+# Delete item endpoint
+@router.delete("/items/{item_id}", response_model=schemas.Item, operation_id="delete_item", summary="Delete an item by its unique ID.")
+async def delete_item(item_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_item = await crud_async.delete_item(db, item_id)
+    if db_item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return db_item
+
+@router.post("/orders/", response_model=schemas.ItemOrder, operation_id="create_order", summary="Create a new order for an item if sufficient stock is available.")
+async def create_order(order: schemas.ItemOrderCreate, idempotency_key: IdempotencyKeyHeader = None, db: AsyncSession = Depends(get_async_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    if idempotency_key is not None:
+        db_order = await _idempotent(db, writes, idempotency_key, crud.create_order, schemas.ItemOrder, order)
+    elif writes is not None:
+        db_order = await _coalesced(writes, crud.create_order, schemas.ItemOrder, order)
+    else:
+        db_order = await crud_async.create_order(db, order)
+    if db_order is None:
+        raise HTTPException(status_code=400, detail="Order quantity exceeds available stock")
+    return db_order
+
+@router.post("/orders/batch", response_model=schemas.ItemOrderBatchResult, operation_id="create_orders_batch", summary="Create several orders in one transaction, either all-or-nothing or accepting the lines that fit.")
+async def create_orders_batch(batch: schemas.ItemOrderBatchCreate, db: AsyncSession = Depends(get_async_db)):
+    results = await crud_async.create_orders_bulk(db, batch.orders, all_or_nothing=batch.all_or_nothing)
+    return batch_report(results, batch.all_or_nothing)
+
+@router.post("/items/import", response_model=schemas.ImportReport, operation_id="import_items", summary="Bulk import items from a CSV or NDJSON file, optionally updating existing items matched by name and manufacturer.")
+async def import_items(file: UploadFile, upsert: bool = False, chunk_size: int = Query(1000, ge=1, le=10000), db: AsyncSession = Depends(get_async_db)):
+    return await run_in_threadpool(_import, db.bind.sync_engine, "items", file, upsert, chunk_size)
+
+@router.post("/customers/import", response_model=schemas.ImportReport, operation_id="import_customers", summary="Bulk import customers from a CSV or NDJSON file, optionally updating existing customers matched by name and zip code.")
+async def import_customers(file: UploadFile, upsert: bool = False, chunk_size: int = Query(1000, ge=1, le=10000), db: AsyncSession = Depends(get_async_db)):
+    return await run_in_threadpool(_import, db.bind.sync_engine, "customers", file, upsert, chunk_size)
+
+def _import(bind, kind: str, file: UploadFile, upsert: bool, chunk_size: int):
+    # Parsing and the chunked inserts are blocking work; run them on a
+    # threadpool thread with a sync session instead of on the event loop.
+    with Session(bind=bind) as db:
+        rows = bulk_import.parse_rows(file.file, bulk_import.detect_format(file.filename, file.content_type))
+        return bulk_import.import_rows(db, kind, rows, chunk_size=chunk_size, upsert=upsert)
+
+@router.get("/export/orders", response_class=StreamingResponse, operation_id="export_orders", summary="Stream orders as NDJSON or CSV, optionally after since_id and within a from/to time window.")
+async def export_orders(
+    format: schemas.ExportFormat = "ndjson",
+    since_id: Optional[int] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return export_response(db.bind.sync_engine, "orders", format, since_id=since_id, created_from=created_from, created_to=created_to)
+
+@router.get("/export/customers", response_class=StreamingResponse, operation_id="export_customers", summary="Stream every customer (or those after since_id) as NDJSON or CSV.")
+async def export_customers(format: schemas.ExportFormat = "ndjson", since_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    return export_response(db.bind.sync_engine, "customers", format, since_id=since_id)
+
+@router.get("/export/reorder_logs", response_class=StreamingResponse, operation_id="export_reorder_logs", summary="Stream reorder logs as NDJSON or CSV, optionally after since_id and within a from/to time window.")
+async def export_reorder_logs(
+    format: schemas.ExportFormat = "ndjson",
+    since_id: Optional[int] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return export_response(db.bind.sync_engine, "reorder_logs", format, since_id=since_id, created_from=created_from, created_to=created_to)
+
+# Change feed (changes.py). The handlers are async so that a consumer
+# waiting for changes holds no threadpool thread; each read opens its own
+# short session on the request's engine.
+def _change_reader(db: AsyncSession, limit: int, entity: Optional[str]):
+    bind = db.bind
+    return lambda after, check=False: changes.read_async(bind, after, limit, entity, check)
+
+@router.get("/changes", response_model=schemas.ChangePage, operation_id="read_changes", summary="Changes committed after the `after` cursor, oldest first. With wait, the request is held open up to that many seconds until there are some.")
+async def read_changes(
+    after: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    entity: Optional[schemas.ChangeEntity] = None,
+    wait: float = Query(0, ge=0, le=60),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await changes_response(_change_reader(db, limit, entity), after, wait)
+
+@router.get("/changes/stream", response_class=StreamingResponse, operation_id="stream_changes", summary="Server-Sent Events for every change committed after the `after` cursor or the Last-Event-ID header.")
+async def stream_changes(
+    after: int = 0,
+    entity: Optional[schemas.ChangeEntity] = None,
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await changes_stream_response(_change_reader(db, 100, entity), after if last_event_id is None else last_event_id)
+
+# Stats endpoints. /stats/items/top is declared before /stats/items/{item_id}
+# so "top" is not parsed as an id.
+@router.get("/stats/items/top", response_model=list[schemas.ItemSales], operation_id="read_top_items", summary="Items with the most units sold.")
+async def read_top_items(limit: int = Query(10, ge=1, le=1000), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(stats.top_items, limit)
+
+@router.get("/stats/items/{item_id}", response_model=schemas.ItemSales, operation_id="read_item_stats", summary="Order count and units sold of an item.")
+async def read_item_stats(item_id: int, db: AsyncSession = Depends(get_async_db)):
+    item_stats = await db.run_sync(stats.item_stats, item_id)
+    if item_stats is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return item_stats
+
+@router.get("/stats/customers/top", response_model=list[schemas.CustomerSales], operation_id="read_top_customers", summary="Customers with the most units ordered.")
+async def read_top_customers(limit: int = Query(10, ge=1, le=1000), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(stats.top_customers, limit)
+
+@router.get("/stats/customers/{customer_id}", response_model=schemas.CustomerSales, operation_id="read_customer_stats", summary="Order count and units ordered of a customer.")
+async def read_customer_stats(customer_id: int, db: AsyncSession = Depends(get_async_db)):
+    customer_stats = await db.run_sync(stats.customer_stats, customer_id)
+    if customer_stats is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return customer_stats
+
+@router.get("/stats/daily", response_model=list[schemas.DailyOrderVolume], operation_id="read_daily_order_volume", summary="Orders and units per UTC day, optionally within a from/to date range.")
+async def read_daily_order_volume(
+    day_from: Optional[date] = Query(None, alias="from"),
+    day_to: Optional[date] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(stats.daily_volume, day_from, day_to)
+
+@router.get("/cache/stats", response_model=schemas.CacheStats, operation_id="read_cache_stats", summary="Hit and miss counters of the item and customer read cache.")
+async def read_cache_stats():
+    return catalog.stats()
+
+@router.get("/reorder_logs/", response_model=list[schemas.ItemReorderLog], operation_id="read_reorder_logs", summary="Retrieve a list of reorder logs for items, optionally only those with a given status.")
+async def read_reorder_logs(
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    status: Optional[schemas.ReorderStatus] = None,
+    fields: Fields = None,
+    include_archive: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if include_archive and not await db.run_sync(archive.attached):
+        raise HTTPException(status_code=400, detail="No archive database is configured (OMS_ARCHIVE_DATABASE)")
+    reorder_logs = await crud_async.get_reorder_logs(
+        db,
+        skip=skip,
+        limit=limit,
+        after_id=after_id,
+        status=status,
+        include_archive=include_archive,
+        columns=lean_columns(models.ItemReorderLog, parse_fields(models.ItemReorderLog, fields)),
+    )
+    return rows_response(reorder_logs, next_cursor_headers(reorder_logs, limit, after_id))
+
+@router.post("/reorder_logs/{log_id}/acknowledge", response_model=schemas.ItemReorderLog, operation_id="acknowledge_reorder_log", summary="Mark an open reorder as acknowledged.")
+async def acknowledge_reorder_log(log_id: int, db: AsyncSession = Depends(get_async_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    if writes is not None:
+        db_log = await _coalesced(writes, crud.set_reorder_status, schemas.ItemReorderLog, log_id, "acknowledged")
+    else:
+        db_log = await crud_async.set_reorder_status(db, log_id, "acknowledged")
+    if db_log is None:
+        raise HTTPException(status_code=404, detail="Reorder log not found")
+    if db_log.status != "acknowledged":
+        raise HTTPException(status_code=409, detail=f"Reorder log is {db_log.status}")
+    return db_log
+
+@router.post("/reorder_logs/{log_id}/resolve", response_model=schemas.ItemReorderLog, operation_id="resolve_reorder_log", summary="Mark a pending reorder as resolved.")
+async def resolve_reorder_log(log_id: int, db: AsyncSession = Depends(get_async_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    if writes is not None:
+        db_log = await _coalesced(writes, crud.set_reorder_status, schemas.ItemReorderLog, log_id, "resolved")
+    else:
+        db_log = await crud_async.set_reorder_status(db, log_id, "resolved")
+    if db_log is None:
+        raise HTTPException(status_code=404, detail="Reorder log not found")
+    if db_log.status != "resolved":
+        raise HTTPException(status_code=409, detail=f"Reorder log is {db_log.status}")
+    return db_log
@@ -0,0 +1,56 @@
+"""Rows per second for bulk item imports versus one crud.create_item per row.
+
+    python -m benchmarks.bulk_import --rows 100000
+"""
+import argparse
+import io
+import json
+import time
+
+import bulk_import, crud, schemas
+from benchmarks.common import temp_database
+
+
+def _csv(rows: int) -> bytes:
+    lines = ["name,description,manufacturer_name,manufacturer_email,in_stock,reorder_quantity"]
+    lines += [f"Item {i},Imported item {i},Maker {i % 50},maker{i % 50}@example.com,{i % 1000},10" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--per-row-sample", type=int, default=500, help="rows to time through crud.create_item")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+    payload = _csv(args.rows)
+    report = {"rows": args.rows}
+
+    _, Session = temp_database()
+    with Session() as db:
+        start = time.perf_counter()
+        result = bulk_import.import_rows(db, "items", bulk_import.parse_rows(io.BytesIO(payload), "csv"), chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - start
+    report["bulk_insert_rows_per_second"] = round(result.inserted / elapsed, 1)
+
+    with Session() as db:
+        start = time.perf_counter()
+        result = bulk_import.import_rows(
+            db, "items", bulk_import.parse_rows(io.BytesIO(payload), "csv"), chunk_size=args.chunk_size, upsert=True
+        )
+        elapsed = time.perf_counter() - start
+    report["bulk_upsert_rows_per_second"] = round(result.updated / elapsed, 1)
+
+    _, Session = temp_database()
+    with Session() as db:
+        rows = list(bulk_import.parse_rows(io.BytesIO(_csv(args.per_row_sample)), "csv"))
+        start = time.perf_counter()
+        for row in rows:
+            crud.create_item(db, schemas.ItemCreate.model_validate(row))
+        elapsed = time.perf_counter() - start
+    report["create_item_rows_per_second"] = round(len(rows) / elapsed, 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Shared helpers for the benchmark scripts.
+
+Run the scripts from the repository root as modules, e.g.
+``python -m benchmarks.pagination``, so the flat ``crud``/``models`` imports
+resolve the same way they do for ``main.py``.
+"""
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+
+
+def temp_database(name: str = "bench.db"):
+    """Create a fresh SQLite file with the full schema and return (engine, SessionFactory)."""
+    path = os.path.join(tempfile.mkdtemp(prefix="oms-bench-"), name)
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def seed(engine, items: int = 1000, customers: int = 1000, orders: int = 0):
+    """Fill the tables with synthetic rows using recursive CTEs, which is far
+    faster than going through the ORM for millions of rows. Orders are spread
+    evenly over 2024 in id order."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :count) "
+            "INSERT INTO items (name, description, manufacturer_name, manufacturer_email, in_stock, reorder_quantity) "
+            "SELECT 'Item ' || i, 'Synthetic item ' || i, 'Maker ' || (i % 50), 'maker' || (i % 50) || '@example.com', "
+            "1000000, 10 FROM n"
+        ), {"count": items})
+        conn.execute(text(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :count) "
+            "INSERT INTO customers (name, address, zip_code) "
+            "SELECT 'Customer ' || i, i || ' Bench St', printf('%05d', i % 100000) FROM n"
+        ), {"count": customers})
+        if orders:
+            conn.execute(text(
+                "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :count) "
+                "INSERT INTO item_orders (item_id, customer_id, order_quantity, created_at) "
+                "SELECT 1 + (i % :items), 1 + ((i * 7) % :customers), 1 + (i % 5), "
+                "datetime('2024-01-01', '+' || (i * 31536000 / :count) || ' seconds') FROM n"
+            ), {"count": orders, "items": items, "customers": customers})
+
+
+def timed(fn, repeat: int = 20):
+    """Call fn `repeat` times and return the per-call latencies in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(ordered, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(samples):
+    """p50/p95/p99/mean of a list of millisecond latencies."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    return {
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(percentile(ordered, 0.95), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+    }
@@ -0,0 +1,118 @@
+"""Load-test the API under uvicorn with sync and async handlers.
+
+Starts one single-worker uvicorn per mode against the same seeded database
+and drives it with concurrent HTTP clients issuing a read-heavy mix
+(item and customer reads, one order in every ten requests).
+
+    python -m benchmarks.load --concurrency 10 100 1000 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import seed, summarize, temp_database
+import models
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url: str, async_handlers: bool, extra_env=None):
+    port = _free_port()
+    env = dict(os.environ, OMS_DATABASE_URL=database_url, OMS_ASYNC_HANDLERS="1" if async_handlers else "0")
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{base_url}/openapi.json", timeout=1)
+            return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def drive(base_url: str, concurrency: int, duration: float, items: int, customers: int, write_fraction: float = 0.1):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client):
+        nonlocal errors
+        rng = random.Random()
+        while time.monotonic() < deadline:
+            roll = rng.random()
+            start = time.perf_counter()
+            if roll < write_fraction:
+                request = client.post("/orders/", json={
+                    "item_id": rng.randint(1, items), "customer_id": rng.randint(1, customers), "order_quantity": 1,
+                })
+            elif roll < write_fraction + (1 - write_fraction) / 2:
+                request = client.get(f"/items/{rng.randint(1, items)}", params={"embed": "none"})
+            else:
+                request = client.get(f"/customers/{rng.randint(1, customers)}", params={"embed": "counts"})
+            try:
+                response = await request
+                if response.status_code >= 500:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--customers", type=int, default=10_000)
+    args = parser.parse_args()
+
+    engine, _ = temp_database()
+    models.init_db(engine)
+    seed(engine, items=args.items, customers=args.customers)
+    database_url = str(engine.url)
+
+    report = []
+    for async_handlers in (False, True):
+        process, base_url = start_server(database_url, async_handlers)
+        try:
+            for concurrency in args.concurrency:
+                latencies, errors = asyncio.run(drive(base_url, concurrency, args.duration, args.items, args.customers))
+                report.append({
+                    "mode": "async" if async_handlers else "sync",
+                    "concurrency": concurrency,
+                    "requests_per_second": round(len(latencies) / args.duration, 1),
+                    "errors": errors,
+                    **summarize(latencies),
+                })
+        finally:
+            process.terminate()
+            process.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Tool-call latency and payload size of the MCP tools, over HTTP and in-process.
+
+"http" is fastapi-mcp's stock executor, which replays each call as a request
+to the app and returns the full response body. "in_process" is
+mcp_tools.InProcessMCP, which calls crud directly and returns compact,
+capped pages. Both run against the same freshly seeded database with the
+catalog cache off, so every call does its real work. The timings cover the
+executor only, not the MCP transport.
+
+    python -m benchmarks.mcp_tools --orders 100000 --repeat 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+
+CALLS = [
+    ("read_items", {}),
+    ("read_customers", {}),
+    ("read_orders", {"customer_id": 7}),
+    ("read_item_by_name", {"name": "Item 42"}),
+    ("create_order", {"item_id": 1, "customer_id": 1, "order_quantity": 1}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    # Settings are read once, on first use, so the app's database has to be
+    # chosen before anything touches it.
+    path = os.path.join(tempfile.mkdtemp(prefix="oms-bench-"), "bench.db")
+    os.environ.update(OMS_DATABASE_URL=f"sqlite:///{path}", OMS_CATALOG_CACHE="0", OMS_METRICS="0")
+    import main, models
+    from benchmarks.common import seed, summarize, timed
+    from database import engine
+    from fastapi_mcp import FastApiMCP
+    from mcp_tools import InProcessMCP
+
+    models.init_db(engine)
+    seed(engine, items=args.items, customers=args.customers, orders=args.orders)
+    options = {"include_operations": main.MCP_OPERATIONS}
+    executors = {
+        "http": FastApiMCP(main.app, **options),
+        "in_process": InProcessMCP(main.app, main.SessionLocal, main.ReadSessionLocal, **options),
+    }
+    loop = asyncio.new_event_loop()
+
+    def call(mcp, name, arguments):
+        content = loop.run_until_complete(mcp._execute_api_tool(mcp._http_client, name, arguments, mcp.operation_map))
+        return len(content[0].text.encode())
+
+    report = {}
+    for name, arguments in CALLS:
+        report[name] = {}
+        for mode, mcp in executors.items():
+            payload_bytes = call(mcp, name, arguments)
+            report[name][mode] = {
+                "payload_bytes": payload_bytes,
+                **summarize(timed(lambda: call(mcp, name, arguments), args.repeat)),
+            }
+    loop.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Time filtered order listings and show the plan SQLite picks for each.
+
+Every filter is run against the indexed schema, then again after dropping
+the item_orders indexes, so the scan it replaces is measured on the same data.
+
+    python -m benchmarks.order_filters --orders 10000000
+"""
+import argparse
+import json
+from datetime import datetime
+
+from sqlalchemy import text
+
+import crud, models
+from benchmarks.common import seed, summarize, temp_database, timed
+
+FILTERS = {
+    "customer": {"customer_id": 42},
+    "item": {"item_id": 42},
+    "day": {"created_from": datetime(2024, 6, 1), "created_to": datetime(2024, 6, 2)},
+    "customer_in_march": {"customer_id": 42, "created_from": datetime(2024, 3, 1), "created_to": datetime(2024, 4, 1)},
+}
+
+
+def query_plan(db, filters):
+    query = db.query(models.ItemOrder)
+    if "customer_id" in filters:
+        query = query.filter(models.ItemOrder.customer_id == filters["customer_id"])
+    if "item_id" in filters:
+        query = query.filter(models.ItemOrder.item_id == filters["item_id"])
+    if "created_from" in filters:
+        query = query.filter(
+            models.ItemOrder.created_at >= filters["created_from"], models.ItemOrder.created_at < filters["created_to"]
+        )
+    compiled = query.order_by(models.ItemOrder.id).limit(100).statement.compile(db.get_bind())
+    params = [compiled.params[name] for name in compiled.positiontup]
+    rows = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", tuple(params))
+    return [row[3] for row in rows]
+
+
+def run(db, limit, repeat):
+    results = {}
+    for name, filters in FILTERS.items():
+        first_page = crud.get_orders(db, limit=limit, **filters)
+        cursor = first_page[-1].id if first_page else 0
+        results[name] = {
+            "plan": query_plan(db, filters),
+            "first_page": summarize(timed(lambda: crud.get_orders(db, limit=limit, **filters), repeat)),
+            "next_page": summarize(
+                timed(lambda: crud.get_orders(db, limit=limit, after_id=cursor, **filters), repeat)
+            ),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--items", type=int, default=1_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    engine, Session = temp_database()
+    seed(engine, items=args.items, customers=args.customers, orders=args.orders)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+    db = Session()
+    indexed = run(db, args.limit, args.repeat)
+    db.close()
+    with engine.begin() as conn:
+        for index in models.ItemOrder.__table__.indexes:
+            if index.name != "ix_item_orders_id":
+                conn.execute(text(f"DROP INDEX {index.name}"))
+        conn.execute(text("ANALYZE"))
+    db = Session()
+    unindexed = run(db, args.limit, args.repeat)
+    db.close()
+
+    print(json.dumps({
+        "orders": args.orders,
+        "limit": args.limit,
+        "indexed": indexed,
+        "unindexed": unindexed,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Compare offset and keyset (after_id) paging of item_orders.
+
+    python -m benchmarks.pagination --orders 1000000 --page 1000
+"""
+import argparse
+import json
+
+import crud
+from benchmarks.common import seed, summarize, temp_database, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=500_000)
+    parser.add_argument("--page", type=int, default=1000, help="page number to fetch (1-based)")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine, Session = temp_database()
+    seed(engine, orders=args.orders)
+    db = Session()
+    skip = (args.page - 1) * args.limit
+    # The cursor a client would hold after walking to the previous page.
+    after_id = crud.get_orders(db, skip=skip - 1, limit=1)[0].id if skip else None
+
+    offset = timed(lambda: crud.get_orders(db, skip=skip, limit=args.limit), args.repeat)
+    keyset = timed(lambda: crud.get_orders(db, limit=args.limit, after_id=after_id or 0), args.repeat)
+    assert [o.id for o in crud.get_orders(db, skip=skip, limit=args.limit)] == \
+        [o.id for o in crud.get_orders(db, limit=args.limit, after_id=after_id or 0)]
+    db.close()
+
+    print(json.dumps({
+        "orders": args.orders,
+        "page": args.page,
+        "limit": args.limit,
+        "offset": summarize(offset),
+        "keyset": summarize(keyset),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare the ORM and lean serialization paths of the list endpoints.
+
+For one page of each list, "orm" is the previous path: load ORM objects and
+validate them into the response schema with from_attributes. "lean" selects
+the schema's columns as Core rows and encodes them with orjson, and
+"sparse" does the same for a ?fields= subset. The timings cover the query
+and the JSON body, which is all a handler does besides routing.
+
+    python -m benchmarks.serialization --orders 200000 --limit 100
+"""
+import argparse
+import json
+
+from pydantic import TypeAdapter
+
+import crud, models, schemas
+from benchmarks.common import seed, summarize, temp_database, timed
+from responses import lean_columns, parse_fields, rows_body
+
+# (name, ORM getter, model, response schema, sparse fieldset)
+PAGES = [
+    ("orders", crud.get_orders, models.ItemOrder, schemas.ItemOrder, "id,item_id,order_quantity"),
+    ("items", crud.get_items, models.Item, schemas.ItemSummary, "id,name,in_stock"),
+    ("customers", crud.get_customers, models.Customer, schemas.CustomerSummary, "id,name"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    engine, Session = temp_database()
+    seed(engine, items=args.items, customers=args.customers, orders=args.orders)
+    report = {"limit": args.limit}
+    with Session() as db:
+        for name, getter, model, schema, fields in PAGES:
+            adapter = TypeAdapter(list[schema])
+            extra = {"embed": "none"} if model in (models.Item, models.Customer) else {}
+
+            def orm():
+                # A fresh session per page, as each request gets one.
+                db.expunge_all()
+                return adapter.dump_json(adapter.validate_python(getter(db, limit=args.limit, **extra), from_attributes=True))
+
+            def lean(fields=None):
+                return rows_body(getter(db, limit=args.limit, columns=lean_columns(model, parse_fields(model, fields))))
+
+            assert json.loads(orm()) == json.loads(lean())
+            report[name] = {
+                "orm": summarize(timed(orm, args.repeat)),
+                "lean": summarize(timed(lean, args.repeat)),
+                "sparse": summarize(timed(lambda: lean(fields), args.repeat)),
+                "fields": fields,
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compare the "default" and "tuned" storage profiles under mixed traffic.
+
+Each profile gets its own freshly seeded database (the journal mode is
+stored in the file, so they cannot share one) and its own uvicorn, driven
+by concurrent clients where --write-fraction of the requests place orders
+and the rest read items and customers.
+
+    python -m benchmarks.storage_profile --concurrency 16 64 --write-fraction 0.1 0.3
+"""
+import argparse
+import asyncio
+import json
+
+import models
+from benchmarks.common import seed, summarize, temp_database
+from benchmarks.load import drive, start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--write-fraction", type=float, nargs="+", default=[0.1, 0.3])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=100_000)
+    args = parser.parse_args()
+
+    report = []
+    for profile in ("default", "tuned"):
+        engine, _ = temp_database()
+        models.init_db(engine)
+        seed(engine, items=args.items, customers=args.customers, orders=args.orders)
+        engine.dispose()
+        process, base_url = start_server(str(engine.url), False, {"OMS_STORAGE_PROFILE": profile})
+        try:
+            for write_fraction in args.write_fraction:
+                for concurrency in args.concurrency:
+                    latencies, errors = asyncio.run(
+                        drive(base_url, concurrency, args.duration, args.items, args.customers, write_fraction)
+                    )
+                    report.append({
+                        "profile": profile,
+                        "write_fraction": write_fraction,
+                        "concurrency": concurrency,
+                        "requests_per_second": round(len(latencies) / args.duration, 1),
+                        "errors": errors,
+                        **summarize(latencies),
+                    })
+        finally:
+            process.terminate()
+            process.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""Benchmark every API operation and compare runs against a JSON baseline.
+
+Every operation but stream_changes has a scenario: that response stays open
+for as long as the client reads it, so it has no latency to time.
+
+``run`` seeds a fresh SQLite database at the chosen volume, starts the app
+under uvicorn and drives each scenario in turn with concurrent clients for a
+fixed time. It writes p50/p95/p99/mean latency, throughput and error counts
+per scenario to a JSON file. Scenarios that need rows of their own (the
+deletes, bulk deletes and reorder transitions) create them with untimed
+requests first, so only the operation itself is measured, though the setup
+still shares the wall clock used for throughput.
+
+``compare`` reads two such files and flags every scenario whose p95 latency
+grew, or whose throughput fell, by more than the threshold. Latency changes
+under a small absolute floor are ignored as noise. It exits with status 1
+when anything regressed, so it can gate a change to crud.py or the schemas.
+
+    python -m benchmarks.suite run --scale small --output baseline.json
+    python -m benchmarks.suite run --scale small --output current.json --compare baseline.json
+    python -m benchmarks.suite compare baseline.json current.json --threshold 0.15
+
+Scales: small (10k orders), medium (1M orders, 100k items and customers) and
+large (10M orders, 1M items and customers); --items/--customers/--orders
+override them.
+"""
+import argparse
+import asyncio
+import fnmatch
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import text
+
+import models, stats
+from benchmarks.common import seed, summarize, temp_database
+from benchmarks.load import start_server
+
+SCALES = {
+    "small": {"items": 1_000, "customers": 1_000, "orders": 10_000},
+    "medium": {"items": 100_000, "customers": 100_000, "orders": 1_000_000},
+    "large": {"items": 1_000_000, "customers": 1_000_000, "orders": 10_000_000},
+}
+
+
+@dataclass
+class Volumes:
+    items: int
+    customers: int
+    orders: int
+
+
+# name -> (operation_id, prepare). prepare(client, rng, volumes) returns the
+# (method, url, request kwargs) to time, after any untimed setup requests.
+SCENARIOS = {}
+
+
+def scenario(name, operation=None):
+    def register(prepare):
+        SCENARIOS[name] = (operation or name, prepare)
+        return prepare
+    return register
+
+
+def _item_body(rng, in_stock=1_000_000, reorder_quantity=10):
+    return {
+        "name": f"Bench item {rng.getrandbits(48):x}",
+        "description": "Created by the benchmark suite",
+        "manufacturer_name": f"Maker {rng.randint(0, 49)}",
+        "manufacturer_email": "bench@example.com",
+        "in_stock": in_stock,
+        "reorder_quantity": reorder_quantity,
+    }
+
+
+def _customer_body(rng):
+    return {"name": f"Bench customer {rng.getrandbits(48):x}", "address": "1 Bench St", "zip_code": f"{rng.randint(0, 99999):05d}"}
+
+
+async def _open_reorder(client, rng, volumes):
+    # An item that drops under its threshold with its first order.
+    item = (await client.post("/items/", json=_item_body(rng, in_stock=2, reorder_quantity=5))).json()
+    await client.post("/orders/", json={"item_id": item["id"], "customer_id": rng.randint(1, volumes.customers), "order_quantity": 1})
+    logs = (await client.get(f"/items/{item['id']}")).json()["reorder_logs"]
+    return logs[0]["id"]
+
+
+# Rows each bulk delete scenario creates, untimed, and then deletes.
+BULK_ROWS = 5
+
+
+def _csv(header, rows):
+    return header + "\n" + "\n".join(rows) + "\n"
+
+
+@scenario("read_orders")
+async def _(client, rng, v):
+    return "GET", "/orders/", {"params": {"limit": 100, "after_id": rng.randint(0, max(v.orders - 100, 0))}}
+
+@scenario("read_orders[customer_id]", "read_orders")
+async def _(client, rng, v):
+    return "GET", "/orders/", {"params": {"limit": 100, "customer_id": rng.randint(1, v.customers)}}
+
+@scenario("read_orders[from,to]", "read_orders")
+async def _(client, rng, v):
+    day = rng.randint(1, 28)
+    return "GET", "/orders/", {"params": {"limit": 100, "from": f"2024-03-{day:02d}", "to": f"2024-03-{day + 1:02d}"}}
+
+@scenario("create_customer")
+async def _(client, rng, v):
+    return "POST", "/customers/", {"json": _customer_body(rng)}
+
+@scenario("read_customers")
+async def _(client, rng, v):
+    return "GET", "/customers/", {"params": {"limit": 100, "after_id": rng.randint(0, max(v.customers - 100, 0)), "embed": "counts"}}
+
+@scenario("read_customer")
+async def _(client, rng, v):
+    return "GET", f"/customers/{rng.randint(1, v.customers)}", {}
+
+@scenario("read_customer_by_name")
+async def _(client, rng, v):
+    return "GET", f"/customers/by_name/Customer {rng.randint(1, v.customers)}", {"params": {"limit": 20, "embed": "none"}}
+
+@scenario("update_customer")
+async def _(client, rng, v):
+    return "PUT", f"/customers/{rng.randint(1, v.customers)}", {"json": _customer_body(rng)}
+
+@scenario("delete_customer")
+async def _(client, rng, v):
+    customer = (await client.post("/customers/", json=_customer_body(rng))).json()
+    return "DELETE", f"/customers/{customer['id']}", {}
+
+@scenario("create_item")
+async def _(client, rng, v):
+    return "POST", "/items/", {"json": _item_body(rng)}
+
+@scenario("read_items")
+async def _(client, rng, v):
+    return "GET", "/items/", {"params": {"limit": 100, "after_id": rng.randint(0, max(v.items - 100, 0)), "embed": "counts"}}
+
+@scenario("read_item")
+async def _(client, rng, v):
+    return "GET", f"/items/{rng.randint(1, v.items)}", {}
+
+@scenario("read_item_by_name")
+async def _(client, rng, v):
+    return "GET", f"/items/by_name/Item {rng.randint(1, v.items)}", {"params": {"limit": 20, "embed": "none"}}
+
+@scenario("read_low_stock_items")
+async def _(client, rng, v):
+    return "GET", "/items/low_stock", {"params": {"limit": 100}}
+
+@scenario("update_item")
+async def _(client, rng, v):
+    return "PUT", f"/items/{rng.randint(1, v.items)}", {"json": _item_body(rng)}
+
+@scenario("delete_item")
+async def _(client, rng, v):
+    item = (await client.post("/items/", json=_item_body(rng))).json()
+    return "DELETE", f"/items/{item['id']}", {}
+
+@scenario("create_order")
+async def _(client, rng, v):
+    return "POST", "/orders/", {"json": {"item_id": rng.randint(1, v.items), "customer_id": rng.randint(1, v.customers), "order_quantity": 1}}
+
+@scenario("create_orders_batch")
+async def _(client, rng, v):
+    lines = [
+        {"item_id": rng.randint(1, v.items), "customer_id": rng.randint(1, v.customers), "order_quantity": 1}
+        for _ in range(10)
+    ]
+    return "POST", "/orders/batch", {"json": {"orders": lines}}
+
+@scenario("delete_order")
+async def _(client, rng, v):
+    order = (await client.post("/orders/", json={"item_id": rng.randint(1, v.items), "customer_id": rng.randint(1, v.customers), "order_quantity": 1})).json()
+    return "DELETE", f"/orders/{order['id']}", {}
+
+@scenario("read_reorder_logs")
+async def _(client, rng, v):
+    return "GET", "/reorder_logs/", {"params": {"limit": 100, "status": "resolved"}}
+
+@scenario("acknowledge_reorder_log")
+async def _(client, rng, v):
+    return "POST", f"/reorder_logs/{await _open_reorder(client, rng, v)}/acknowledge", {}
+
+@scenario("resolve_reorder_log")
+async def _(client, rng, v):
+    return "POST", f"/reorder_logs/{await _open_reorder(client, rng, v)}/resolve", {}
+
+@scenario("delete_reorder_log")
+async def _(client, rng, v):
+    return "DELETE", f"/reorder_logs/{await _open_reorder(client, rng, v)}", {}
+
+@scenario("delete_orders_bulk")
+async def _(client, rng, v):
+    lines = [
+        {"item_id": rng.randint(1, v.items), "customer_id": rng.randint(1, v.customers), "order_quantity": 1}
+        for _ in range(BULK_ROWS)
+    ]
+    batch = (await client.post("/orders/batch", json={"orders": lines})).json()
+    return "POST", "/orders/bulk_delete", {"json": {"ids": [line["order"]["id"] for line in batch["results"]]}}
+
+@scenario("delete_customers_bulk")
+async def _(client, rng, v):
+    ids = [(await client.post("/customers/", json=_customer_body(rng))).json()["id"] for _ in range(BULK_ROWS)]
+    return "POST", "/customers/bulk_delete", {"json": {"ids": ids}}
+
+@scenario("delete_items_bulk")
+async def _(client, rng, v):
+    ids = [(await client.post("/items/", json=_item_body(rng))).json()["id"] for _ in range(BULK_ROWS)]
+    return "POST", "/items/bulk_delete", {"json": {"ids": ids}}
+
+@scenario("delete_reorder_logs_bulk")
+async def _(client, rng, v):
+    ids = [await _open_reorder(client, rng, v) for _ in range(BULK_ROWS)]
+    return "POST", "/reorder_logs/bulk_delete", {"json": {"ids": ids}}
+
+@scenario("import_items")
+async def _(client, rng, v):
+    rows = [
+        f"Imported {rng.getrandbits(48):x},,Maker {i % 50},maker@example.com,100,10" for i in range(100)
+    ]
+    content = _csv("name,description,manufacturer_name,manufacturer_email,in_stock,reorder_quantity", rows)
+    return "POST", "/items/import", {"files": {"file": ("items.csv", content, "text/csv")}}
+
+@scenario("import_customers")
+async def _(client, rng, v):
+    rows = [f"Imported {rng.getrandbits(48):x},1 Import St,{i:05d}" for i in range(100)]
+    content = _csv("name,address,zip_code", rows)
+    return "POST", "/customers/import", {"files": {"file": ("customers.csv", content, "text/csv")}}
+
+@scenario("export_orders")
+async def _(client, rng, v):
+    return "GET", "/export/orders", {"params": {"since_id": max(v.orders - 1000, 0)}}
+
+@scenario("export_customers")
+async def _(client, rng, v):
+    return "GET", "/export/customers", {"params": {"since_id": max(v.customers - 1000, 0), "format": "csv"}}
+
+@scenario("export_reorder_logs")
+async def _(client, rng, v):
+    return "GET", "/export/reorder_logs", {"params": {"since_id": max(v.items // 10 - 1000, 0)}}
+
+@scenario("read_changes")
+async def _(client, rng, v):
+    # wait=0: an immediate page, never a held-open long poll.
+    return "GET", "/changes", {"params": {"limit": 100, "after": rng.randint(0, max(v.orders - 100, 0))}}
+
+@scenario("read_top_items")
+async def _(client, rng, v):
+    return "GET", "/stats/items/top", {"params": {"limit": 10}}
+
+@scenario("read_item_stats")
+async def _(client, rng, v):
+    return "GET", f"/stats/items/{rng.randint(1, v.items)}", {}
+
+@scenario("read_top_customers")
+async def _(client, rng, v):
+    return "GET", "/stats/customers/top", {"params": {"limit": 10}}
+
+@scenario("read_customer_stats")
+async def _(client, rng, v):
+    return "GET", f"/stats/customers/{rng.randint(1, v.customers)}", {}
+
+@scenario("read_daily_order_volume")
+async def _(client, rng, v):
+    return "GET", "/stats/daily", {"params": {"from": "2024-01-01", "to": "2024-02-01"}}
+
+@scenario("read_cache_stats")
+async def _(client, rng, v):
+    return "GET", "/cache/stats", {}
+
+
+def prepare_database(volumes: Volumes):
+    """Seed a fresh database the way a production one would look: every table,
+    search index and summary table filled in."""
+    engine, _ = temp_database()
+    models.init_db(engine)
+    seed(engine, items=volumes.items, customers=volumes.customers, orders=volumes.orders)
+    with engine.begin() as connection:
+        # A resolved reorder history for one item in ten.
+        connection.execute(text("INSERT INTO item_reorder_logs (item_id, status) SELECT id, 'resolved' FROM items WHERE id % 10 = 0"))
+        # A change feed entry for every order, as if each came through the API.
+        connection.execute(text(
+            "INSERT INTO change_log (entity, entity_id, action, data) SELECT 'order', id, 'created', "
+            "json_object('item_id', item_id, 'customer_id', customer_id, 'order_quantity', order_quantity) FROM item_orders"
+        ))
+        stats.rebuild(connection)
+        connection.execute(text("ANALYZE"))
+    return engine
+
+
+async def drive(base_url, prepare, volumes, concurrency, duration, warmup):
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client, seed_value):
+        nonlocal errors
+        rng = random.Random(seed_value)
+        started = time.monotonic()
+        while time.monotonic() - started < warmup + duration:
+            measured = time.monotonic() - started >= warmup
+            try:
+                method, url, kwargs = await prepare(client, rng, volumes)
+                start = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                elapsed = (time.perf_counter() - start) * 1000
+            except (httpx.HTTPError, KeyError, IndexError):
+                errors += measured
+                continue
+            if response.status_code >= 500:
+                errors += measured
+            elif measured:
+                latencies.append(elapsed)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        await asyncio.gather(*(worker(client, index) for index in range(concurrency)))
+    return latencies, errors
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    volumes = Volumes(**{**SCALES[args.scale], **{k: v for k, v in (("items", args.items), ("customers", args.customers), ("orders", args.orders)) if v}})
+    names = [name for name in SCENARIOS if any(fnmatch.fnmatch(name, pattern) for pattern in args.only)]
+    print(f"seeding {asdict(volumes)}", file=sys.stderr)
+    engine = prepare_database(volumes)
+    process, base_url = start_server(str(engine.url), args.async_handlers)
+    results = {}
+    try:
+        served = {
+            operation["operationId"]
+            for path in httpx.get(f"{base_url}/openapi.json").json()["paths"].values()
+            for operation in path.values()
+        }
+        uncovered = sorted(served - {operation for operation, _ in SCENARIOS.values()})
+        if uncovered:
+            print(f"no scenario for: {', '.join(uncovered)}", file=sys.stderr)
+        for name in names:
+            operation, prepare = SCENARIOS[name]
+            latencies, errors = asyncio.run(drive(base_url, prepare, volumes, args.concurrency, args.duration, args.warmup))
+            results[name] = {
+                "operation": operation,
+                "requests": len(latencies),
+                "errors": errors,
+                "requests_per_second": round(len(latencies) / args.duration, 1),
+                **summarize(latencies),
+            }
+            print(f"{name:32} {json.dumps(results[name])}", file=sys.stderr)
+    finally:
+        process.terminate()
+        process.wait()
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "volumes": asdict(volumes),
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mode": "async" if args.async_handlers else "sync",
+            "uncovered": uncovered,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    if args.compare:
+        return report_regressions(_load(args.compare), report, args.threshold, args.min_ms)
+    return 0
+
+
+def _load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(baseline, current, threshold: float, min_ms: float):
+    """Return one row per scenario in both runs, and whether any of them regressed."""
+    rows, regressed = [], False
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before or "p95_ms" not in before or "p95_ms" not in now:
+            continue
+        problems = []
+        if now["p95_ms"] > before["p95_ms"] * (1 + threshold) and now["p95_ms"] - before["p95_ms"] >= min_ms:
+            problems.append("p95")
+        if now["requests_per_second"] < before["requests_per_second"] * (1 - threshold):
+            problems.append("throughput")
+        if now["errors"] > before["errors"]:
+            problems.append("errors")
+        regressed = regressed or bool(problems)
+        rows.append((name, before, now, problems))
+    return rows, regressed
+
+
+def report_regressions(baseline, current, threshold: float, min_ms: float) -> int:
+    if baseline["meta"]["volumes"] != current["meta"]["volumes"]:
+        print(f"warning: volumes differ ({baseline['meta']['volumes']} vs {current['meta']['volumes']})")
+    rows, regressed = compare(baseline, current, threshold, min_ms)
+    print(f"{'scenario':32} {'p95 before':>11} {'p95 now':>9} {'rps before':>11} {'rps now':>9}")
+    for name, before, now, problems in rows:
+        flag = "  REGRESSED: " + ", ".join(problems) if problems else ""
+        print(
+            f"{name:32} {before['p95_ms']:>11.2f} {now['p95_ms']:>9.2f} "
+            f"{before['requests_per_second']:>11.1f} {now['requests_per_second']:>9.1f}{flag}"
+        )
+    missing = sorted(baseline["results"].keys() - current["results"].keys())
+    if missing:
+        print(f"not in this run: {', '.join(missing)}")
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("run", help="Seed, benchmark every scenario and write a JSON report.")
+    command.add_argument("--scale", choices=sorted(SCALES), default="small")
+    command.add_argument("--items", type=int)
+    command.add_argument("--customers", type=int)
+    command.add_argument("--orders", type=int)
+    command.add_argument("--concurrency", type=int, default=16)
+    command.add_argument("--duration", type=float, default=3.0, help="measured seconds per scenario")
+    command.add_argument("--warmup", type=float, default=0.5, help="unmeasured seconds before each scenario")
+    command.add_argument("--only", nargs="+", default=["*"], help="scenario name patterns, e.g. 'read_*'")
+    command.add_argument("--async-handlers", action="store_true")
+    command.add_argument("--output", default="benchmark.json")
+    command.add_argument("--compare", metavar="BASELINE", help="compare the new report against BASELINE")
+    command.add_argument("--threshold", type=float, default=0.10)
+    command.add_argument("--min-ms", type=float, default=1.0)
+    command.set_defaults(handler=run)
+
+    command = commands.add_parser("compare", help="Flag regressions between two reports.")
+    command.add_argument("baseline")
+    command.add_argument("current")
+    command.add_argument("--threshold", type=float, default=0.10, help="allowed relative change (0.10 = 10%%)")
+    command.add_argument("--min-ms", type=float, default=1.0, help="ignore p95 changes smaller than this")
+    command.set_defaults(handler=lambda args: report_regressions(
+        _load(args.baseline), _load(args.current), args.threshold, args.min_ms
+    ))
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Order-creation throughput with and without the group-commit write queue.
+
+Each client thread places orders back to back, either committing on its own
+session (the default request path) or through write_queue.WriteCoalescer.
+
+    python -m benchmarks.write_coalescing --clients 1 10 100 --duration 10
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+import crud, schemas
+from benchmarks.common import seed, summarize, temp_database
+from responses import validated
+from write_queue import WriteCoalescer
+
+
+def run(Session, engine, clients: int, duration: float, coalesced: bool, window_ms: float, max_batch: int):
+    writes = WriteCoalescer(engine, window_ms, max_batch) if coalesced else None
+    create = validated(crud.create_order, schemas.ItemOrder)
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        rng = random.Random()
+        own, failed = [], 0
+        while time.monotonic() < deadline:
+            order = schemas.ItemOrderCreate(item_id=rng.randint(1, 100), customer_id=rng.randint(1, 100), order_quantity=1)
+            start = time.perf_counter()
+            try:
+                if writes is None:
+                    with Session() as db:
+                        crud.create_order(db, order)
+                else:
+                    writes.run(create, order)
+            except OperationalError:
+                failed += 1
+                continue
+            own.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(own)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if writes is not None:
+        writes.close()
+    return {
+        "mode": "coalesced" if coalesced else "direct",
+        "clients": clients,
+        "orders_per_second": round(len(latencies) / duration, 1),
+        "locked_errors": sum(errors),
+        **summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    parser.add_argument("--max-batch", type=int, default=64)
+    args = parser.parse_args()
+
+    engine, Session = temp_database()
+    seed(engine, items=100, customers=100)
+    report = [
+        run(Session, engine, clients, args.duration, coalesced, args.window_ms, args.max_batch)
+        for clients in args.clients
+        for coalesced in (False, True)
+    ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Bulk import of items and customers from CSV or NDJSON.
+
+Rows are parsed lazily from the uploaded file, validated against the create
+schemas, and written in chunks with one multi-row INSERT per chunk, committed
+per chunk so a large file never holds the write lock for its whole length.
+Every row written is logged to the change feed in its chunk's transaction.
+With ``upsert`` rows whose natural key already exists update that row
+instead (ORM bulk UPDATE by primary key). Rows that fail validation are
+reported by their 1-based position in the file and skipped; the rest of the
+file is still imported.
+"""
+import csv
+import io
+import json
+from itertools import islice
+from typing import IO, Iterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+import changes, models, schemas
+from cache import invalidate_on_commit
+
+# What can be imported: the model, the schema rows are validated against,
+# the natural key upserts match on, and the cache tag prefix (which is also
+# the entity name in the change feed).
+IMPORTS = {
+    "items": (models.Item, schemas.ItemCreate, ("name", "manufacturer_name"), "item"),
+    "customers": (models.Customer, schemas.CustomerCreate, ("name", "zip_code"), "customer"),
+}
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str] = None) -> str:
+    if (filename or "").lower().endswith(".csv") or (content_type or "").startswith("text/csv"):
+        return "csv"
+    return "ndjson"
+
+
+def parse_rows(file: IO[bytes], format: str) -> Iterator[Optional[dict]]:
+    """Yield one dict per data row; None stands in for an NDJSON line that is not a JSON object."""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    if format == "csv":
+        for row in csv.DictReader(text):
+            # Empty CSV cells mean "not given", so optional fields keep their defaults.
+            yield {key: value for key, value in row.items() if value != ""}
+        return
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+def import_rows(db: Session, kind: str, rows, chunk_size: int = 1000, upsert: bool = False) -> schemas.ImportReport:
+    model, schema, natural_key, tag = IMPORTS[kind]
+    report = schemas.ImportReport(inserted=0, updated=0, failed=0, errors=[])
+    numbered = enumerate(rows, 1)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return report
+        valid = {}
+        for number, row in chunk:
+            try:
+                if row is None:
+                    raise ValueError("Row is not a JSON object")
+                data = schema.model_validate(row).model_dump()
+            except (ValidationError, ValueError) as exc:
+                report.failed += 1
+                report.errors.append(schemas.ImportRowError(row=number, error=str(exc)))
+                continue
+            if upsert:
+                # A key repeated inside the chunk keeps its last row.
+                valid[tuple(data[column] for column in natural_key)] = data
+            else:
+                valid[number] = data
+        _write_chunk(db, model, natural_key, tag, valid, upsert, report)
+
+
+def _write_chunk(db: Session, model, natural_key, tag: str, valid: dict, upsert: bool, report):
+    updates = []
+    if upsert and valid:
+        key_columns = [getattr(model, column) for column in natural_key]
+        existing = db.execute(
+            select(model.id, *key_columns).where(tuple_(*key_columns).in_(list(valid)))
+        )
+        for row in existing:
+            data = valid.pop(tuple(row[1:]), None)
+            if data is not None:
+                updates.append({"id": row.id, **data})
+    if valid:
+        inserted = db.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True), list(valid.values())
+        ).scalars()
+        changes.record(db, tag, "created", zip(inserted, valid.values()))
+    if updates:
+        db.execute(update(model), updates)
+        changes.record(db, tag, "updated", (
+            (row["id"], {key: value for key, value in row.items() if key != "id"}) for row in updates
+        ))
+    invalidate_on_commit(db, f"{tag}s", *(f"{tag}:{row['id']}" for row in updates))
+    db.commit()
+    report.inserted += len(valid)
+    report.updated += len(updates)
@@ -0,0 +1,182 @@
+"""Read-through cache for the item and customer read endpoints.
+
+Entries hold the serialized JSON body of a response together with its ETag,
+so a hit costs neither a query nor serialization and conditional requests can
+be answered with 304 Not Modified. Every entry is tagged with what it depends
+on: "item:<id>"/"customer:<id>" for each row it contains, and "items" or
+"customers" for entries whose membership depends on the whole table (list
+pages and searches).
+
+crud's mutators call invalidate_on_commit() with the tags they affect. The
+tags are held on the Session and invalidated only once the transaction has
+committed, so a rolled-back write invalidates nothing. A reader that loaded
+from the database while an invalidation happened does not store its (possibly
+stale) result.
+
+All of this is per process: writes made by other processes (another uvicorn
+worker, manage.py) invalidate nothing here, and entries they change are only
+refreshed once their TTL runs out. The cache is therefore off unless
+OMS_CATALOG_CACHE is set.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from settings import get_settings
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    body: bytes
+    etag: str
+    tags: FrozenSet[str]
+    headers: Dict[str, str] = field(default_factory=dict)
+    expires_at: float = 0.0
+
+
+def make_entry(body: bytes, tags, headers: Optional[Dict[str, str]] = None) -> CacheEntry:
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return CacheEntry(body=body, etag=etag, tags=frozenset(tags), headers=dict(headers or {}))
+
+
+class CatalogCache:
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        # None takes the value from the settings (OMS_CATALOG_CACHE*) on
+        # first use, so creating the cache reads no configuration.
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self._tagged: Dict[str, set] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is None:
+            settings = get_settings()
+            self._max_entries = settings.catalog_cache_size if settings.catalog_cache else 0
+        return self._max_entries
+
+    @max_entries.setter
+    def max_entries(self, value: int):
+        self._max_entries = value
+
+    @property
+    def ttl(self) -> float:
+        if self._ttl is None:
+            self._ttl = get_settings().catalog_cache_ttl
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, value: float):
+        self._ttl = value
+
+    def get_or_load(self, key, loader) -> Optional[CacheEntry]:
+        """Return the cached entry for key, or call loader() -> CacheEntry|None and cache its result."""
+        entry, generation = self._lookup(key)
+        if entry is None:
+            entry = loader()
+            self._store(key, entry, generation)
+        return entry
+
+    async def get_or_load_async(self, key, loader) -> Optional[CacheEntry]:
+        """get_or_load for a loader coroutine function."""
+        entry, generation = self._lookup(key)
+        if entry is None:
+            entry = await loader()
+            self._store(key, entry, generation)
+        return entry
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for tag in tags:
+                for key in self._tagged.pop(tag, ()):
+                    self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tagged.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+            }
+
+    def _lookup(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, self._generation
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None, self._generation
+
+    def _store(self, key, entry: Optional[CacheEntry], generation: int):
+        if entry is None or self.max_entries <= 0:
+            return
+        entry = CacheEntry(entry.body, entry.etag, entry.tags, entry.headers, time.monotonic() + self.ttl)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            for tag in entry.tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, old = self._entries.popitem(last=False)
+                for tag in old.tags:
+                    keys = self._tagged.get(tag)
+                    if keys is not None:
+                        keys.discard(evicted)
+                        if not keys:
+                            del self._tagged[tag]
+
+
+catalog = CatalogCache()
+
+
+def invalidate_on_commit(db: Session, *tags):
+    """Invalidate `tags` once db's current transaction commits."""
+    db.info.setdefault("cache_tags", set()).update(tags)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    tags = session.info.pop("cache_tags", None)
+    if not tags:
+        return
+    # Sessions joined to an outer transaction (the write queue) only commit
+    # a savepoint here; their owner invalidates after the real commit.
+    deferred = session.info.get("deferred_cache_tags")
+    if deferred is not None:
+        deferred.update(tags)
+    else:
+        catalog.invalidate(*tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("cache_tags", None)
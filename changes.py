@@ -0,0 +1,268 @@
+"""Change feed: an append-only log of every mutation.
+
+Each crud mutation calls ``record`` for the rows it changed, so the entries
+are written in the same transaction as the change and a rolled-back write
+leaves none. An entry names the entity ("order", "item", "customer" or
+"reorder_log"), its id, the action ("created", "updated" or "deleted") and,
+in ``data``, the values the change set: the whole row for creates and
+updates through the API, only the new ``in_stock`` for the stock an order
+takes, only the new status of a reorder. The stats tables and idempotency
+keys are derived from these rows and are not logged.
+
+Consumers follow the log by id. ``GET /changes?after=<id>`` returns the
+entries after that cursor with the cursor to pass next, and with ``wait``
+holds the request open until something commits (long-poll);
+``GET /changes/stream`` sends the same entries as Server-Sent Events and
+resumes from Last-Event-ID. Waiters are woken through ``feed`` by the commits
+of this process, and look at the table every POLL_INTERVAL seconds anyway for
+writes made by other processes.
+
+Entries older than OMS_CHANGE_RETENTION_HOURS are deleted by ``prune``, which
+a background Sweeper runs every OMS_CHANGE_PRUNE_INTERVAL seconds and
+``python manage.py prune-changes`` runs on demand. A cursor older than the
+oldest entry kept gets 410 Gone: the consumer has missed changes and has to
+re-read the lists before it follows the feed again.
+"""
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import database, models
+from idempotency import Sweeper
+from settings import get_settings
+
+# Seconds between looks at the table while waiting, for commits made by
+# other processes, which do not wake this one.
+POLL_INTERVAL = 1.0
+# A stream with nothing to send for this many seconds sends a comment, so
+# proxies do not close it as idle.
+HEARTBEAT_INTERVAL = 15.0
+
+_COLUMNS = (
+    models.ChangeLog.id,
+    models.ChangeLog.entity,
+    models.ChangeLog.entity_id,
+    models.ChangeLog.action,
+    models.ChangeLog.data,
+    models.ChangeLog.created_at,
+)
+
+
+def _now() -> datetime:
+    # Stored as naive UTC, like the other timestamps.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def record(db, entity: str, action: str, changes: Iterable[Tuple[int, Optional[dict]]]):
+    """Log `action` on each (entity_id, data) pair in db's current transaction."""
+    rows = [
+        {
+            "entity": entity,
+            "entity_id": entity_id,
+            "action": action,
+            "data": None if data is None else orjson.dumps(data).decode(),
+        }
+        for entity_id, data in changes
+    ]
+    if rows:
+        db.execute(insert(models.ChangeLog), rows)
+        db.info.setdefault("changes", set()).add(entity)
+
+
+def _check_cursor(db, after: int):
+    # prune always keeps the newest entry, so the oldest id kept tells
+    # whether anything after the cursor is gone.
+    oldest = db.scalar(select(func.min(models.ChangeLog.id)))
+    if oldest is not None and after < oldest - 1:
+        latest = db.scalar(select(func.max(models.ChangeLog.id)))
+        raise HTTPException(
+            status_code=410,
+            detail={
+                "message": f"Changes after {after} are no longer kept. Re-read the lists, then follow the feed from after={latest}.",
+                "latest": latest,
+            },
+        )
+
+
+def page(db, after: int, limit: int = 100, entity: Optional[str] = None, check: bool = False):
+    """Up to `limit` entries after the cursor, oldest first, as Core rows.
+
+    With `check`, a cursor older than the log kept is refused with 410.
+    """
+    if check and after > 0:
+        _check_cursor(db, after)
+    statement = select(*_COLUMNS).where(models.ChangeLog.id > after)
+    if entity is not None:
+        statement = statement.where(models.ChangeLog.entity == entity)
+    return db.execute(statement.order_by(models.ChangeLog.id).limit(limit)).all()
+
+
+# Each read opens its own short session, so a consumer waiting between reads
+# holds no connection and no snapshot.
+def read(bind, after: int, limit: int = 100, entity: Optional[str] = None, check: bool = False):
+    with Session(bind=bind) as db:
+        return page(db, after, limit, entity, check)
+
+
+async def read_async(bind, after: int, limit: int = 100, entity: Optional[str] = None, check: bool = False):
+    async with AsyncSession(bind) as db:
+        return await db.run_sync(page, after, limit, entity, check)
+
+
+def _entry(row) -> dict:
+    return {
+        "id": row.id,
+        "entity": row.entity,
+        "entity_id": row.entity_id,
+        "action": row.action,
+        "data": None if row.data is None else orjson.loads(row.data),
+        "created_at": row.created_at,
+    }
+
+
+def encode_page(rows, after: int) -> bytes:
+    return orjson.dumps({"changes": [_entry(row) for row in rows], "next_after": rows[-1].id if rows else after})
+
+
+def encode_events(rows) -> bytes:
+    return b"".join(
+        b"id: %d\nevent: %s.%s\ndata: %s\n\n" % (row.id, row.entity.encode(), row.action.encode(), orjson.dumps(_entry(row)))
+        for row in rows
+    )
+
+
+class ChangeFeed:
+    """Wakes the requests waiting for changes once a transaction that recorded some commits."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = set()
+
+    def subscribe(self) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._waiters.add(future)
+        return future
+
+    def unsubscribe(self, future: asyncio.Future):
+        with self._lock:
+            self._waiters.discard(future)
+
+    def notify(self):
+        """Wake every waiter; safe to call from any thread."""
+        with self._lock:
+            waiters, self._waiters = self._waiters, set()
+        for future in waiters:
+            try:
+                future.get_loop().call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # Its event loop has closed, and nobody is waiting any more.
+                pass
+
+    async def wait_for(self, read, timeout: float):
+        """Await read() until it returns entries or `timeout` seconds have
+        passed, and return its last result."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # Subscribed before reading, so a commit between the read and
+            # the wait is not missed.
+            woken = self.subscribe()
+            try:
+                rows = await read()
+                remaining = deadline - loop.time()
+                if rows or remaining <= 0:
+                    return rows
+                await asyncio.wait({woken}, timeout=min(remaining, POLL_INTERVAL))
+            finally:
+                self.unsubscribe(woken)
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+feed = ChangeFeed()
+
+
+async def events(read, after: int, first=()):
+    """Server-Sent Events for the entries after `after`, starting with the
+    already read `first`, until the client goes away."""
+    rows = first
+    while True:
+        if rows:
+            yield encode_events(rows)
+            after = rows[-1].id
+        else:
+            yield b": keepalive\n\n"
+        rows = await feed.wait_for(lambda: read(after), HEARTBEAT_INTERVAL)
+
+
+def committed():
+    """Called once changes have committed: wake the waiters and make sure the pruner runs."""
+    feed.notify()
+    get_pruner()
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_committed(session):
+    entities = session.info.pop("changes", None)
+    if not entities:
+        return
+    # Sessions joined to an outer transaction (the write queue) only commit
+    # a savepoint here; their owner notifies after the real commit.
+    deferred = session.info.get("deferred_changes")
+    if deferred is not None:
+        deferred.update(entities)
+    else:
+        committed()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("changes", None)
+
+
+def prune(db, batch_size: int = 1000) -> int:
+    """Delete entries older than the retention period, committing every
+    batch_size rows, and return how many went. The newest entry is always
+    kept, so the oldest id left still shows which cursors are covered."""
+    newest = db.scalar(select(func.max(models.ChangeLog.id)))
+    if newest is None:
+        return 0
+    cutoff = _now() - timedelta(hours=get_settings().change_retention_hours)
+    removed = 0
+    while True:
+        expired = (
+            select(models.ChangeLog.id)
+            .where(models.ChangeLog.created_at < cutoff, models.ChangeLog.id < newest)
+            .limit(batch_size)
+        )
+        result = db.execute(delete(models.ChangeLog).where(models.ChangeLog.id.in_(expired)))
+        db.commit()
+        removed += result.rowcount
+        if result.rowcount < batch_size:
+            return removed
+
+
+_pruner = None
+_pruner_lock = threading.Lock()
+
+
+def get_pruner() -> Optional[Sweeper]:
+    """The process-wide pruner, started with the first committed change, or None when disabled."""
+    global _pruner
+    settings = get_settings()
+    if _pruner is None and settings.change_prune_interval > 0:
+        with _pruner_lock:
+            if _pruner is None:
+                _pruner = Sweeper(database.engine, settings.change_prune_interval, prune, "oms-change-log-pruner")
+    return _pruner
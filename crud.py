@@ -1,15 +1,103 @@
 
-from sqlalchemy.orm import Session
-import models, schemas
+from datetime import datetime, timezone
+from typing import List, Optional
 
-# List all orders
-def get_orders(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.ItemOrder).offset(skip).limit(limit).all()
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.orm import Session, selectinload, undefer
+import archive, changes, metrics, models, reorders, schemas, stats
+from cache import invalidate_on_commit
+
+def _page(query, id_column, skip: int, limit: int, after_id: Optional[int]):
+    # Offset paging makes SQLite walk and discard `skip` rows, so deep pages
+    # get slower as the table grows. With `after_id` the query seeks straight
+    # to the next primary key instead.
+    if after_id is not None:
+        return query.filter(id_column > after_id).order_by(id_column).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+
+def _rows(db, model, columns, conditions, skip: int, limit: int, after_id: Optional[int], order_by=()):
+    # Core counterpart of _page for the lean list responses: plain rows of
+    # just `columns`, without building ORM objects or an identity map.
+    statement = select(*columns).where(*conditions)
+    if after_id is not None:
+        statement = statement.where(model.id > after_id).order_by(model.id)
+    else:
+        statement = statement.order_by(*order_by).offset(skip)
+    rows = db.execute(statement.limit(limit)).all()
+    # No ORM load events fire for these, so they are counted here.
+    metrics.count_rows(len(rows))
+    return rows
+
+def _archived_columns(source, model, columns):
+    # The same columns of a hot-and-archive subquery; all of the model's when
+    # none are given. Labelled so the row keys are plain str for orjson.
+    return [source[column.key].label(column.key) for column in (columns or model.__table__.columns)]
+
+def next_cursor(rows, limit: int):
+    """Return the `after_id` for the page following `rows`, or None on the last page."""
+    if limit > 0 and len(rows) == limit:
+        return rows[-1].id
+    return None
+
+def as_utc(value: datetime) -> datetime:
+    # created_at is stored as naive UTC (SQLite's CURRENT_TIMESTAMP), so
+    # offset-aware bounds are converted before they are compared as text.
+    # Every from/to filter on a timestamp goes through this (export.py and
+    # the archive --before cutoff in manage.py too).
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+# List all orders, optionally for one customer and/or item and within a
+# [created_from, created_to) window. Each filter is served by an index on
+# item_orders: (customer_id, id), (item_id, id) or (created_at). Like the
+# other list getters, it returns plain rows of `columns` instead of ORM
+# objects when they are given. With include_archive it reads the archived
+# orders too (archive.py), always as rows.
+def get_orders(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    item_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    columns=None,
+    include_archive: bool = False,
+):
+    orders = models.ItemOrder
+    if include_archive:
+        orders = archive.all_orders().c
+        columns = _archived_columns(orders, models.ItemOrder, columns)
+    conditions = []
+    if customer_id is not None:
+        conditions.append(orders.customer_id == customer_id)
+    if item_id is not None:
+        conditions.append(orders.item_id == item_id)
+    if created_from is not None:
+        conditions.append(orders.created_at >= as_utc(created_from))
+    if created_to is not None:
+        conditions.append(orders.created_at < as_utc(created_to))
+    if columns is not None:
+        # Offset pages of the union need an explicit order; the hot table's scan is already in id order.
+        order_by = (orders.id,) if include_archive else ()
+        return _rows(db, orders, columns, conditions, skip, limit, after_id, order_by)
+    return _page(db.query(models.ItemOrder).filter(*conditions), models.ItemOrder.id, skip, limit, after_id)
 
 # Delete customer
 def delete_customer(db: Session, customer_id: int):
     db_customer = db.query(models.Customer).filter(models.Customer.id == customer_id).first()
     if db_customer:
+        # The customer's orders are detached from it, which changes how they
+        # appear inside their items too.
+        invalidate_on_commit(
+            db, "customers", f"customer:{customer_id}", *(f"item:{order.item_id}" for order in db_customer.orders)
+        )
+        stats.forget_customers(db, [customer_id])
+        archive.detach(db, "customer_id", [customer_id])
+        changes.record(db, "customer", "deleted", [(customer_id, None)])
+        changes.record(db, "order", "updated", ((order.id, {"customer_id": None}) for order in db_customer.orders))
         db.delete(db_customer)
         db.commit()
         return db_customer
@@ -19,6 +107,9 @@ def delete_customer(db: Session, customer_id: int):
 def delete_order(db: Session, order_id: int):
     db_order = db.query(models.ItemOrder).filter(models.ItemOrder.id == order_id).first()
     if db_order:
+        invalidate_on_commit(db, f"item:{db_order.item_id}", f"customer:{db_order.customer_id}")
+        stats.apply_orders(db, [order_id], sign=-1)
+        changes.record(db, "order", "deleted", [(order_id, None)])
         db.delete(db_order)
         db.commit()
         return db_order
@@ -28,26 +119,153 @@ def delete_order(db: Session, order_id: int):
 def delete_reorder_log(db: Session, log_id: int):
     db_log = db.query(models.ItemReorderLog).filter(models.ItemReorderLog.id == log_id).first()
     if db_log:
+        invalidate_on_commit(db, f"item:{db_log.item_id}")
+        changes.record(db, "reorder_log", "deleted", [(log_id, None)])
         db.delete(db_log)
         db.commit()
         return db_log
     return None
 
+# Set-based deletes. The rows a schemas.BulkDelete selects are deleted one
+# chunk of ids at a time: a few DELETE/UPDATE ... WHERE id IN statements per
+# chunk carry the same bookkeeping as the single-row deletes above (stats,
+# orders and reorder logs, archived ones too, detached from their item or
+# customer, cache tags, change feed), and each chunk commits on its own so a
+# large delete never holds the write lock for its whole length. A failure
+# keeps the chunks already committed.
+def _delete_orders(db, ids):
+    stats.apply_orders(db, ids, sign=-1)
+    deleted = db.execute(
+        delete(models.ItemOrder).where(models.ItemOrder.id.in_(ids))
+        .returning(models.ItemOrder.item_id, models.ItemOrder.customer_id)
+    ).all()
+    invalidate_on_commit(db, *(f"item:{row.item_id}" for row in deleted), *(f"customer:{row.customer_id}" for row in deleted))
+    changes.record(db, "order", "deleted", ((order_id, None) for order_id in ids))
+
+def _detach(db, model, column: str, ids, *returning):
+    # Point the rows referring to the deleted ids at nothing, as the ORM does
+    # for a single delete, and return them.
+    return db.execute(
+        update(model).where(getattr(model, column).in_(ids)).values({column: None})
+        .returning(model.id, *returning)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+def _delete_customers(db, ids):
+    orders = _detach(db, models.ItemOrder, "customer_id", ids, models.ItemOrder.item_id)
+    stats.forget_customers(db, ids)
+    archive.detach(db, "customer_id", ids)
+    db.execute(delete(models.Customer).where(models.Customer.id.in_(ids)))
+    invalidate_on_commit(db, "customers", *(f"customer:{id}" for id in ids), *(f"item:{row.item_id}" for row in orders))
+    changes.record(db, "customer", "deleted", ((customer_id, None) for customer_id in ids))
+    changes.record(db, "order", "updated", ((row.id, {"customer_id": None}) for row in orders))
 
+def _delete_items(db, ids):
+    orders = _detach(db, models.ItemOrder, "item_id", ids, models.ItemOrder.customer_id)
+    logs = _detach(db, models.ItemReorderLog, "item_id", ids)
+    stats.forget_items(db, ids)
+    archive.detach(db, "item_id", ids)
+    db.execute(delete(models.Item).where(models.Item.id.in_(ids)))
+    invalidate_on_commit(db, "items", *(f"item:{id}" for id in ids), *(f"customer:{row.customer_id}" for row in orders))
+    changes.record(db, "item", "deleted", ((item_id, None) for item_id in ids))
+    changes.record(db, "order", "updated", ((row.id, {"item_id": None}) for row in orders))
+    changes.record(db, "reorder_log", "updated", ((row.id, {"item_id": None}) for row in logs))
 
-def get_customer(db: Session, customer_id: int):
-    return db.query(models.Customer).filter(models.Customer.id == customer_id).first()
+def _delete_reorder_logs(db, ids):
+    deleted = db.execute(
+        delete(models.ItemReorderLog).where(models.ItemReorderLog.id.in_(ids)).returning(models.ItemReorderLog.item_id)
+    ).all()
+    invalidate_on_commit(db, *(f"item:{row.item_id}" for row in deleted))
+    changes.record(db, "reorder_log", "deleted", ((log_id, None) for log_id in ids))
 
-def get_customer_by_name(db: Session, name: str):
-    # Search for customers where name contains the given substring (case-insensitive)
-    return db.query(models.Customer).filter(models.Customer.name.ilike(f"%{name}%")).all()
+BULK_DELETES = {
+    "orders": (models.ItemOrder, _delete_orders),
+    "customers": (models.Customer, _delete_customers),
+    "items": (models.Item, _delete_items),
+    "reorder_logs": (models.ItemReorderLog, _delete_reorder_logs),
+}
+
+def delete_bulk(db: Session, kind: str, selection: schemas.BulkDelete, chunk_size: int = 1000) -> schemas.BulkDeleteResult:
+    model, delete_chunk = BULK_DELETES[kind]
+    conditions = []
+    if selection.ids is not None:
+        conditions.append(model.id.in_(selection.ids))
+    if selection.id_from is not None:
+        conditions.append(model.id >= selection.id_from)
+    if selection.id_to is not None:
+        conditions.append(model.id <= selection.id_to)
+    deleted = 0
+    last_id = None
+    while True:
+        chunk = select(model.id).where(*conditions).order_by(model.id).limit(chunk_size)
+        if last_id is not None:
+            chunk = chunk.where(model.id > last_id)
+        ids = db.scalars(chunk).all()
+        if not ids:
+            return schemas.BulkDeleteResult(deleted=deleted)
+        delete_chunk(db, ids)
+        db.commit()
+        deleted += len(ids)
+        last_id = ids[-1]
 
-def get_customers(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Customer).offset(skip).limit(limit).all()
+
+
+# What each embed mode loads alongside the row: "full" eager-loads the nested
+# histories with one SELECT ... IN per relationship instead of one lazy load
+# per row, "counts" undefers the relationship sizes, "none" loads the columns.
+_EMBED_OPTIONS = {
+    models.Customer: {
+        "full": [selectinload(models.Customer.orders)],
+        "counts": [undefer(models.Customer.order_count)],
+        "none": [],
+    },
+    models.Item: {
+        "full": [selectinload(models.Item.orders), selectinload(models.Item.reorder_logs)],
+        "counts": [undefer(models.Item.order_count), undefer(models.Item.reorder_log_count)],
+        "none": [],
+    },
+}
+
+def _embedded(db: Session, model, embed: str):
+    return db.query(model).options(*_EMBED_OPTIONS[model][embed])
+
+def _search(db: Session, model, query: str, limit: int, match: str, embed: str):
+    # "ranked" looks the query up in the trigram FTS index over the searchable
+    # columns and orders by bm25 with the name weighted highest. Trigrams need
+    # at least three characters, so shorter queries, SQLite builds without
+    # FTS5 and match="substring" use the original case-insensitive substring
+    # filter on the name column.
+    if match == "ranked" and len(query) >= 3 and models.SEARCH_INDEX_AVAILABLE:
+        fts, columns = models.SEARCH_INDEXES[model.__tablename__]
+        weights = ", ".join(["10.0"] + ["1.0"] * (len(columns) - 1))
+        ids = db.execute(
+            text(f"select rowid from {fts} where {fts} match :query order by bm25({fts}, {weights}) limit :limit"),
+            {"query": '"' + query.replace('"', '""') + '"', "limit": limit},
+        ).scalars().all()
+        if not ids:
+            return []
+        rows = {row.id: row for row in _embedded(db, model, embed).filter(model.id.in_(ids))}
+        return [rows[id] for id in ids if id in rows]
+    return _embedded(db, model, embed).filter(model.name.ilike(f"%{query}%")).limit(limit).all()
+
+def get_customer(db: Session, customer_id: int, embed: str = "full"):
+    return _embedded(db, models.Customer, embed).filter(models.Customer.id == customer_id).first()
+
+def get_customer_by_name(db: Session, name: str, limit: int = 100, match: str = "ranked", embed: str = "full"):
+    # Search customer names and addresses through the FTS index, best match first
+    return _search(db, models.Customer, name, limit, match, embed)
+
+def get_customers(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, embed: str = "full", columns=None):
+    if columns is not None:
+        return _rows(db, models.Customer, columns, [], skip, limit, after_id)
+    return _page(_embedded(db, models.Customer, embed), models.Customer.id, skip, limit, after_id)
 
 def create_customer(db: Session, customer: schemas.CustomerCreate):
     db_customer = models.Customer(**customer.model_dump())
     db.add(db_customer)
+    invalidate_on_commit(db, "customers")
+    db.flush()
+    changes.record(db, "customer", "created", [(db_customer.id, customer.model_dump())])
     db.commit()
     db.refresh(db_customer)
     return db_customer
@@ -57,23 +275,30 @@ def update_customer(db: Session, customer_id: int, customer: schemas.CustomerCre
     if db_customer:
         for key, value in customer.model_dump().items():
             setattr(db_customer, key, value)
+        invalidate_on_commit(db, "customers", f"customer:{customer_id}")
+        changes.record(db, "customer", "updated", [(customer_id, customer.model_dump())])
         db.commit()
         db.refresh(db_customer)
     return db_customer
 
-def get_item(db: Session, item_id: int):
-    return db.query(models.Item).filter(models.Item.id == item_id).first()
+def get_item(db: Session, item_id: int, embed: str = "full"):
+    return _embedded(db, models.Item, embed).filter(models.Item.id == item_id).first()
 
-def get_item_by_name(db: Session, name: str):
-    # Search for items where name contains the given substring (case-insensitive)
-    return db.query(models.Item).filter(models.Item.name.ilike(f"%{name}%")).all()
+def get_item_by_name(db: Session, name: str, limit: int = 100, match: str = "ranked", embed: str = "full"):
+    # Search item names, descriptions and manufacturers through the FTS index, best match first
+    return _search(db, models.Item, name, limit, match, embed)
 
-def get_items(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Item).offset(skip).limit(limit).all()
+def get_items(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, embed: str = "full", columns=None):
+    if columns is not None:
+        return _rows(db, models.Item, columns, [], skip, limit, after_id)
+    return _page(_embedded(db, models.Item, embed), models.Item.id, skip, limit, after_id)
 
 def create_item(db: Session, item: schemas.ItemCreate):
     db_item = models.Item(**item.model_dump())
     db.add(db_item)
+    invalidate_on_commit(db, "items")
+    db.flush()
+    changes.record(db, "item", "created", [(db_item.id, item.model_dump())])
     db.commit()
     db.refresh(db_item)
     return db_item
@@ -83,6 +308,15 @@ def update_item(db: Session, item_id: int, item: schemas.ItemCreate):
     if db_item:
         for key, value in item.model_dump().items():
             setattr(db_item, key, value)
+        invalidate_on_commit(db, "items", f"item:{item_id}")
+        changes.record(db, "item", "updated", [(item_id, item.model_dump())])
+        db.flush()
+        # A restock resolves the item's pending reorder; a stock correction
+        # below the threshold opens one.
+        if item.in_stock >= item.reorder_quantity:
+            reorders.resolve_reorders(db, item_id)
+        else:
+            reorders.request_reorders(db, [item_id])
         db.commit()
         db.refresh(db_item)
     return db_item
@@ -91,15 +325,39 @@ def update_item(db: Session, item_id: int, item: schemas.ItemCreate):
 def delete_item(db: Session, item_id: int):
     db_item = db.query(models.Item).filter(models.Item.id == item_id).first()
     if db_item:
+        invalidate_on_commit(
+            db, "items", f"item:{item_id}", *(f"customer:{order.customer_id}" for order in db_item.orders)
+        )
+        stats.forget_items(db, [item_id])
+        archive.detach(db, "item_id", [item_id])
+        # Its orders and reorder logs are detached from it, not deleted.
+        changes.record(db, "item", "deleted", [(item_id, None)])
+        changes.record(db, "order", "updated", ((order.id, {"item_id": None}) for order in db_item.orders))
+        changes.record(db, "reorder_log", "updated", ((log.id, {"item_id": None}) for log in db_item.reorder_logs))
         db.delete(db_item)
         db.commit()
         return db_item
     return None
 
+def _decrement_stock(db, item_id, quantity):
+    return db.execute(
+        update(models.Item)
+        .where(models.Item.id == item_id, models.Item.in_stock >= quantity)
+        .values(in_stock=models.Item.in_stock - quantity)
+        .returning(models.Item.in_stock, models.Item.reorder_quantity)
+    ).first()
+
 def create_order(db: Session, order: schemas.ItemOrderCreate):
     """
     Create an order for an item if sufficient stock is available.
 
+    The stock reservation is a single guarded UPDATE, so concurrent orders for
+    the same item can never oversell: the row only matches while enough stock
+    is left, and the RETURNING clause hands back the post-decrement stock so
+    the reorder check runs in the same transaction without a second read.
+    The order's totals are added to the stats tables in that transaction too,
+    and the order and the item's new stock are logged to the change feed.
+
     Args:
         db (Session): The database session.
         order (schemas.ItemOrderCreate): The order details.
@@ -108,18 +366,177 @@ def create_order(db: Session, order: schemas.ItemOrderCreate):
         models.ItemOrder: The created ItemOrder instance if successful.
         None: If the order could not be created due to insufficient stock or item not found.
     """
-    db_item = db.query(models.Item).filter(models.Item.id == order.item_id).first()
-    if db_item and db_item.in_stock >= order.order_quantity and (db_item.in_stock - order.order_quantity) >= 0:
-        db_order = models.ItemOrder(**order.model_dump())
-        db_item.in_stock -= order.order_quantity
-        if db_item.in_stock < db_item.reorder_quantity:
-            db_reorder_log = models.ItemReorderLog(item_id=order.item_id)
-            db.add(db_reorder_log)
-        db.add(db_order)
-        db.commit()
-        db.refresh(db_order)
-        return db_order
-    return None
+    reserved = _decrement_stock(db, order.item_id, order.order_quantity)
+    if reserved is None:
+        db.rollback()
+        return None
+    db_order = models.ItemOrder(**order.model_dump())
+    invalidate_on_commit(db, f"item:{order.item_id}", f"customer:{order.customer_id}")
+    if reserved.in_stock < reserved.reorder_quantity:
+        reorders.request_reorders(db, [order.item_id])
+    db.add(db_order)
+    db.flush()
+    stats.apply_orders(db, [db_order.id])
+    changes.record(db, "order", "created", [(db_order.id, order.model_dump())])
+    changes.record(db, "item", "updated", [(order.item_id, {"in_stock": reserved.in_stock})])
+    db.commit()
+    db.refresh(db_order)
+    return db_order
+
+def get_reorder_logs(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    status: Optional[str] = None,
+    columns=None,
+    include_archive: bool = False,
+):
+    logs = models.ItemReorderLog
+    if include_archive:
+        logs = archive.all_reorder_logs().c
+        columns = _archived_columns(logs, models.ItemReorderLog, columns)
+    conditions = [] if status is None else [logs.status == status]
+    if columns is not None:
+        order_by = (logs.id,) if include_archive else ()
+        return _rows(db, logs, columns, conditions, skip, limit, after_id, order_by)
+    return _page(db.query(models.ItemReorderLog).filter(*conditions), models.ItemReorderLog.id, skip, limit, after_id)
+
+# Acknowledge or resolve a reorder log. Returns None if it does not exist;
+# otherwise the log, still in its old status if the move was not allowed.
+def set_reorder_status(db: Session, log_id: int, status: str):
+    db_log = reorders.set_status(db, log_id, status)
+    db.commit()
+    return db_log
+
+# Items under their reorder threshold, largest shortfall first, read from the
+# expression index on in_stock - reorder_quantity.
+def get_low_stock_items(db: Session, skip: int = 0, limit: int = 100, columns=None):
+    if columns is not None:
+        return _rows(
+            db, models.Item, columns, [models.STOCK_SHORTFALL < 0], skip, limit, None,
+            order_by=(models.STOCK_SHORTFALL, models.Item.id),
+        )
+    return (
+        db.query(models.Item)
+        .filter(models.STOCK_SHORTFALL < 0)
+        .order_by(models.STOCK_SHORTFALL, models.Item.id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+def create_orders_bulk(db: Session, orders: List[schemas.ItemOrderCreate], all_or_nothing: bool = True):
+    """
+    Create several orders in a single transaction.
+
+    All referenced items are loaded with one query, every line is checked
+    against the running stock of its item, and the accepted lines are written
+    with one guarded UPDATE per item plus bulk INSERTs for the orders and
+    for the pending reorders of items left under their threshold.
+
+    Args:
+        db (Session): The database session.
+        orders (List[schemas.ItemOrderCreate]): The order lines, in request order.
+        all_or_nothing (bool): When True, a single rejected line rejects the whole batch.
+
+    Returns:
+        List[schemas.ItemOrderLineResult]: One result per input line, in the same order.
+    """
+    item_ids = {order.item_id for order in orders}
+    stock = {
+        row.id: row.in_stock
+        for row in db.execute(
+            select(models.Item.id, models.Item.in_stock).where(models.Item.id.in_(item_ids))
+        )
+    }
+    errors = _plan_order_lines(orders, stock)
+    low_stock = set()
+    if not (all_or_nothing and any(errors)):
+        low_stock = _reserve_order_lines(db, orders, errors)
+
+    if all_or_nothing and any(errors):
+        db.rollback()
+        return [
+            schemas.ItemOrderLineResult(index=index, accepted=False, detail=error or "Batch rejected by another line")
+            for index, error in enumerate(errors)
+        ]
+
+    accepted = [index for index, error in enumerate(errors) if error is None]
+    inserted = []
+    if accepted:
+        inserted = db.execute(
+            insert(models.ItemOrder).returning(
+                models.ItemOrder.id, models.ItemOrder.created_at, sort_by_parameter_order=True
+            ),
+            [orders[index].model_dump() for index in accepted],
+        ).all()
+        stats.apply_orders(db, [row.id for row in inserted])
+        changes.record(db, "order", "created", ((row.id, orders[index].model_dump()) for index, row in zip(accepted, inserted)))
+        reorders.request_reorders(db, low_stock)
+        invalidate_on_commit(
+            db,
+            *(f"item:{orders[index].item_id}" for index in accepted),
+            *(f"customer:{orders[index].customer_id}" for index in accepted),
+        )
+    db.commit()
+
+    results = [
+        schemas.ItemOrderLineResult(index=index, accepted=False, detail=error)
+        for index, error in enumerate(errors)
+    ]
+    for index, row in zip(accepted, inserted):
+        results[index] = schemas.ItemOrderLineResult(
+            index=index,
+            accepted=True,
+            order=schemas.ItemOrder(id=row.id, created_at=row.created_at, **orders[index].model_dump()),
+        )
+    return results
+
+def _plan_order_lines(orders, stock):
+    # Walk the lines in order against a running copy of the stock and return
+    # the rejection reason for each line, or None when the line fits.
+    remaining = dict(stock)
+    errors = []
+    for order in orders:
+        if order.item_id not in remaining:
+            errors.append("Item not found")
+        elif order.order_quantity > remaining[order.item_id]:
+            errors.append("Order quantity exceeds available stock")
+        else:
+            remaining[order.item_id] -= order.order_quantity
+            errors.append(None)
+    return errors
 
-def get_reorder_logs(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.ItemReorderLog).offset(skip).limit(limit).all()
+def _reserve_order_lines(db, orders, errors):
+    # Apply one guarded decrement per item for the accepted lines, log the
+    # new stock levels and return the ids of the items left under their
+    # reorder threshold.
+    # If an item's stock moved after it was read, the failed UPDATE has
+    # already taken SQLite's write lock, so the item is re-read and its lines
+    # planned again against stock nobody else can change until we commit.
+    totals = {}
+    for order, error in zip(orders, errors):
+        if error is None:
+            totals[order.item_id] = totals.get(order.item_id, 0) + order.order_quantity
+    low_stock = set()
+    stock_left = {}
+    for item_id, quantity in totals.items():
+        row = _decrement_stock(db, item_id, quantity)
+        if row is None:
+            current = db.scalar(select(models.Item.in_stock).where(models.Item.id == item_id))
+            lines = [index for index, order in enumerate(orders) if order.item_id == item_id]
+            replanned = _plan_order_lines(
+                [orders[index] for index in lines], {} if current is None else {item_id: current}
+            )
+            for index, error in zip(lines, replanned):
+                errors[index] = error
+            quantity = sum(orders[index].order_quantity for index in lines if errors[index] is None)
+            if quantity == 0:
+                continue
+            row = _decrement_stock(db, item_id, quantity)
+        stock_left[item_id] = row.in_stock
+        if row.in_stock < row.reorder_quantity:
+            low_stock.add(item_id)
+    changes.record(db, "item", "updated", ((item_id, {"in_stock": in_stock}) for item_id, in_stock in stock_left.items()))
+    return low_stock
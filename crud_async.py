@@ -0,0 +1,89 @@
+"""Async counterparts of the functions in crud.py.
+
+Each coroutine runs the sync implementation against the AsyncSession with
+``run_sync``, so the query logic lives in one place while the I/O goes through
+aiosqlite on the event loop instead of occupying a threadpool thread. Lazy
+loads cannot happen once control is back on the event loop, so functions
+whose results are not fully loaded (freshly written or deleted rows) convert
+them to their response schema inside ``run_sync`` and return that instead.
+"""
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud, schemas
+from responses import validated
+
+async def get_orders(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, **filters):
+    return await db.run_sync(crud.get_orders, skip=skip, limit=limit, after_id=after_id, **filters)
+
+async def delete_customer(db: AsyncSession, customer_id: int):
+    return await db.run_sync(validated(crud.delete_customer, schemas.Customer), customer_id)
+
+async def delete_order(db: AsyncSession, order_id: int):
+    return await db.run_sync(validated(crud.delete_order, schemas.ItemOrder), order_id)
+
+async def delete_reorder_log(db: AsyncSession, log_id: int):
+    return await db.run_sync(validated(crud.delete_reorder_log, schemas.ItemReorderLog), log_id)
+
+async def delete_bulk(db: AsyncSession, kind: str, selection: schemas.BulkDelete, chunk_size: int = 1000):
+    return await db.run_sync(crud.delete_bulk, kind, selection, chunk_size=chunk_size)
+
+async def get_customer(db: AsyncSession, customer_id: int, embed: str = "full"):
+    return await db.run_sync(crud.get_customer, customer_id, embed=embed)
+
+async def get_customer_by_name(db: AsyncSession, name: str, limit: int = 100, match: str = "ranked", embed: str = "full"):
+    return await db.run_sync(crud.get_customer_by_name, name, limit=limit, match=match, embed=embed)
+
+async def get_customers(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, embed: str = "full", columns=None):
+    return await db.run_sync(crud.get_customers, skip=skip, limit=limit, after_id=after_id, embed=embed, columns=columns)
+
+async def create_customer(db: AsyncSession, customer: schemas.CustomerCreate):
+    return await db.run_sync(validated(crud.create_customer, schemas.Customer), customer)
+
+async def update_customer(db: AsyncSession, customer_id: int, customer: schemas.CustomerCreate):
+    return await db.run_sync(validated(crud.update_customer, schemas.Customer), customer_id, customer)
+
+async def get_item(db: AsyncSession, item_id: int, embed: str = "full"):
+    return await db.run_sync(crud.get_item, item_id, embed=embed)
+
+async def get_item_by_name(db: AsyncSession, name: str, limit: int = 100, match: str = "ranked", embed: str = "full"):
+    return await db.run_sync(crud.get_item_by_name, name, limit=limit, match=match, embed=embed)
+
+async def get_items(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, embed: str = "full", columns=None):
+    return await db.run_sync(crud.get_items, skip=skip, limit=limit, after_id=after_id, embed=embed, columns=columns)
+
+async def create_item(db: AsyncSession, item: schemas.ItemCreate):
+    return await db.run_sync(validated(crud.create_item, schemas.Item), item)
+
+async def update_item(db: AsyncSession, item_id: int, item: schemas.ItemCreate):
+    return await db.run_sync(validated(crud.update_item, schemas.Item), item_id, item)
+
+async def delete_item(db: AsyncSession, item_id: int):
+    return await db.run_sync(validated(crud.delete_item, schemas.Item), item_id)
+
+async def create_order(db: AsyncSession, order: schemas.ItemOrderCreate):
+    return await db.run_sync(validated(crud.create_order, schemas.ItemOrder), order)
+
+async def create_orders_bulk(db: AsyncSession, orders: List[schemas.ItemOrderCreate], all_or_nothing: bool = True):
+    return await db.run_sync(crud.create_orders_bulk, orders, all_or_nothing=all_or_nothing)
+
+async def get_reorder_logs(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    status: Optional[str] = None,
+    columns=None,
+    include_archive: bool = False,
+):
+    return await db.run_sync(
+        crud.get_reorder_logs, skip=skip, limit=limit, after_id=after_id, status=status, columns=columns,
+        include_archive=include_archive,
+    )
+
+async def set_reorder_status(db: AsyncSession, log_id: int, status: str):
+    return await db.run_sync(validated(crud.set_reorder_status, schemas.ItemReorderLog), log_id, status)
+
+async def get_low_stock_items(db: AsyncSession, skip: int = 0, limit: int = 100, columns=None):
+    return await db.run_sync(crud.get_low_stock_items, skip=skip, limit=limit, columns=columns)
@@ -1,13 +1,145 @@
+import threading
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./order_management.db"
+import metrics
+from settings import Settings, get_settings
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Methods served from the read-only session factories.
+READ_METHODS = {"GET", "HEAD"}
 
 Base = declarative_base()
+
+# Storage profile. "tuned" runs every connection in WAL mode, where readers
+# work from a snapshot and never wait for the writer (nor it for them), and
+# gives reads and writes separate engines and pools: reads get a wide pool
+# of query_only connections, writes a small one, since SQLite admits a
+# single writer at a time anyway. "default" keeps SQLite's own settings
+# (rollback journal, full sync) and one shared engine.
+#
+# The engines are built from the settings on first use (get_engines), not on
+# import, so create_app(settings) can still choose them. The names below
+# stay readable as module attributes, e.g. database.engine.
+ENGINE_ATTRIBUTES = {
+    "SQLALCHEMY_DATABASE_URL",
+    "ASYNC_SQLALCHEMY_DATABASE_URL",
+    "TUNED",
+    "engine",
+    "read_engine",
+    "SessionLocal",
+    "ReadSessionLocal",
+    "async_engine",
+    "async_read_engine",
+    "AsyncSessionLocal",
+    "AsyncReadSessionLocal",
+}
+
+
+def _pragmas(settings: Settings, file_database: bool, read_only: bool):
+    pragmas = [
+        f"busy_timeout = {settings.sqlite_busy_timeout_ms}",
+        f"synchronous = {settings.sqlite_synchronous}",
+        f"mmap_size = {settings.sqlite_mmap_size}",
+        # Negative sizes are KiB rather than pages.
+        f"cache_size = -{settings.sqlite_cache_size_kb}",
+    ]
+    if file_database:
+        pragmas.insert(0, "journal_mode = WAL")
+    if read_only:
+        pragmas.append("query_only = ON")
+    return pragmas
+
+
+def _apply_pragmas(engine, pragmas):
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def _pool_options(settings: Settings, file_database: bool, pool_size: int):
+    # SQLite memory databases use a single-connection pool that takes no sizing.
+    if not file_database:
+        return {}
+    return {"pool_size": pool_size, "max_overflow": settings.pool_overflow, "pool_timeout": settings.pool_timeout}
+
+
+def _engines(settings: Settings, url, make_engine, **options):
+    if settings.storage_profile != "tuned":
+        engine = make_engine(url, **options)
+        return engine, engine
+    file_database = make_url(url).database not in (None, "", ":memory:")
+    write_engine = make_engine(url, **options, **_pool_options(settings, file_database, settings.write_pool_size))
+    read_engine = make_engine(url, **options, **_pool_options(settings, file_database, settings.read_pool_size))
+    for target, read_only in ((write_engine, False), (read_engine, True)):
+        _apply_pragmas(getattr(target, "sync_engine", target), _pragmas(settings, file_database, read_only))
+    return write_engine, read_engine
+
+
+def attach_archive(engine, path: str, wal: bool = False):
+    """ATTACH the archive file (archive.py) to every new connection of `engine` as the "archive" schema."""
+    @event.listens_for(getattr(engine, "sync_engine", engine), "connect")
+    def _connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("ATTACH DATABASE ? AS archive", (path,))
+        if wal:
+            cursor.execute("PRAGMA archive.journal_mode = WAL")
+        cursor.close()
+
+
+class Engines:
+    """The engines and session factories of one Settings."""
+
+    def __init__(self, settings: Settings):
+        self.SQLALCHEMY_DATABASE_URL = settings.database_url
+        # The same database through aiosqlite, for the async request path.
+        self.ASYNC_SQLALCHEMY_DATABASE_URL = settings.database_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+        self.TUNED = settings.storage_profile == "tuned"
+
+        self.engine, self.read_engine = _engines(
+            settings, self.SQLALCHEMY_DATABASE_URL, create_engine, connect_args={"check_same_thread": False}
+        )
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        # Sessions for GET requests; their connections refuse writes when tuned.
+        self.ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.read_engine)
+
+        self.async_engine, self.async_read_engine = _engines(settings, self.ASYNC_SQLALCHEMY_DATABASE_URL, create_async_engine)
+        self.AsyncSessionLocal = async_sessionmaker(self.async_engine, autoflush=False)
+        self.AsyncReadSessionLocal = async_sessionmaker(self.async_read_engine, autoflush=False)
+
+        if settings.archive_database:
+            for attached in {self.engine, self.read_engine, self.async_engine, self.async_read_engine}:
+                attach_archive(attached, settings.archive_database, wal=self.TUNED)
+
+        if settings.metrics:
+            for instrumented in {
+                self.engine, self.read_engine, self.async_engine.sync_engine, self.async_read_engine.sync_engine
+            }:
+                metrics.instrument(instrumented, settings.slow_query_ms)
+            metrics.count_loads(Base)
+
+
+_engines_built = None
+_engines_lock = threading.Lock()
+
+
+def get_engines() -> Engines:
+    """The process-wide engines, built from get_settings() on first use."""
+    global _engines_built
+    if _engines_built is None:
+        with _engines_lock:
+            if _engines_built is None:
+                _engines_built = Engines(get_settings())
+    return _engines_built
+
+
+def __getattr__(name):
+    if name in ENGINE_ATTRIBUTES:
+        return getattr(get_engines(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,175 @@
+"""Idempotency keys for the create endpoints.
+
+A client whose POST /orders/ times out cannot tell whether the order was
+placed. Sent with an ``Idempotency-Key`` header, the retry is safe: the first
+request to succeed stores its response under the key, in the same transaction
+as the row it created, and every later request with that key gets the stored
+response back (marked ``Idempotent-Replayed: true``) without running crud.
+
+``write_queue.write`` runs the mutation through ``once`` on a Session joined
+by savepoint to a ``BEGIN IMMEDIATE`` transaction (a batch of the write
+coalescer, or one of its own), so the key is checked again under the write
+lock and of two concurrent requests with the same key only one creates
+anything. A key reused with another endpoint or body is refused with 422.
+Requests that fail, such as an order over the available stock, change
+nothing and store nothing, so they can be retried with the same key.
+
+Keys are replayed for OMS_IDEMPOTENCY_TTL_HOURS. Expired keys are ignored
+straight away and deleted by ``sweep``, which a background Sweeper runs every
+OMS_IDEMPOTENCY_SWEEP_INTERVAL seconds and ``python manage.py
+sweep-idempotency-keys`` runs on demand.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Optional
+
+from fastapi import Header, HTTPException, Response
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import database, models
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Route parameter for the header; fastapi-mcp exposes it as a tool argument too.
+IdempotencyKeyHeader = Annotated[
+    Optional[str],
+    Header(
+        alias="Idempotency-Key",
+        max_length=255,
+        description="Unique key for this request; a retry with the same key returns the original response instead of creating again.",
+    ),
+]
+
+
+def _now() -> datetime:
+    # Stored as naive UTC, like the other timestamps.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _fingerprint(operation, args) -> str:
+    body = json.dumps([arg.model_dump(mode="json") for arg in args], sort_keys=True)
+    return hashlib.sha256(f"{operation.__name__}:{body}".encode()).hexdigest()
+
+
+def _stored(db, key: str):
+    return db.execute(
+        select(models.IdempotencyKey.fingerprint, models.IdempotencyKey.status_code, models.IdempotencyKey.body)
+        .where(models.IdempotencyKey.key == key, models.IdempotencyKey.expires_at > _now())
+    ).first()
+
+
+def _replay(stored, fingerprint: str) -> Response:
+    if stored.fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return Response(
+        content=stored.body, status_code=stored.status_code, media_type="application/json", headers={REPLAYED_HEADER: "true"}
+    )
+
+
+def lookup(db, key: str, operation, args) -> Optional[Response]:
+    """The stored response for `key`, or None if there is no live one.
+
+    Ends db's read transaction either way, so the write transaction that
+    follows on another connection is not held up by it.
+    """
+    stored = _stored(db, key)
+    db.rollback()
+    return None if stored is None else _replay(stored, _fingerprint(operation, args))
+
+
+def once(key: str, operation, schema):
+    """Wrap a crud mutation so it runs at most once per key.
+
+    The wrapper returns the stored response when the key is already taken,
+    otherwise the mutation's result serialized as `schema` (or None if it
+    returned None), after storing it under the key. Call it on a Session
+    joined to an outer transaction, which then commits the mutation and the
+    key together.
+    """
+    def call(db, *args):
+        fingerprint = _fingerprint(operation, args)
+        stored = _stored(db, key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+        result = operation(db, *args)
+        if result is None:
+            return None
+        body = schema.model_validate(result).model_dump_json().encode()
+        now = _now()
+        values = {
+            "operation": operation.__name__,
+            "fingerprint": fingerprint,
+            "status_code": 200,
+            "body": body,
+            "created_at": now,
+            "expires_at": now + timedelta(hours=get_settings().idempotency_ttl_hours),
+        }
+        statement = insert(models.IdempotencyKey).values(key=key, **values)
+        # An expired key that was not swept yet is taken over.
+        db.execute(statement.on_conflict_do_update(index_elements=[models.IdempotencyKey.key], set_=values))
+        db.commit()
+        get_sweeper()
+        return Response(content=body, media_type="application/json")
+    return call
+
+
+def sweep(db, batch_size: int = 1000) -> int:
+    """Delete expired keys, committing every batch_size rows, and return how many went."""
+    removed = 0
+    while True:
+        expired = select(models.IdempotencyKey.key).where(models.IdempotencyKey.expires_at <= _now()).limit(batch_size)
+        result = db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.key.in_(expired)))
+        db.commit()
+        removed += result.rowcount
+        if result.rowcount < batch_size:
+            return removed
+
+
+class Sweeper:
+    """Run ``task(db)`` on a fresh Session every `interval` seconds on a daemon thread.
+
+    Also used for the change log's retention (changes.prune)."""
+
+    def __init__(self, bind, interval: float, task=sweep, name: str = "oms-idempotency-sweeper"):
+        self._bind = bind
+        self._interval = interval
+        self._task = task
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopping.wait(self._interval):
+            try:
+                with Session(bind=self._bind) as db:
+                    self._task(db)
+            except Exception:
+                # Whatever is left is swept on the next round.
+                logger.exception("%s failed", self._thread.name)
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def get_sweeper() -> Optional[Sweeper]:
+    """The process-wide sweeper, started with the first stored key, or None when disabled."""
+    global _sweeper
+    settings = get_settings()
+    if _sweeper is None and settings.idempotency_sweep_interval > 0:
+        with _sweeper_lock:
+            if _sweeper is None:
+                _sweeper = Sweeper(database.engine, settings.idempotency_sweep_interval)
+    return _sweeper
@@ -1,33 +1,68 @@
-from fastapi import Depends, FastAPI, HTTPException
-from sqlalchemy.orm import Session
-import crud, models, schemas
-from database import SessionLocal, engine
-from fastapi_mcp import FastApiMCP
-from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Optional
 
-models.Base.metadata.create_all(bind=engine)
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+import archive, async_routes, bulk_import, changes, crud, database, metrics, models, schemas, stats
+from cache import catalog
+from database import READ_METHODS
+from idempotency import IdempotencyKeyHeader
+from responses import (
+    Fields, batch_report, cached_response, changes_response, changes_stream_response, customer_entry,
+    customer_search_entry, customers_entry, export_response, item_entry, item_search_entry, items_entry,
+    lean_columns, next_cursor_headers, parse_fields, rows_response,
+)
+from settings import Settings, get_settings, use_settings
+from write_queue import WriteCoalescer, get_write_coalescer, write
 
-load_dotenv()
-app = FastAPI()
+router = APIRouter()
 
 
 
-# Dependency
-def get_db():
-    db = SessionLocal()
+# Dependency: GET requests get a read-only session, everything else a
+# read-write one.
+def get_db(request: Request):
+    db = database.ReadSessionLocal() if request.method in READ_METHODS else database.SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
 # List all orders endpoint
-@app.get("/orders/", response_model=list[schemas.ItemOrder], operation_id="read_orders", summary="Retrieve a list of all orders.")
-def read_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    orders = crud.get_orders(db, skip=skip, limit=limit)
-    return orders
+@router.get("/orders/", response_model=list[schemas.ItemOrder], operation_id="read_orders", summary="Retrieve a list of orders, optionally for one customer or item and within a from/to time window.")
+def read_orders(
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    item_id: Optional[int] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    fields: Fields = None,
+    include_archive: bool = False,
+    db: Session = Depends(get_db),
+):
+    if include_archive and not archive.attached(db):
+        raise HTTPException(status_code=400, detail="No archive database is configured (OMS_ARCHIVE_DATABASE)")
+    orders = crud.get_orders(
+        db,
+        skip=skip,
+        limit=limit,
+        after_id=after_id,
+        customer_id=customer_id,
+        item_id=item_id,
+        created_from=created_from,
+        created_to=created_to,
+        include_archive=include_archive,
+        columns=lean_columns(models.ItemOrder, parse_fields(models.ItemOrder, fields)),
+    )
+    return rows_response(orders, next_cursor_headers(orders, limit, after_id))
 
 # Delete customer endpoint
-@app.delete("/customers/{customer_id}", response_model=schemas.Customer, operation_id="delete_customer", summary="Delete a customer by their unique ID.")
+@router.delete("/customers/{customer_id}", response_model=schemas.Customer, operation_id="delete_customer", summary="Delete a customer by their unique ID.")
 def delete_customer(customer_id: int, db: Session = Depends(get_db)):
     db_customer = crud.delete_customer(db, customer_id)
     if db_customer is None:
@@ -35,7 +70,7 @@ def delete_customer(customer_id: int, db: Session = Depends(get_db)):
     return db_customer
 
 # Delete order endpoint
-@app.delete("/orders/{order_id}", response_model=schemas.ItemOrder, operation_id="delete_order", summary="Delete an order by its unique ID.")
+@router.delete("/orders/{order_id}", response_model=schemas.ItemOrder, operation_id="delete_order", summary="Delete an order by its unique ID.")
 def delete_order(order_id: int, db: Session = Depends(get_db)):
     db_order = crud.delete_order(db, order_id)
     if db_order is None:
@@ -43,97 +78,313 @@ def delete_order(order_id: int, db: Session = Depends(get_db)):
     return db_order
 
 # Delete reorder log endpoint
-@app.delete("/reorder_logs/{log_id}", response_model=schemas.ItemReorderLog, operation_id="delete_reorder_log", summary="Delete a reorder log by its unique ID.")
+@router.delete("/reorder_logs/{log_id}", response_model=schemas.ItemReorderLog, operation_id="delete_reorder_log", summary="Delete a reorder log by its unique ID.")
 def delete_reorder_log(log_id: int, db: Session = Depends(get_db)):
     db_log = crud.delete_reorder_log(db, log_id)
     if db_log is None:
         raise HTTPException(status_code=404, detail="Reorder log not found")
     return db_log
 
-@app.post("/customers/", response_model=schemas.Customer, operation_id="create_customer", summary="Create a new customer.")
-def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
-    return crud.create_customer(db=db, customer=customer)
+# Bulk delete endpoints (crud.delete_bulk)
+@router.post("/orders/bulk_delete", response_model=schemas.BulkDeleteResult, operation_id="delete_orders_bulk", summary="Delete the orders with the given ids and/or in an id range, with set-based statements.")
+def delete_orders_bulk(selection: schemas.BulkDelete, db: Session = Depends(get_db)):
+    return crud.delete_bulk(db, "orders", selection)
+
+@router.post("/customers/bulk_delete", response_model=schemas.BulkDeleteResult, operation_id="delete_customers_bulk", summary="Delete the customers with the given ids and/or in an id range; their orders are kept, detached from them.")
+def delete_customers_bulk(selection: schemas.BulkDelete, db: Session = Depends(get_db)):
+    return crud.delete_bulk(db, "customers", selection)
+
+@router.post("/items/bulk_delete", response_model=schemas.BulkDeleteResult, operation_id="delete_items_bulk", summary="Delete the items with the given ids and/or in an id range; their orders and reorder logs are kept, detached from them.")
+def delete_items_bulk(selection: schemas.BulkDelete, db: Session = Depends(get_db)):
+    return crud.delete_bulk(db, "items", selection)
+
+@router.post("/reorder_logs/bulk_delete", response_model=schemas.BulkDeleteResult, operation_id="delete_reorder_logs_bulk", summary="Delete the reorder logs with the given ids and/or in an id range, with set-based statements.")
+def delete_reorder_logs_bulk(selection: schemas.BulkDelete, db: Session = Depends(get_db)):
+    return crud.delete_bulk(db, "reorder_logs", selection)
+
+@router.post("/customers/", response_model=schemas.Customer, operation_id="create_customer", summary="Create a new customer.")
+def create_customer(customer: schemas.CustomerCreate, idempotency_key: IdempotencyKeyHeader = None, db: Session = Depends(get_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    return write(db, writes, crud.create_customer, schemas.Customer, customer, idempotency_key=idempotency_key)
 
-@app.post("/items/", response_model=schemas.Item, operation_id="create_item", summary="Create a new item.")
-def create_item(item: schemas.ItemCreate, db: Session = Depends(get_db)):
-    return crud.create_item(db=db, item=item)
+@router.post("/items/", response_model=schemas.Item, operation_id="create_item", summary="Create a new item.")
+def create_item(item: schemas.ItemCreate, idempotency_key: IdempotencyKeyHeader = None, db: Session = Depends(get_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    return write(db, writes, crud.create_item, schemas.Item, item, idempotency_key=idempotency_key)
 
-@app.put("/customers/{customer_id}", response_model=schemas.Customer, operation_id="update_customer", summary="Update an existing customer by ID.")
-def update_customer(customer_id: int, customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
-    db_customer = crud.update_customer(db, customer_id, customer)
+@router.put("/customers/{customer_id}", response_model=schemas.Customer, operation_id="update_customer", summary="Update an existing customer by ID.")
+def update_customer(customer_id: int, customer: schemas.CustomerCreate, db: Session = Depends(get_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    db_customer = write(db, writes, crud.update_customer, schemas.Customer, customer_id, customer)
     if db_customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
     return db_customer
 
-@app.get("/customers/", response_model=list[schemas.Customer], operation_id="read_customers", summary="Retrieve a list of all customers. Do not use this when searching by customer name. For searching by name use read_customer_by_name.")
-def read_customers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    customers = crud.get_customers(db, skip=skip, limit=limit)
-    return customers
+@router.get("/customers/", response_model=list[schemas.Customer], operation_id="read_customers", summary="Retrieve a list of all customers. Do not use this when searching by customer name. For searching by name use read_customer_by_name.")
+def read_customers(request: Request, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, embed: schemas.EmbedMode = "full", fields: Fields = None, db: Session = Depends(get_db)):
+    field_names = parse_fields(models.Customer, fields)
+    entry = catalog.get_or_load(("read_customers", skip, limit, after_id, embed, field_names), lambda: customers_entry(db, skip, limit, after_id, embed, field_names))
+    return cached_response(request, entry)
 
-@app.get("/customers/{customer_id}", response_model=schemas.Customer, operation_id="read_customer", summary="Retrieve a customer by their unique ID.")
-def read_customer(customer_id: int, db: Session = Depends(get_db)):
-    db_customer = crud.get_customer(db, customer_id=customer_id)
-    if db_customer is None:
+@router.get("/customers/{customer_id}", response_model=schemas.Customer, operation_id="read_customer", summary="Retrieve a customer by their unique ID.")
+def read_customer(request: Request, customer_id: int, embed: schemas.EmbedMode = "full", db: Session = Depends(get_db)):
+    entry = catalog.get_or_load(("read_customer", customer_id, embed), lambda: customer_entry(db, customer_id, embed))
+    if entry is None:
         raise HTTPException(status_code=404, detail="Customer not found")
-    return db_customer
+    return cached_response(request, entry)
 
-@app.get("/customers/by_name/{name}", response_model=list[schemas.Customer], operation_id="read_customer_by_name", summary="Retrieve customers by partial name match.")
-def read_customer_by_name(name: str, db: Session = Depends(get_db)):
-    db_customers = crud.get_customer_by_name(db, name=name)
-    if not db_customers:
+@router.get("/customers/by_name/{name}", response_model=list[schemas.Customer], operation_id="read_customer_by_name", summary="Search customers by name or address, best match first. Use match=substring for a plain partial name match.")
+def read_customer_by_name(request: Request, name: str, limit: int = 100, match: schemas.SearchMode = "ranked", embed: schemas.EmbedMode = "full", db: Session = Depends(get_db)):
+    entry = catalog.get_or_load(("read_customer_by_name", name, limit, match, embed), lambda: customer_search_entry(db, name, limit, match, embed))
+    if entry is None:
         raise HTTPException(status_code=404, detail="No customers found")
-    return db_customers
+    return cached_response(request, entry)
 
 
 
-@app.put("/items/{item_id}", response_model=schemas.Item, operation_id="update_item", summary="Update an existing item by ID.")
-def update_item(item_id: int, item: schemas.ItemCreate, db: Session = Depends(get_db)):
-    db_item = crud.update_item(db, item_id, item)
+@router.put("/items/{item_id}", response_model=schemas.Item, operation_id="update_item", summary="Update an existing item by ID.")
+def update_item(item_id: int, item: schemas.ItemCreate, db: Session = Depends(get_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    db_item = write(db, writes, crud.update_item, schemas.Item, item_id, item)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
     return db_item
 
-@app.get("/items/", response_model=list[schemas.Item], operation_id="read_items", summary="Retrieve a list of all items. Do not use this when searching by item name. For searching by name use read_item_by_name.")
-def read_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    items = crud.get_items(db, skip=skip, limit=limit)
-    return items
+@router.get("/items/", response_model=list[schemas.Item], operation_id="read_items", summary="Retrieve a list of all items. Do not use this when searching by item name. For searching by name use read_item_by_name.")
+def read_items(request: Request, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, embed: schemas.EmbedMode = "full", fields: Fields = None, db: Session = Depends(get_db)):
+    field_names = parse_fields(models.Item, fields)
+    entry = catalog.get_or_load(("read_items", skip, limit, after_id, embed, field_names), lambda: items_entry(db, skip, limit, after_id, embed, field_names))
+    return cached_response(request, entry)
 
-@app.get("/items/{item_id}", response_model=schemas.Item, operation_id="read_item", summary="Retrieve an item by its unique ID.")
-def read_item(item_id: int, db: Session = Depends(get_db)):
-    db_item = crud.get_item(db, item_id=item_id)
-    if db_item is None:
+# Declared before /items/{item_id} so "low_stock" is not parsed as an id.
+@router.get("/items/low_stock", response_model=list[schemas.ItemSummary], operation_id="read_low_stock_items", summary="Items whose stock is under their reorder quantity, largest shortfall first.")
+def read_low_stock_items(skip: int = 0, limit: int = 100, fields: Fields = None, db: Session = Depends(get_db)):
+    columns = lean_columns(models.Item, parse_fields(models.Item, fields))
+    return rows_response(crud.get_low_stock_items(db, skip=skip, limit=limit, columns=columns))
+
+@router.get("/items/{item_id}", response_model=schemas.Item, operation_id="read_item", summary="Retrieve an item by its unique ID.")
+def read_item(request: Request, item_id: int, embed: schemas.EmbedMode = "full", db: Session = Depends(get_db)):
+    entry = catalog.get_or_load(("read_item", item_id, embed), lambda: item_entry(db, item_id, embed))
+    if entry is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    return db_item
+    return cached_response(request, entry)
 
-@app.get("/items/by_name/{name}", response_model=list[schemas.Item], operation_id="read_item_by_name", summary="Retrieve items by partial name match.")
-def read_item_by_name(name: str, db: Session = Depends(get_db)):
-    db_items = crud.get_item_by_name(db, name=name)
-    if not db_items:
+@router.get("/items/by_name/{name}", response_model=list[schemas.Item], operation_id="read_item_by_name", summary="Search items by name, description or manufacturer, best match first. Use match=substring for a plain partial name match.")
+def read_item_by_name(request: Request, name: str, limit: int = 100, match: schemas.SearchMode = "ranked", embed: schemas.EmbedMode = "full", db: Session = Depends(get_db)):
+    entry = catalog.get_or_load(("read_item_by_name", name, limit, match, embed), lambda: item_search_entry(db, name, limit, match, embed))
+    if entry is None:
         raise HTTPException(status_code=404, detail="No items found")
-    return db_items
+    return cached_response(request, entry)
 
 # Delete item endpoint
-@app.delete("/items/{item_id}", response_model=schemas.Item, operation_id="delete_item", summary="Delete an item by its unique ID.")
+@router.delete("/items/{item_id}", response_model=schemas.Item, operation_id="delete_item", summary="Delete an item by its unique ID.")
 def delete_item(item_id: int, db: Session = Depends(get_db)):
     db_item = crud.delete_item(db, item_id)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
     return db_item
 
-@app.post("/orders/", response_model=schemas.ItemOrder, operation_id="create_order", summary="Create a new order for an item if sufficient stock is available.")
-def create_order(order: schemas.ItemOrderCreate, db: Session = Depends(get_db)):
-    db_order = crud.create_order(db, order)
+@router.post("/orders/", response_model=schemas.ItemOrder, operation_id="create_order", summary="Create a new order for an item if sufficient stock is available.")
+def create_order(order: schemas.ItemOrderCreate, idempotency_key: IdempotencyKeyHeader = None, db: Session = Depends(get_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    db_order = write(db, writes, crud.create_order, schemas.ItemOrder, order, idempotency_key=idempotency_key)
     if db_order is None:
         raise HTTPException(status_code=400, detail="Order quantity exceeds available stock")
     return db_order
 
-@app.get("/reorder_logs/", response_model=list[schemas.ItemReorderLog], operation_id="read_reorder_logs", summary="Retrieve a list of reorder logs for items.")
-def read_reorder_logs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    reorder_logs = crud.get_reorder_logs(db, skip=skip, limit=limit)
-    return reorder_logs
+@router.post("/orders/batch", response_model=schemas.ItemOrderBatchResult, operation_id="create_orders_batch", summary="Create several orders in one transaction, either all-or-nothing or accepting the lines that fit.")
+def create_orders_batch(batch: schemas.ItemOrderBatchCreate, db: Session = Depends(get_db)):
+    results = crud.create_orders_bulk(db, batch.orders, all_or_nothing=batch.all_or_nothing)
+    return batch_report(results, batch.all_or_nothing)
+
+@router.post("/items/import", response_model=schemas.ImportReport, operation_id="import_items", summary="Bulk import items from a CSV or NDJSON file, optionally updating existing items matched by name and manufacturer.")
+def import_items(file: UploadFile, upsert: bool = False, chunk_size: int = Query(1000, ge=1, le=10000), db: Session = Depends(get_db)):
+    rows = bulk_import.parse_rows(file.file, bulk_import.detect_format(file.filename, file.content_type))
+    return bulk_import.import_rows(db, "items", rows, chunk_size=chunk_size, upsert=upsert)
+
+@router.post("/customers/import", response_model=schemas.ImportReport, operation_id="import_customers", summary="Bulk import customers from a CSV or NDJSON file, optionally updating existing customers matched by name and zip code.")
+def import_customers(file: UploadFile, upsert: bool = False, chunk_size: int = Query(1000, ge=1, le=10000), db: Session = Depends(get_db)):
+    rows = bulk_import.parse_rows(file.file, bulk_import.detect_format(file.filename, file.content_type))
+    return bulk_import.import_rows(db, "customers", rows, chunk_size=chunk_size, upsert=upsert)
+
+@router.get("/export/orders", response_class=StreamingResponse, operation_id="export_orders", summary="Stream orders as NDJSON or CSV, optionally after since_id and within a from/to time window.")
+def export_orders(
+    format: schemas.ExportFormat = "ndjson",
+    since_id: Optional[int] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+):
+    return export_response(db.get_bind(), "orders", format, since_id=since_id, created_from=created_from, created_to=created_to)
+
+@router.get("/export/customers", response_class=StreamingResponse, operation_id="export_customers", summary="Stream every customer (or those after since_id) as NDJSON or CSV.")
+def export_customers(format: schemas.ExportFormat = "ndjson", since_id: Optional[int] = None, db: Session = Depends(get_db)):
+    return export_response(db.get_bind(), "customers", format, since_id=since_id)
+
+@router.get("/export/reorder_logs", response_class=StreamingResponse, operation_id="export_reorder_logs", summary="Stream reorder logs as NDJSON or CSV, optionally after since_id and within a from/to time window.")
+def export_reorder_logs(
+    format: schemas.ExportFormat = "ndjson",
+    since_id: Optional[int] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+):
+    return export_response(db.get_bind(), "reorder_logs", format, since_id=since_id, created_from=created_from, created_to=created_to)
+
+# Change feed (changes.py). The handlers are async so that a consumer
+# waiting for changes holds no threadpool thread; each read opens its own
+# short session on the request's engine.
+def _change_reader(db: Session, limit: int, entity: Optional[str]):
+    bind = db.get_bind()
+    return lambda after, check=False: run_in_threadpool(changes.read, bind, after, limit, entity, check)
+
+@router.get("/changes", response_model=schemas.ChangePage, operation_id="read_changes", summary="Changes committed after the `after` cursor, oldest first. With wait, the request is held open up to that many seconds until there are some.")
+async def read_changes(
+    after: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    entity: Optional[schemas.ChangeEntity] = None,
+    wait: float = Query(0, ge=0, le=60),
+    db: Session = Depends(get_db),
+):
+    return await changes_response(_change_reader(db, limit, entity), after, wait)
+
+@router.get("/changes/stream", response_class=StreamingResponse, operation_id="stream_changes", summary="Server-Sent Events for every change committed after the `after` cursor or the Last-Event-ID header.")
+async def stream_changes(
+    after: int = 0,
+    entity: Optional[schemas.ChangeEntity] = None,
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+    db: Session = Depends(get_db),
+):
+    return await changes_stream_response(_change_reader(db, 100, entity), after if last_event_id is None else last_event_id)
+
+# Stats endpoints. /stats/items/top is declared before /stats/items/{item_id}
+# so "top" is not parsed as an id.
+@router.get("/stats/items/top", response_model=list[schemas.ItemSales], operation_id="read_top_items", summary="Items with the most units sold.")
+def read_top_items(limit: int = Query(10, ge=1, le=1000), db: Session = Depends(get_db)):
+    return stats.top_items(db, limit)
+
+@router.get("/stats/items/{item_id}", response_model=schemas.ItemSales, operation_id="read_item_stats", summary="Order count and units sold of an item.")
+def read_item_stats(item_id: int, db: Session = Depends(get_db)):
+    item_stats = stats.item_stats(db, item_id)
+    if item_stats is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return item_stats
+
+@router.get("/stats/customers/top", response_model=list[schemas.CustomerSales], operation_id="read_top_customers", summary="Customers with the most units ordered.")
+def read_top_customers(limit: int = Query(10, ge=1, le=1000), db: Session = Depends(get_db)):
+    return stats.top_customers(db, limit)
+
+@router.get("/stats/customers/{customer_id}", response_model=schemas.CustomerSales, operation_id="read_customer_stats", summary="Order count and units ordered of a customer.")
+def read_customer_stats(customer_id: int, db: Session = Depends(get_db)):
+    customer_stats = stats.customer_stats(db, customer_id)
+    if customer_stats is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return customer_stats
+
+@router.get("/stats/daily", response_model=list[schemas.DailyOrderVolume], operation_id="read_daily_order_volume", summary="Orders and units per UTC day, optionally within a from/to date range.")
+def read_daily_order_volume(
+    day_from: Optional[date] = Query(None, alias="from"),
+    day_to: Optional[date] = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+):
+    return stats.daily_volume(db, day_from, day_to)
+
+@router.get("/cache/stats", response_model=schemas.CacheStats, operation_id="read_cache_stats", summary="Hit and miss counters of the item and customer read cache.")
+def read_cache_stats():
+    return catalog.stats()
+
+@router.get("/reorder_logs/", response_model=list[schemas.ItemReorderLog], operation_id="read_reorder_logs", summary="Retrieve a list of reorder logs for items, optionally only those with a given status.")
+def read_reorder_logs(
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    status: Optional[schemas.ReorderStatus] = None,
+    fields: Fields = None,
+    include_archive: bool = False,
+    db: Session = Depends(get_db),
+):
+    if include_archive and not archive.attached(db):
+        raise HTTPException(status_code=400, detail="No archive database is configured (OMS_ARCHIVE_DATABASE)")
+    reorder_logs = crud.get_reorder_logs(
+        db,
+        skip=skip,
+        limit=limit,
+        after_id=after_id,
+        status=status,
+        include_archive=include_archive,
+        columns=lean_columns(models.ItemReorderLog, parse_fields(models.ItemReorderLog, fields)),
+    )
+    return rows_response(reorder_logs, next_cursor_headers(reorder_logs, limit, after_id))
+
+@router.post("/reorder_logs/{log_id}/acknowledge", response_model=schemas.ItemReorderLog, operation_id="acknowledge_reorder_log", summary="Mark an open reorder as acknowledged.")
+def acknowledge_reorder_log(log_id: int, db: Session = Depends(get_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    db_log = write(db, writes, crud.set_reorder_status, schemas.ItemReorderLog, log_id, "acknowledged")
+    if db_log is None:
+        raise HTTPException(status_code=404, detail="Reorder log not found")
+    if db_log.status != "acknowledged":
+        raise HTTPException(status_code=409, detail=f"Reorder log is {db_log.status}")
+    return db_log
+
+@router.post("/reorder_logs/{log_id}/resolve", response_model=schemas.ItemReorderLog, operation_id="resolve_reorder_log", summary="Mark a pending reorder as resolved.")
+def resolve_reorder_log(log_id: int, db: Session = Depends(get_db), writes: Optional[WriteCoalescer] = Depends(get_write_coalescer)):
+    db_log = write(db, writes, crud.set_reorder_status, schemas.ItemReorderLog, log_id, "resolved")
+    if db_log is None:
+        raise HTTPException(status_code=404, detail="Reorder log not found")
+    if db_log.status != "resolved":
+        raise HTTPException(status_code=409, detail=f"Reorder log is {db_log.status}")
+    return db_log
+
+async def read_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+MCP_OPERATIONS = ['create_order','read_customers','read_items','create_customer','read_item_by_name','read_orders']
+MCP_DESCRIPTION = "This is VIJAY NATESAN's Order Management System. When someone searches a prodct by name, always use read_item_by_name"
+
+def mount_mcp(app: FastAPI, settings: Settings):
+    """Build the MCP server from app's routes and mount it at /mcp."""
+    # Imported here rather than at the top: fastapi-mcp and the MCP SDK take
+    # longer to import than the whole rest of the app.
+    from fastapi_mcp import FastApiMCP
+    from mcp_tools import InProcessMCP
+
+    # In-process tools call crud directly and return compact pages (mcp_tools.py);
+    # otherwise fastapi-mcp replays every tool call as an HTTP request.
+    if settings.mcp_in_process:
+        mcp = InProcessMCP(app, database.SessionLocal, database.ReadSessionLocal, name="VNOMS", include_operations=MCP_OPERATIONS, description=MCP_DESCRIPTION)
+    else:
+        mcp = FastApiMCP(app, name="VNOMS", include_operations=MCP_OPERATIONS, description=MCP_DESCRIPTION)
+    # What the deprecated mount() did: SSE transport at /mcp.
+    mcp.mount_sse(mount_path="/mcp")
+    return mcp
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build the API for `settings` (by default the environment's).
+
+    Given settings become the process's (settings.use_settings), so the
+    engines, the catalog cache and the background workers, all built on
+    first use, follow them too. Building the app touches neither the
+    database nor the MCP SDK. The schema is created and migrated by
+    `python manage.py init-db`, and the MCP server, when OMS_MCP is on, is
+    built and mounted as the app starts up.
+    """
+    settings = get_settings() if settings is None else use_settings(settings)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if settings.mcp and getattr(app.state, "mcp", None) is None:
+            app.state.mcp = mount_mcp(app, settings)
+        yield
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    # Both routers serve the same operations; the async one runs every handler on
+    # the event loop against the aiosqlite engine instead of in the threadpool.
+    app.include_router(async_routes.router if settings.async_handlers else router)
+    if settings.metrics:
+        app.add_middleware(metrics.MetricsMiddleware)
+        app.add_api_route("/metrics", read_metrics, include_in_schema=False)
+    return app
 
-mcp = FastApiMCP(app, name="VNOMS", 
-                 include_operations=['create_order','read_customers','read_items','create_customer','read_item_by_name','read_orders'],
-                 description="This is VIJAY NATESAN's Order Management System. When someone searches a prodct by name, always use read_item_by_name")
-mcp.mount()
-mcp.setup_server()
\ No newline at end of file
+def __getattr__(name):
+    # `uvicorn main:app` (and `from main import app`) builds the default app
+    # on first access rather than on import, which reads no configuration;
+    # `uvicorn --factory main:create_app` builds the same.
+    if name == "app":
+        globals()["app"] = app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,138 @@
+"""Command-line maintenance tasks for the order management database.
+
+    python manage.py init-db
+    python manage.py import-items catalog.csv --upsert
+    python manage.py import-customers customers.ndjson
+    python manage.py rebuild-stats [--check]
+    python manage.py sweep-idempotency-keys
+    python manage.py prune-changes
+    python manage.py archive --older-than-days 365
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import archive, bulk_import, changes, crud, database, idempotency, models, stats
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def _init_db(args):
+    start = time.perf_counter()
+    models.init_db(database.engine)
+    print(json.dumps({"seconds": round(time.perf_counter() - start, 3)}))
+    return 0
+
+
+def _import(kind: str, args):
+    models.init_db(database.engine)
+    format = args.format or bulk_import.detect_format(args.path)
+    start = time.perf_counter()
+    with open(args.path, "rb") as file, database.SessionLocal() as db:
+        report = bulk_import.import_rows(
+            db, kind, bulk_import.parse_rows(file, format), chunk_size=args.chunk_size, upsert=args.upsert
+        )
+    elapsed = time.perf_counter() - start
+    rows = report.inserted + report.updated + report.failed
+    summary = report.model_dump(exclude={"errors"})
+    summary.update(seconds=round(elapsed, 3), rows_per_second=round(rows / elapsed, 1) if elapsed else None)
+    print(json.dumps(summary))
+    for error in report.errors:
+        print(f"row {error.row}: {error.error}", file=sys.stderr)
+    return 1 if report.failed else 0
+
+
+def _rebuild_stats(args):
+    models.init_db(database.engine)
+    with database.engine.begin() as connection:
+        drift = stats.verify(connection)
+        for row in drift:
+            print(json.dumps(row), file=sys.stderr)
+        if args.check:
+            print(json.dumps({"drifted": len(drift)}))
+            return 1 if drift else 0
+        start = time.perf_counter()
+        stats.rebuild(connection)
+        remaining = stats.verify(connection)
+    print(json.dumps({"drifted": len(drift), "remaining": len(remaining), "seconds": round(time.perf_counter() - start, 3)}))
+    return 1 if remaining else 0
+
+
+def _sweep_idempotency_keys(args):
+    models.init_db(database.engine)
+    start = time.perf_counter()
+    with database.SessionLocal() as db:
+        removed = idempotency.sweep(db, batch_size=args.batch_size)
+    print(json.dumps({"removed": removed, "seconds": round(time.perf_counter() - start, 3)}))
+    return 0
+
+
+def _prune_changes(args):
+    models.init_db(database.engine)
+    start = time.perf_counter()
+    with database.SessionLocal() as db:
+        removed = changes.prune(db, batch_size=args.batch_size)
+    print(json.dumps({"removed": removed, "seconds": round(time.perf_counter() - start, 3)}))
+    return 0
+
+
+def _archive(args):
+    models.init_db(database.engine)
+    if args.before is not None:
+        cutoff = crud.as_utc(datetime.fromisoformat(args.before))
+    else:
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=args.older_than_days)
+    start = time.perf_counter()
+    with database.SessionLocal() as db:
+        if not archive.attached(db):
+            print("No archive database is configured; set OMS_ARCHIVE_DATABASE", file=sys.stderr)
+            return 2
+        moved = archive.archive_before(db, cutoff, chunk_size=args.chunk_size)
+    print(json.dumps({**moved, "before": cutoff.isoformat(), "seconds": round(time.perf_counter() - start, 3)}))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Order management maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser(
+        "init-db", help="Create or migrate the tables, indexes and search indexes; run before starting the app."
+    )
+    command.set_defaults(handler=_init_db)
+    for kind in ("items", "customers"):
+        command = commands.add_parser(f"import-{kind}", help=f"Bulk import {kind} from a CSV or NDJSON file.")
+        command.add_argument("path")
+        command.add_argument("--format", choices=["csv", "ndjson"], help="defaults to the file extension")
+        command.add_argument("--upsert", action="store_true", help="update rows whose natural key already exists")
+        command.add_argument("--chunk-size", type=_positive_int, default=1000)
+        command.set_defaults(handler=lambda args, kind=kind: _import(kind, args))
+    command = commands.add_parser("rebuild-stats", help="Recompute the order summary tables and check them.")
+    command.add_argument("--check", action="store_true", help="only report drift, do not rebuild")
+    command.set_defaults(handler=_rebuild_stats)
+    command = commands.add_parser("sweep-idempotency-keys", help="Delete expired Idempotency-Key responses.")
+    command.add_argument("--batch-size", type=int, default=1000)
+    command.set_defaults(handler=_sweep_idempotency_keys)
+    command = commands.add_parser("prune-changes", help="Delete change feed entries older than the retention period.")
+    command.add_argument("--batch-size", type=int, default=1000)
+    command.set_defaults(handler=_prune_changes)
+    command = commands.add_parser(
+        "archive", help="Move old orders and resolved reorder logs to the OMS_ARCHIVE_DATABASE file."
+    )
+    cutoff = command.add_mutually_exclusive_group(required=True)
+    cutoff.add_argument("--before", help="archive rows from before this UTC date or time (ISO 8601)")
+    cutoff.add_argument("--older-than-days", type=float)
+    command.add_argument("--chunk-size", type=_positive_int, default=5000)
+    command.set_defaults(handler=_archive)
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""In-process execution of the MCP tools, with compact results.
+
+Out of the box, fastapi-mcp runs a tool by replaying it as an HTTP request
+against the app and hands the agent the pretty-printed response body. For
+read_items and read_customers that is every row with its whole order
+history, so tool results were slow to produce and far too large for a
+model's context.
+
+InProcessMCP keeps fastapi-mcp's tool list and transports, but the tools in
+TOOLS run the crud layer directly on a threadpool thread, with no HTTP round
+trip and no response_model validation. Their results are compact JSON:
+
+    {"summary": "25 items (ids 1-25); more available, call again with after_id=25",
+     "results": [...], "next_after_id": 25}
+
+List results hold the row's own columns only, narrowed further by the tool's
+`fields` argument. They are capped at OMS_MCP_PAGE_SIZE rows and
+OMS_MCP_MAX_RESULT_BYTES bytes. Rows that do not fit are left for the next
+page, and the summary says how to fetch it. The create tools go through
+write_queue.write like their routes, so the write coalescer and
+Idempotency-Key (passed as the tool argument of that name) apply to them too.
+Failures raise the same "Error calling <tool>. Status code: ..." exception
+as fastapi-mcp's HTTP path. Tools not in TOOLS still take that path.
+
+Each call is recorded in the metrics registry under the tool name and source
+"mcp", as the HTTP-replayed calls were.
+"""
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Optional
+
+import mcp.types as types
+import orjson
+from fastapi import HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi_mcp import FastApiMCP
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+import crud, metrics, models, schemas
+from idempotency import REPLAYED_HEADER
+from responses import LEAN_SCHEMAS, lean_columns, parse_fields
+from settings import get_settings
+from write_queue import get_write_coalescer, write
+
+# Tool name -> (handler(mcp, db, arguments) -> bytes, whether it writes).
+TOOLS = {}
+
+# Room left in the byte cap for the summary and the envelope around the rows.
+_ENVELOPE_BYTES = 256
+
+
+def tool(name: str, writes: bool = False):
+    def register(handler):
+        TOOLS[name] = (handler, writes)
+        return handler
+    return register
+
+
+class _PageArguments(BaseModel):
+    # Tool schemas come from the routes, so arguments this path does not use
+    # (such as embed) are accepted and ignored.
+    model_config = ConfigDict(extra="ignore")
+
+    skip: int = 0
+    limit: Optional[int] = None
+    after_id: Optional[int] = None
+    fields: Optional[str] = None
+
+
+class _OrderPageArguments(_PageArguments):
+    customer_id: Optional[int] = None
+    item_id: Optional[int] = None
+    created_from: Optional[datetime] = Field(None, alias="from")
+    created_to: Optional[datetime] = Field(None, alias="to")
+
+
+class _SearchArguments(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    name: str
+    limit: Optional[int] = None
+    match: schemas.SearchMode = "ranked"
+    fields: Optional[str] = None
+
+
+def _validate(model, arguments: dict):
+    try:
+        return model.model_validate(arguments)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors(include_url=False, include_context=False))
+
+
+class InProcessMCP(FastApiMCP):
+    def __init__(
+        self,
+        fastapi,
+        session_factory,
+        read_session_factory=None,
+        page_size: Optional[int] = None,
+        max_result_bytes: Optional[int] = None,
+        **kwargs,
+    ):
+        settings = get_settings()
+        self._sessions = session_factory
+        self._read_sessions = read_session_factory or session_factory
+        self.page_size = page_size or settings.mcp_page_size
+        self.max_result_bytes = max_result_bytes or settings.mcp_max_result_bytes
+        super().__init__(fastapi, **kwargs)
+
+    def setup_server(self) -> None:
+        super().setup_server()
+        for mcp_tool in self.tools:
+            if mcp_tool.name in TOOLS and not TOOLS[mcp_tool.name][1]:
+                mcp_tool.description = (
+                    f"{mcp_tool.description}\n\nReturns compact JSON: a summary, at most {self.page_size} results "
+                    "holding only each row's own fields, and next_after_id to pass as after_id for the next page."
+                )
+
+    async def _execute_api_tool(self, client, tool_name, arguments, operation_map, http_request_info=None):
+        if tool_name not in TOOLS:
+            return await super()._execute_api_tool(client, tool_name, arguments, operation_map, http_request_info)
+        handler, writes = TOOLS[tool_name]
+        with metrics.track(tool_name, "mcp") if get_settings().metrics else nullcontext(metrics.Outcome()) as outcome:
+            try:
+                body = await run_in_threadpool(self._call, handler, writes, dict(arguments or {}))
+            except HTTPException as exc:
+                outcome.status = exc.status_code
+                raise Exception(
+                    f"Error calling {tool_name}. Status code: {exc.status_code}. "
+                    f"Response: {orjson.dumps({'detail': exc.detail}).decode()}"
+                ) from None
+            outcome.status = 200
+            outcome.response_bytes = len(body)
+        return [types.TextContent(type="text", text=body.decode())]
+
+    def _call(self, handler, writes: bool, arguments: dict) -> bytes:
+        with (self._sessions if writes else self._read_sessions)() as db:
+            return handler(self, db, arguments)
+
+    def limit(self, requested: Optional[int]) -> int:
+        return self.page_size if requested is None else max(1, min(requested, self.page_size))
+
+    def page(self, noun: str, rows, limit: int, paged: bool = True) -> bytes:
+        """Encode up to `limit` of `rows` (fetched with one extra, to tell
+        whether more exist) within the byte cap, with a summary of the page."""
+        more = len(rows) > limit
+        encoded = []
+        size = 0
+        for row in rows[:limit]:
+            chunk = orjson.dumps(row if isinstance(row, dict) else dict(zip(row._fields, row)))
+            if encoded and size + len(chunk) + 1 > self.max_result_bytes - _ENVELOPE_BYTES:
+                more = True
+                break
+            encoded.append(chunk)
+            size += len(chunk) + 1
+        cut = len(encoded) < min(len(rows), limit)
+        ids = [row["id"] if isinstance(row, dict) else row.id for row in rows[:len(encoded)]]
+        next_after_id = ids[-1] if more and paged and ids else None
+        summary = f"{len(ids)} {noun}"
+        if ids:
+            summary += f" (ids {ids[0]}-{ids[-1]})" if paged else f" (ids {', '.join(map(str, ids))})"
+        if next_after_id is not None:
+            summary += f"; more available, call again with after_id={next_after_id}"
+        elif more:
+            summary += "; more matches exist, narrow the query to see them"
+        if cut:
+            summary += f"; cut short to stay under {self.max_result_bytes} bytes, pass fields= to fit more per page"
+        return (
+            b'{"summary":' + orjson.dumps(summary)
+            + b',"results":[' + b",".join(encoded)
+            + b'],"next_after_id":' + orjson.dumps(next_after_id) + b"}"
+        )
+
+
+@tool("read_items")
+def _read_items(mcp: InProcessMCP, db, arguments: dict) -> bytes:
+    args = _validate(_PageArguments, arguments)
+    limit = mcp.limit(args.limit)
+    columns = lean_columns(models.Item, parse_fields(models.Item, args.fields))
+    rows = crud.get_items(db, skip=args.skip, limit=limit + 1, after_id=args.after_id, columns=columns)
+    return mcp.page("items", rows, limit)
+
+
+@tool("read_customers")
+def _read_customers(mcp: InProcessMCP, db, arguments: dict) -> bytes:
+    args = _validate(_PageArguments, arguments)
+    limit = mcp.limit(args.limit)
+    columns = lean_columns(models.Customer, parse_fields(models.Customer, args.fields))
+    rows = crud.get_customers(db, skip=args.skip, limit=limit + 1, after_id=args.after_id, columns=columns)
+    return mcp.page("customers", rows, limit)
+
+
+@tool("read_orders")
+def _read_orders(mcp: InProcessMCP, db, arguments: dict) -> bytes:
+    args = _validate(_OrderPageArguments, arguments)
+    limit = mcp.limit(args.limit)
+    rows = crud.get_orders(
+        db,
+        skip=args.skip,
+        limit=limit + 1,
+        after_id=args.after_id,
+        customer_id=args.customer_id,
+        item_id=args.item_id,
+        created_from=args.created_from,
+        created_to=args.created_to,
+        columns=lean_columns(models.ItemOrder, parse_fields(models.ItemOrder, args.fields)),
+    )
+    return mcp.page("orders", rows, limit)
+
+
+@tool("read_item_by_name")
+def _read_item_by_name(mcp: InProcessMCP, db, arguments: dict) -> bytes:
+    args = _validate(_SearchArguments, arguments)
+    limit = mcp.limit(args.limit)
+    fields = parse_fields(models.Item, args.fields) or tuple(LEAN_SCHEMAS[models.Item].model_fields)
+    items = crud.get_item_by_name(db, name=args.name, limit=limit + 1, match=args.match, embed="none")
+    if not items:
+        raise HTTPException(status_code=404, detail="No items found")
+    rows = [{name: getattr(item, name) for name in fields} for item in items]
+    return mcp.page("items", rows, limit, paged=False)
+
+
+def _create(db, arguments: dict, operation, create_schema, schema, noun: str, missing: str) -> bytes:
+    key = arguments.pop("Idempotency-Key", None)
+    payload = _validate(create_schema, arguments)
+    result = write(db, get_write_coalescer(), operation, schema, payload, idempotency_key=key)
+    if result is None:
+        raise HTTPException(status_code=400, detail=missing)
+    replayed = False
+    if isinstance(result, Response):
+        replayed = REPLAYED_HEADER in result.headers
+        row = orjson.loads(result.body)
+    else:
+        row = schema.model_validate(result).model_dump(mode="json")
+    summary = f"Created {noun} {row['id']}"
+    if replayed:
+        summary += " earlier; this call reused its Idempotency-Key and created nothing"
+    return orjson.dumps({"summary": summary, "result": row})
+
+
+@tool("create_order", writes=True)
+def _create_order(mcp: InProcessMCP, db, arguments: dict) -> bytes:
+    return _create(
+        db, arguments, crud.create_order, schemas.ItemOrderCreate, schemas.ItemOrder, "order",
+        "Order quantity exceeds available stock",
+    )
+
+
+@tool("create_customer", writes=True)
+def _create_customer(mcp: InProcessMCP, db, arguments: dict) -> bytes:
+    return _create(db, arguments, crud.create_customer, schemas.CustomerCreate, schemas.Customer, "customer", None)
@@ -0,0 +1,252 @@
+"""Per-operation request metrics, served in Prometheus text format.
+
+MetricsMiddleware times every HTTP request and, once it is routed, files the
+numbers under the route's operation_id and the caller: "mcp" for tool calls
+that fastapi-mcp replays in-process against http://apiserver, "http" for
+everything else. Tool calls that skip HTTP altogether (mcp_tools.py) are
+filed under "mcp" by ``track``. For each (operation, source) it keeps a latency histogram
+plus totals of SQL statements, SQL time, rows loaded and response bytes.
+
+The SQL and row counts come from SQLAlchemy events (``instrument`` and
+``count_loads``, attached in database.py) and, for the lean list pages that
+read plain Core rows instead of ORM instances, from ``count_rows``. They add to the RequestStats of
+the request in progress, found through a context variable. Starlette copies
+the context into the threadpool for sync handlers and streaming bodies, and
+the async path runs on the event loop, so both are attributed. Work done on
+other threads, such as the write queue and the reorder worker, is not
+attributed to any request.
+
+With a slow-query threshold, ``instrument`` also logs every statement that
+takes longer, with its bound parameters, to the "oms.slow_query" logger.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+# Request latency buckets, in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# fastapi-mcp runs tools by calling the app through an in-process transport
+# with this base URL, which is how its requests are told apart.
+MCP_HOST = b"apiserver"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+slow_query_log = logging.getLogger("oms.slow_query")
+
+
+class RequestStats:
+    __slots__ = ("statements", "sql_seconds", "rows")
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("oms_request_stats", default=None)
+
+
+class _Series:
+    __slots__ = ("buckets", "count", "seconds", "statements", "sql_seconds", "rows", "response_bytes")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.response_bytes = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._statuses = {}
+        self.slow_queries = 0
+
+    def observe(self, operation: str, source: str, status: int, seconds: float, stats: RequestStats, response_bytes: int):
+        with self._lock:
+            series = self._series.get((operation, source))
+            if series is None:
+                series = self._series[(operation, source)] = _Series()
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series.buckets[index] += 1
+                    break
+            series.count += 1
+            series.seconds += seconds
+            series.statements += stats.statements
+            series.sql_seconds += stats.sql_seconds
+            series.rows += stats.rows
+            series.response_bytes += response_bytes
+            key = (operation, source, status)
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+
+    def count_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._statuses.clear()
+            self.slow_queries = 0
+
+    def render(self) -> str:
+        with self._lock:
+            series = sorted(self._series.items())
+            statuses = sorted(self._statuses.items())
+            slow_queries = self.slow_queries
+        lines = [
+            "# HELP oms_request_duration_seconds Request latency by operation.",
+            "# TYPE oms_request_duration_seconds histogram",
+        ]
+        for (operation, source), values in series:
+            labels = f'operation="{operation}",source="{source}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values.buckets):
+                cumulative += count
+                lines.append(f'oms_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'oms_request_duration_seconds_bucket{{{labels},le="+Inf"}} {values.count}')
+            lines.append(f"oms_request_duration_seconds_sum{{{labels}}} {values.seconds:.6f}")
+            lines.append(f"oms_request_duration_seconds_count{{{labels}}} {values.count}")
+        lines += ["# HELP oms_requests_total Requests by operation and status.", "# TYPE oms_requests_total counter"]
+        for (operation, source, status), count in statuses:
+            lines.append(f'oms_requests_total{{operation="{operation}",source="{source}",status="{status}"}} {count}')
+        for name, attribute, help in (
+            ("oms_request_sql_statements_total", "statements", "SQL statements executed."),
+            ("oms_request_sql_seconds_total", "sql_seconds", "Time spent executing SQL."),
+            ("oms_request_rows_total", "rows", "Rows loaded, as ORM instances or Core rows."),
+            ("oms_response_bytes_total", "response_bytes", "Response body bytes sent."),
+        ):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+            for (operation, source), values in series:
+                value = getattr(values, attribute)
+                value = f"{value:.6f}" if isinstance(value, float) else value
+                lines.append(f'{name}{{operation="{operation}",source="{source}"}} {value}')
+        lines += [
+            "# HELP oms_slow_queries_total Statements slower than the slow-query threshold.",
+            "# TYPE oms_slow_queries_total counter",
+            f"oms_slow_queries_total {slow_queries}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def instrument(engine, slow_query_ms: Optional[float] = None):
+    """Count and time the statements `engine` executes, and log the slow ones."""
+
+    # The start time rides on the statement's execution context, so a
+    # statement that fails (and never reaches after_cursor_execute) leaves
+    # nothing behind on its pooled connection.
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._oms_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._oms_started
+        stats = _current.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.sql_seconds += elapsed
+        if slow_query_ms is not None and elapsed * 1000 >= slow_query_ms:
+            registry.count_slow_query()
+            slow_query_log.warning(
+                "%.1f ms: %s; parameters: %.1000r", elapsed * 1000, " ".join(statement.split()), parameters
+            )
+
+
+def count_loads(base):
+    """Count the ORM instances loaded from rows of any model derived from `base`."""
+
+    @event.listens_for(base, "load", propagate=True)
+    def _load(target, context):
+        stats = _current.get()
+        if stats is not None:
+            stats.rows += 1
+
+
+def count_rows(count: int):
+    """Count `count` Core rows read for the request in progress."""
+    stats = _current.get()
+    if stats is not None:
+        stats.rows += count
+
+
+class Outcome:
+    """What a tracked block reports back: its HTTP-equivalent status and response size."""
+    __slots__ = ("status", "response_bytes")
+
+    def __init__(self):
+        self.status = 500
+        self.response_bytes = 0
+
+
+@contextmanager
+def track(operation: str, source: str, registry: Registry = registry):
+    """Time the block and attribute the SQL it runs to (operation, source),
+    as MetricsMiddleware does for an HTTP request. The block sets the yielded
+    Outcome's status and response_bytes; an exception leaves status 500."""
+    stats = RequestStats()
+    token = _current.set(stats)
+    outcome = Outcome()
+    start = time.perf_counter()
+    try:
+        yield outcome
+    finally:
+        _current.reset(token)
+        registry.observe(operation, source, outcome.status, time.perf_counter() - start, stats, outcome.response_bytes)
+
+
+def _operation(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "operation_id", None) or getattr(route, "name", None) or "unmatched"
+
+
+def _source(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"host":
+            return "mcp" if value.split(b":")[0] == MCP_HOST else "http"
+    return "http"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed bodies are measured to the last chunk."""
+
+    def __init__(self, app, registry: Registry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        sent = 0
+
+        async def send_measured(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_measured)
+        finally:
+            _current.reset(token)
+            self.registry.observe(_operation(scope), _source(scope), status, time.perf_counter() - start, stats, sent)
@@ -1,6 +1,8 @@
+import sqlite3
 
-from sqlalchemy import Column, Integer, String, ForeignKey, create_engine, DateTime
-from sqlalchemy.orm import relationship
+
+from sqlalchemy import Column, Date, Integer, LargeBinary, String, ForeignKey, Index, create_engine, DateTime, event, inspect, select, text
+from sqlalchemy.orm import column_property, relationship
 from sqlalchemy.sql import func
 from database import Base
 
@@ -30,20 +32,242 @@ class Item(Base):
 
 class ItemOrder(Base):
     __tablename__ = "item_orders"
+    # Per-customer and per-item history is read in id order, so both
+    # foreign keys are indexed together with id for keyset paging.
+    __table_args__ = (
+        Index("ix_item_orders_customer_id_id", "customer_id", "id"),
+        Index("ix_item_orders_item_id_id", "item_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
     customer_id = Column(Integer, ForeignKey("customers.id"))
     order_quantity = Column(Integer)
+    # The client-side default also covers databases where the column was
+    # added by init_db, since SQLite cannot ALTER in a CURRENT_TIMESTAMP default.
+    created_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(), index=True)
 
     item = relationship("Item", back_populates="orders")
     customer = relationship("Customer", back_populates="orders")
 
+# Reorder lifecycle: a log is opened when an order leaves its item under
+# reorder_quantity, acknowledged by whoever places the purchase, and resolved
+# by a restock. Open and acknowledged logs are "pending".
+REORDER_STATUSES = ("open", "acknowledged", "resolved")
+PENDING_REORDER = text("status != 'resolved'")
+
 class ItemReorderLog(Base):
     __tablename__ = "item_reorder_logs"
+    # At most one pending reorder per item, so further orders of a SKU that
+    # is already being restocked are absorbed by INSERT OR IGNORE instead of
+    # logging another row.
+    __table_args__ = (
+        Index("uq_item_reorder_logs_pending", "item_id", unique=True, sqlite_where=PENDING_REORDER),
+        Index("ix_item_reorder_logs_status_id", "status", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    status = Column(String, nullable=False, default="open", server_default="open")
 
     item = relationship("Item", back_populates="reorder_logs")
+
+# Low-stock lookups filter and sort on the shortfall, which SQLite can only
+# read from an index on that exact expression.
+STOCK_SHORTFALL = Item.in_stock - Item.reorder_quantity
+Index("ix_items_stock_shortfall", STOCK_SHORTFALL)
+
+# Running order totals, kept up to date by stats.apply_orders in the same
+# transaction as every order insert and delete, so reports read one row
+# instead of aggregating item_orders. `manage.py rebuild-stats` recomputes them.
+class ItemSales(Base):
+    __tablename__ = "item_sales"
+
+    item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    units_sold = Column(Integer, nullable=False, default=0, index=True)
+
+class CustomerSales(Base):
+    __tablename__ = "customer_sales"
+
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    units_ordered = Column(Integer, nullable=False, default=0, index=True)
+
+class DailyOrderVolume(Base):
+    __tablename__ = "daily_order_volume"
+
+    day = Column(Date, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+
+# Responses of create requests sent with an Idempotency-Key, stored in the
+# same transaction as the row they created so a retry can replay them
+# (idempotency.py). Expired keys are deleted by idempotency.sweep.
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    operation = Column(String, nullable=False)
+    # Hash of the operation and request body, so a key reused for a
+    # different request is refused instead of replaying the wrong response.
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+# Append-only feed of every mutation, one row per changed entity, written by
+# changes.record in the same transaction as the change (changes.py). With
+# AUTOINCREMENT an id is never reused once old entries are pruned, so it is a
+# stable cursor for consumers.
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_entity_id", "entity", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    action = Column(String, nullable=False)
+    # JSON object of the fields the change set, or NULL for deletes.
+    data = Column(String)
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+
+# Relationship sizes for the compact `embed=counts` responses. They are
+# deferred, so they only cost a correlated subquery when a query undefers them.
+Item.order_count = column_property(
+    select(func.count(ItemOrder.id)).where(ItemOrder.item_id == Item.id).correlate_except(ItemOrder).scalar_subquery(),
+    deferred=True,
+)
+Item.reorder_log_count = column_property(
+    select(func.count(ItemReorderLog.id)).where(ItemReorderLog.item_id == Item.id).correlate_except(ItemReorderLog).scalar_subquery(),
+    deferred=True,
+)
+Customer.order_count = column_property(
+    select(func.count(ItemOrder.id)).where(ItemOrder.customer_id == Customer.id).correlate_except(ItemOrder).scalar_subquery(),
+    deferred=True,
+)
+
+# Full-text shadow indexes for the by-name searches. They are external-content
+# FTS5 tables with the trigram tokenizer, so they answer case-insensitive
+# substring queries without scanning the base table, and triggers keep them in
+# sync with every write path, ORM or bulk SQL. The update trigger only fires
+# for the indexed columns, so stock changes never touch the index.
+SEARCH_INDEXES = {
+    "items": ("items_fts", ("name", "description", "manufacturer_name")),
+    "customers": ("customers_fts", ("name", "address")),
+}
+
+def _search_index_supported() -> bool:
+    # FTS5 and the trigram tokenizer (SQLite 3.34+) are compile-time features
+    # of the linked SQLite library, so probing an in-memory database once is
+    # enough to know whether the shadow indexes can exist at all.
+    probe = sqlite3.connect(":memory:")
+    try:
+        probe.execute("create virtual table probe using fts5(value, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        probe.close()
+
+SEARCH_INDEX_AVAILABLE = _search_index_supported()
+
+def _create_search_index(connection, table: str):
+    fts, columns = SEARCH_INDEXES[table]
+    if connection.exec_driver_sql(
+        "select 1 from sqlite_master where type = 'table' and name = ?", (fts,)
+    ).first():
+        return
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    connection.exec_driver_sql(
+        f"create virtual table {fts} using fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')"
+    )
+    connection.exec_driver_sql(
+        f"create trigger {fts}_ai after insert on {table} begin "
+        f"insert into {fts}(rowid, {cols}) values (new.id, {new}); end"
+    )
+    connection.exec_driver_sql(
+        f"create trigger {fts}_ad after delete on {table} begin "
+        f"insert into {fts}({fts}, rowid, {cols}) values ('delete', old.id, {old}); end"
+    )
+    connection.exec_driver_sql(
+        f"create trigger {fts}_au after update of {cols} on {table} begin "
+        f"insert into {fts}({fts}, rowid, {cols}) values ('delete', old.id, {old}); "
+        f"insert into {fts}(rowid, {cols}) values (new.id, {new}); end"
+    )
+    # Index whatever rows the table already holds.
+    connection.exec_driver_sql(f"insert into {fts}({fts}) values ('rebuild')")
+
+def _after_create(target, connection, **kw):
+    if SEARCH_INDEX_AVAILABLE:
+        _create_search_index(connection, target.name)
+
+def _before_drop(target, connection, **kw):
+    connection.exec_driver_sql(f"drop table if exists {SEARCH_INDEXES[target.name][0]}")
+
+for _table in (Item.__table__, Customer.__table__):
+    event.listen(_table, "after_create", _after_create)
+    event.listen(_table, "before_drop", _before_drop)
+
+# Columns added after the first release, which create_all does not add to
+# tables that already exist: (table, column, DDL type, backfill SQL or None).
+# The backfill runs once, right after the column is added and before the
+# indexes are created.
+ADDED_COLUMNS = [
+    ("item_orders", "created_at", "DATETIME", None),
+    (
+        "item_reorder_logs",
+        "status",
+        "VARCHAR NOT NULL DEFAULT 'open'",
+        # Older databases logged a reorder on every low-stock order. Keep the
+        # newest log of each item that is still under its threshold open and
+        # resolve the rest, so the one-pending-per-item index can be built.
+        "update item_reorder_logs set status = 'resolved' where id not in ("
+        "select max(logs.id) from item_reorder_logs logs join items on items.id = logs.item_id "
+        "where items.in_stock < items.reorder_quantity group by logs.item_id)",
+    ),
+]
+
+def _migrate(connection):
+    inspector = inspect(connection)
+    for table, column, ddl_type, backfill in ADDED_COLUMNS:
+        if column not in {existing["name"] for existing in inspector.get_columns(table)}:
+            connection.exec_driver_sql(f"alter table {table} add column {column} {ddl_type}")
+            if backfill:
+                connection.exec_driver_sql(backfill)
+    # Reflection skips expression indexes, so look the names up directly
+    # instead of relying on checkfirst.
+    existing = set(connection.exec_driver_sql("select name from sqlite_master where type = 'index'").scalars())
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+SUMMARY_TABLES = ("item_sales", "customer_sales", "daily_order_volume")
+
+def init_db(bind):
+    """Create any missing tables, columns, indexes and search indexes. Safe to run on every start."""
+    missing_summaries = [table for table in SUMMARY_TABLES if not inspect(bind).has_table(table)]
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as connection:
+        _migrate(connection)
+        # The archive's tables, when one is attached (archive.py). Imported
+        # here for the same reason as stats below.
+        import archive
+        archive.init(connection)
+        if missing_summaries:
+            # Summary tables added to a database that already has orders
+            # start from a full recount. Imported here because stats
+            # builds its statements from these models.
+            import stats
+            stats.rebuild(connection)
+        if SEARCH_INDEX_AVAILABLE:
+            for table in SEARCH_INDEXES:
+                _create_search_index(connection, table)
@@ -0,0 +1,177 @@
+"""Reorder logs with one pending reorder per item.
+
+An order that leaves its item under ``reorder_quantity`` asks for a reorder
+with ``request_reorders``. The insert is ``INSERT OR IGNORE ... SELECT`` that
+re-checks the stock and hits the partial unique index on pending logs, so an
+item that already has an open or acknowledged reorder gets no new row however
+many more orders it takes. A restock through ``crud.update_item`` resolves the
+pending reorder, and the next shortfall opens a fresh one.
+
+By default the reorder is opened inside the order's own transaction. With
+OMS_REORDER_WORKER set, the order only records its item and, once it commits,
+hands it to a ReorderWorker thread. The worker gathers the items of every
+order committed within a short window and opens their reorders in one
+transaction, off the order's critical path. Because the insert re-checks the
+stock, a reorder that an intervening restock made moot is simply skipped.
+"""
+import logging
+import threading
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+import changes, database, models
+from cache import invalidate_on_commit
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# The statuses a log may move to each status from.
+TRANSITIONS = {
+    "acknowledged": ("open",),
+    "resolved": ("open", "acknowledged"),
+}
+
+
+def open_reorders(db, item_ids: Iterable[int]):
+    """Open a reorder for each item that is under its threshold and has none pending."""
+    item_ids = sorted(set(item_ids))
+    if not item_ids:
+        return
+    opened = db.execute(
+        insert(models.ItemReorderLog)
+        .from_select(
+            ["item_id"],
+            select(models.Item.id).where(models.Item.id.in_(item_ids), models.STOCK_SHORTFALL < 0),
+        )
+        .prefix_with("OR IGNORE")
+        .returning(models.ItemReorderLog.id, models.ItemReorderLog.item_id)
+    ).all()
+    if opened:
+        invalidate_on_commit(db, *(f"item:{item_id}" for item_id in item_ids))
+        changes.record(db, "reorder_log", "created", ((row.id, {"item_id": row.item_id, "status": "open"}) for row in opened))
+
+
+def request_reorders(db, item_ids: Iterable[int]):
+    """Open reorders for item_ids now, or after db commits when the worker is enabled."""
+    worker = get_reorder_worker()
+    if worker is None:
+        open_reorders(db, item_ids)
+    else:
+        db.info.setdefault("reorder_items", set()).update(item_ids)
+
+
+def resolve_reorders(db, item_id: int):
+    """Resolve the pending reorder of an item, if it has one."""
+    resolved = db.execute(
+        update(models.ItemReorderLog)
+        .where(models.ItemReorderLog.item_id == item_id, models.PENDING_REORDER)
+        .values(status="resolved")
+        .returning(models.ItemReorderLog.id)
+    ).all()
+    if resolved:
+        invalidate_on_commit(db, f"item:{item_id}")
+        changes.record(db, "reorder_log", "updated", ((row.id, {"status": "resolved"}) for row in resolved))
+
+
+def set_status(db, log_id: int, status: str) -> Optional[models.ItemReorderLog]:
+    """Move a log to `status` if its current status allows it.
+
+    Returns the log, whose status tells whether the move happened, or None if
+    there is no such log.
+    """
+    result = db.execute(
+        update(models.ItemReorderLog)
+        .where(models.ItemReorderLog.id == log_id, models.ItemReorderLog.status.in_(TRANSITIONS[status]))
+        .values(status=status)
+        .returning(models.ItemReorderLog.item_id)
+    ).first()
+    if result is not None:
+        invalidate_on_commit(db, f"item:{result.item_id}")
+        changes.record(db, "reorder_log", "updated", [(log_id, {"status": status})])
+    return db.get(models.ItemReorderLog, log_id, populate_existing=True)
+
+
+class ReorderWorker:
+    def __init__(self, bind, window_ms: float = 50.0):
+        self._bind = bind
+        self._window = window_ms / 1000
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="oms-reorder-worker", daemon=True)
+        self._thread.start()
+
+    def notify(self, item_ids: Iterable[int]):
+        """Queue items whose orders have committed for the next flush."""
+        with self._lock:
+            self._pending.update(item_ids)
+        self._wake.set()
+
+    def close(self):
+        """Flush whatever is queued, then stop the worker thread."""
+        self._stopping = True
+        self._wake.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            if not self._stopping:
+                # Let the rest of a burst of orders for the same items arrive.
+                time.sleep(self._window)
+            with self._lock:
+                items, self._pending = self._pending, set()
+                self._wake.clear()
+            if items:
+                self._flush(items)
+            if self._stopping:
+                return
+
+    def _flush(self, items):
+        try:
+            with Session(bind=self._bind) as db:
+                open_reorders(db, items)
+                db.commit()
+        except Exception:
+            # The items are retried with the next flush.
+            logger.exception("Opening reorders for %d items failed", len(items))
+            with self._lock:
+                self._pending.update(items)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_committed(session):
+    items = session.info.pop("reorder_items", None)
+    if not items:
+        return
+    # Sessions joined to an outer transaction (the write queue) only commit
+    # a savepoint here; their owner notifies after the real commit.
+    deferred = session.info.get("deferred_reorder_items")
+    if deferred is not None:
+        deferred.update(items)
+    else:
+        get_reorder_worker().notify(items)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("reorder_items", None)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_reorder_worker() -> Optional[ReorderWorker]:
+    """The process-wide worker, or None when OMS_REORDER_WORKER is off."""
+    global _worker
+    settings = get_settings()
+    if _worker is None and settings.reorder_worker:
+        with _worker_lock:
+            if _worker is None:
+                _worker = ReorderWorker(database.engine, settings.reorder_window_ms)
+    return _worker
@@ -1,7 +1,25 @@
 
-from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import List, Literal, Optional
+from datetime import date, datetime
+
+# How much related data Item/Customer responses carry: nothing, the sizes of
+# the related collections, or the full nested order/reorder histories.
+EmbedMode = Literal["none", "counts", "full"]
+
+# How the by-name endpoints match: ranked full-text search over the indexed
+# columns, or the plain case-insensitive substring match on the name.
+SearchMode = Literal["ranked", "substring"]
+
+# Reorder log lifecycle; see models.REORDER_STATUSES.
+ReorderStatus = Literal["open", "acknowledged", "resolved"]
+
+# Wire formats of the streaming export endpoints.
+ExportFormat = Literal["ndjson", "csv"]
+
+# What the change feed logs, and what happened to it; see changes.py.
+ChangeEntity = Literal["order", "item", "customer", "reorder_log"]
+ChangeAction = Literal["created", "updated", "deleted"]
 
 class ItemOrderBase(BaseModel):
     item_id: int
@@ -13,9 +31,28 @@ class ItemOrderCreate(ItemOrderBase):
 
 class ItemOrder(ItemOrderBase):
     id: int
+    # None for orders placed before the column existed.
+    created_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
 
+class ItemOrderBatchCreate(BaseModel):
+    # A batch runs in one write transaction, so its size bounds how long it
+    # holds the write lock (and, all-or-nothing, its reserved stock).
+    orders: List[ItemOrderCreate] = Field(..., min_length=1, max_length=1000)
+    all_or_nothing: bool = True
+
+class ItemOrderLineResult(BaseModel):
+    index: int
+    accepted: bool
+    order: Optional[ItemOrder] = None
+    detail: Optional[str] = None
+
+class ItemOrderBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[ItemOrderLineResult]
+
 class ItemReorderLogBase(BaseModel):
     item_id: int
 
@@ -25,6 +62,7 @@ class ItemReorderLogCreate(ItemReorderLogBase):
 class ItemReorderLog(ItemReorderLogBase):
     id: int
     timestamp: datetime
+    status: ReorderStatus = "open"
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -39,13 +77,19 @@ class ItemBase(BaseModel):
 class ItemCreate(ItemBase):
     pass
 
-class Item(ItemBase):
+class ItemSummary(ItemBase):
     id: int
-    orders: List[ItemOrder] = []
-    reorder_logs: List[ItemReorderLog] = []
 
     model_config = ConfigDict(from_attributes=True)
 
+class ItemCounts(ItemSummary):
+    order_count: int
+    reorder_log_count: int
+
+class Item(ItemSummary):
+    orders: List[ItemOrder] = []
+    reorder_logs: List[ItemReorderLog] = []
+
 class CustomerBase(BaseModel):
     name: str
     address: str
@@ -54,8 +98,83 @@ class CustomerBase(BaseModel):
 class CustomerCreate(CustomerBase):
     pass
 
-class Customer(CustomerBase):
+class CustomerSummary(CustomerBase):
     id: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class CustomerCounts(CustomerSummary):
+    order_count: int
+
+class Customer(CustomerSummary):
     orders: List[ItemOrder] = []
 
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[ImportRowError]
+
+class BulkDelete(BaseModel):
+    # Which rows to delete: these ids, and/or the inclusive id range.
+    ids: Optional[List[int]] = Field(None, max_length=10000)
+    id_from: Optional[int] = None
+    id_to: Optional[int] = None
+
+    @model_validator(mode="after")
+    def _selects_something(self):
+        # An empty body must not mean "everything".
+        if self.ids is None and self.id_from is None and self.id_to is None:
+            raise ValueError("Give ids, id_from or id_to")
+        return self
+
+class BulkDeleteResult(BaseModel):
+    deleted: int
+
+class ItemSales(BaseModel):
+    item_id: int
+    order_count: int
+    units_sold: int
+
     model_config = ConfigDict(from_attributes=True)
+
+class CustomerSales(BaseModel):
+    customer_id: int
+    order_count: int
+    units_ordered: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class DailyOrderVolume(BaseModel):
+    day: date
+    order_count: int
+    units: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    invalidations: int
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+
+class Change(BaseModel):
+    id: int
+    entity: ChangeEntity
+    entity_id: int
+    action: ChangeAction
+    # The values the change set; None for deletes.
+    data: Optional[dict] = None
+    created_at: datetime
+
+class ChangePage(BaseModel):
+    changes: List[Change]
+    # The `after` to pass for the next page: the last id returned, or the
+    # cursor given when there was nothing new.
+    next_after: int
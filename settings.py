@@ -0,0 +1,145 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+def _flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Runtime configuration, read from the environment (and .env) once, on first use."""
+
+    database_url: str = "sqlite:///./order_management.db"
+    # "tuned" (WAL, the pragmas below, split read/write engines) or "default"
+    # (SQLite's stock settings, one engine); see database.py.
+    storage_profile: str = "tuned"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size_kb: int = 16 * 1024
+    read_pool_size: int = 16
+    write_pool_size: int = 4
+    pool_overflow: int = 8
+    pool_timeout: float = 30.0
+    # Serve the API with async handlers on an aiosqlite engine instead of
+    # sync handlers in Starlette's threadpool.
+    async_handlers: bool = False
+    # Group-commit order and catalog writes through write_queue.WriteCoalescer,
+    # gathering up to write_batch_max operations for write_batch_window_ms.
+    write_coalescing: bool = False
+    write_batch_window_ms: float = 2.0
+    write_batch_max: int = 64
+    # Open reorder logs from a background thread (reorders.ReorderWorker)
+    # that batches the items of every order committed within
+    # reorder_window_ms, instead of inside each order's transaction.
+    reorder_worker: bool = False
+    reorder_window_ms: float = 50.0
+    # How long a stored Idempotency-Key response is replayed, and how often
+    # the background sweeper deletes expired ones (0 disables the sweeper;
+    # `manage.py sweep-idempotency-keys` does the same on demand).
+    idempotency_ttl_hours: float = 24.0
+    idempotency_sweep_interval: float = 600.0
+    # How long change feed entries are kept, and how often the background
+    # pruner deletes older ones (0 disables the pruner; `manage.py
+    # prune-changes` does the same on demand).
+    change_retention_hours: float = 168.0
+    change_prune_interval: float = 600.0
+    # SQLite file that `manage.py archive` moves old orders and resolved
+    # reorder logs to, attached to every connection as the "archive" schema
+    # (archive.py). None leaves archiving off.
+    archive_database: Optional[str] = None
+    # Read-through cache in front of the item and customer reads (cache.py).
+    # It lives in one process and only that process's writes invalidate it,
+    # so with several workers a write made by another one shows up after up
+    # to catalog_cache_ttl seconds. Off by default; turn it on for a single
+    # worker, or where that staleness is acceptable.
+    catalog_cache: bool = False
+    catalog_cache_size: int = 1024
+    catalog_cache_ttl: float = 30.0
+    # Serve the MCP server at /mcp, built when the app starts up. With
+    # mcp_in_process, the tools in mcp_tools.py run against crud directly
+    # instead of as HTTP requests to the app, returning at most mcp_page_size
+    # rows and mcp_max_result_bytes bytes per call.
+    mcp: bool = True
+    mcp_in_process: bool = True
+    mcp_page_size: int = 25
+    mcp_max_result_bytes: int = 8192
+    # Per-operation request metrics at /metrics (metrics.py), and the
+    # threshold above which statements are logged to "oms.slow_query".
+    metrics: bool = True
+    slow_query_ms: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        load_dotenv()
+        return cls(
+            database_url=os.getenv("OMS_DATABASE_URL", cls.database_url),
+            storage_profile=os.getenv("OMS_STORAGE_PROFILE", cls.storage_profile),
+            sqlite_synchronous=os.getenv("OMS_SQLITE_SYNCHRONOUS", cls.sqlite_synchronous),
+            sqlite_busy_timeout_ms=int(os.getenv("OMS_SQLITE_BUSY_TIMEOUT_MS", cls.sqlite_busy_timeout_ms)),
+            sqlite_mmap_size=int(os.getenv("OMS_SQLITE_MMAP_SIZE", cls.sqlite_mmap_size)),
+            sqlite_cache_size_kb=int(os.getenv("OMS_SQLITE_CACHE_SIZE_KB", cls.sqlite_cache_size_kb)),
+            read_pool_size=int(os.getenv("OMS_READ_POOL_SIZE", cls.read_pool_size)),
+            write_pool_size=int(os.getenv("OMS_WRITE_POOL_SIZE", cls.write_pool_size)),
+            pool_overflow=int(os.getenv("OMS_POOL_OVERFLOW", cls.pool_overflow)),
+            pool_timeout=float(os.getenv("OMS_POOL_TIMEOUT", cls.pool_timeout)),
+            async_handlers=_flag("OMS_ASYNC_HANDLERS", cls.async_handlers),
+            write_coalescing=_flag("OMS_WRITE_COALESCING", cls.write_coalescing),
+            write_batch_window_ms=float(os.getenv("OMS_WRITE_BATCH_WINDOW_MS", cls.write_batch_window_ms)),
+            write_batch_max=int(os.getenv("OMS_WRITE_BATCH_MAX", cls.write_batch_max)),
+            reorder_worker=_flag("OMS_REORDER_WORKER", cls.reorder_worker),
+            reorder_window_ms=float(os.getenv("OMS_REORDER_WINDOW_MS", cls.reorder_window_ms)),
+            idempotency_ttl_hours=float(os.getenv("OMS_IDEMPOTENCY_TTL_HOURS", cls.idempotency_ttl_hours)),
+            idempotency_sweep_interval=float(os.getenv("OMS_IDEMPOTENCY_SWEEP_INTERVAL", cls.idempotency_sweep_interval)),
+            change_retention_hours=float(os.getenv("OMS_CHANGE_RETENTION_HOURS", cls.change_retention_hours)),
+            change_prune_interval=float(os.getenv("OMS_CHANGE_PRUNE_INTERVAL", cls.change_prune_interval)),
+            archive_database=os.getenv("OMS_ARCHIVE_DATABASE") or cls.archive_database,
+            catalog_cache=_flag("OMS_CATALOG_CACHE", cls.catalog_cache),
+            catalog_cache_size=int(os.getenv("OMS_CATALOG_CACHE_SIZE", cls.catalog_cache_size)),
+            catalog_cache_ttl=float(os.getenv("OMS_CATALOG_CACHE_TTL", cls.catalog_cache_ttl)),
+            mcp=_flag("OMS_MCP", cls.mcp),
+            mcp_in_process=_flag("OMS_MCP_IN_PROCESS", cls.mcp_in_process),
+            mcp_page_size=int(os.getenv("OMS_MCP_PAGE_SIZE", cls.mcp_page_size)),
+            mcp_max_result_bytes=int(os.getenv("OMS_MCP_MAX_RESULT_BYTES", cls.mcp_max_result_bytes)),
+            metrics=_flag("OMS_METRICS", cls.metrics),
+            slow_query_ms=float(os.environ["OMS_SLOW_QUERY_MS"]) if os.getenv("OMS_SLOW_QUERY_MS") else cls.slow_query_ms,
+        )
+
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """The process's configuration: what use_settings installed, or else the
+    environment's, read (with .env) on the first call and never again."""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = Settings.from_env()
+    return _settings
+
+
+def use_settings(settings: Settings) -> Settings:
+    """Make `settings` the process's configuration (create_app does this).
+
+    The engines, cache and workers built from it are process-wide, so once
+    anything has read the configuration, other settings are refused with
+    RuntimeError rather than giving a half-configured process.
+    """
+    global _settings
+    with _settings_lock:
+        if _settings is None:
+            _settings = settings
+        elif _settings != settings:
+            raise RuntimeError("The settings were already read by this process and cannot be replaced")
+    return _settings
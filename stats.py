@@ -0,0 +1,153 @@
+"""Incrementally maintained order aggregates.
+
+item_sales, customer_sales and daily_order_volume hold running order counts
+and unit totals. Every order write path calls ``apply_orders`` inside its own
+transaction, before commit: one ``INSERT ... SELECT ... GROUP BY ... ON
+CONFLICT DO UPDATE`` per table adds (or, for deletes, subtracts) the totals of
+the affected orders. Because the totals commit or roll back together with the
+orders, readers never see them disagree. A stats read is then a primary-key
+lookup, and the top-N lists walk the units index instead of grouping
+item_orders.
+
+``rebuild`` recomputes everything from item_orders and ``verify`` reports any
+drift; ``python manage.py rebuild-stats`` runs both. Archived orders still
+count (archive.py), so both read the archive too when it is attached.
+"""
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+import archive, models
+
+# Each summary table, its key column, the expression over the orders'
+# columns it groups by, and the column holding the unit total.
+AGGREGATES = [
+    (models.ItemSales, models.ItemSales.item_id, lambda orders: orders.item_id, models.ItemSales.units_sold),
+    (models.CustomerSales, models.CustomerSales.customer_id, lambda orders: orders.customer_id, models.CustomerSales.units_ordered),
+    (models.DailyOrderVolume, models.DailyOrderVolume.day, lambda orders: func.date(orders.created_at), models.DailyOrderVolume.units),
+]
+
+ORDERS = models.ItemOrder.__table__.c
+
+
+def _totals(orders, group, sign: int = 1):
+    # Orders detached from their customer or item, and those placed before
+    # created_at existed, are left out of the tables they have no key for.
+    source = group(orders)
+    return (
+        select(
+            source,
+            sign * func.count(),
+            sign * func.coalesce(func.sum(orders.order_quantity), 0),
+        )
+        .where(source.is_not(None))
+        .group_by(source)
+    )
+
+
+def _every_order(db):
+    # The columns of every order, hot and archived.
+    return archive.all_orders().c if archive.attached(db) else ORDERS
+
+
+def apply_orders(db, order_ids: List[int], sign: int = 1):
+    """Add (sign=1) or subtract (sign=-1) the given orders from every summary table.
+
+    Call it after the orders are flushed and, when deleting, before they are removed.
+    """
+    if not order_ids:
+        return
+    for model, key, group, units in AGGREGATES:
+        statement = insert(model).from_select(
+            [key.key, "order_count", units.key],
+            _totals(ORDERS, group, sign).where(ORDERS.id.in_(order_ids)),
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[key],
+            set_={
+                "order_count": model.order_count + statement.excluded.order_count,
+                units.key: units + statement.excluded[units.key],
+            },
+        )
+        db.execute(statement)
+
+
+def forget_items(db, item_ids: List[int]):
+    """Drop the totals of deleted items; their orders stay in the customer and daily totals."""
+    db.execute(delete(models.ItemSales).where(models.ItemSales.item_id.in_(item_ids)))
+
+
+def forget_customers(db, customer_ids: List[int]):
+    """Drop the totals of deleted customers; their orders stay in the item and daily totals."""
+    db.execute(delete(models.CustomerSales).where(models.CustomerSales.customer_id.in_(customer_ids)))
+
+
+def rebuild(db):
+    """Recompute every summary table from item_orders (and its archive)."""
+    orders = _every_order(db)
+    for model, key, group, units in AGGREGATES:
+        db.execute(delete(model))
+        db.execute(insert(model).from_select([key.key, "order_count", units.key], _totals(orders, group)))
+
+
+def verify(db) -> List[dict]:
+    """Compare the summary tables against a full recount and return the rows that differ."""
+    drift = []
+    orders = _every_order(db)
+    for model, key, group, units in AGGREGATES:
+        expected = {row[0]: (row[1], row[2]) for row in db.execute(_totals(orders, group))}
+        stored = {
+            row[0]: (row[1], row[2])
+            for row in db.execute(select(key, model.order_count, units))
+            # Totals that were subtracted back to zero are not drift.
+            if row[1] or row[2]
+        }
+        if model is models.DailyOrderVolume:
+            expected = {date.fromisoformat(day): totals for day, totals in expected.items()}
+        for value in expected.keys() | stored.keys():
+            if expected.get(value) != stored.get(value):
+                drift.append({
+                    "table": model.__tablename__,
+                    "key": str(value),
+                    "stored": stored.get(value),
+                    "expected": expected.get(value),
+                })
+    return drift
+
+
+def item_stats(db, item_id: int) -> Optional[models.ItemSales]:
+    """The running totals of an item, zero if it has no orders, or None if the item does not exist."""
+    row = db.get(models.ItemSales, item_id)
+    if row is None and db.get(models.Item, item_id) is not None:
+        row = models.ItemSales(item_id=item_id, order_count=0, units_sold=0)
+    return row
+
+
+def customer_stats(db, customer_id: int) -> Optional[models.CustomerSales]:
+    """The running totals of a customer, zero if it has no orders, or None if the customer does not exist."""
+    row = db.get(models.CustomerSales, customer_id)
+    if row is None and db.get(models.Customer, customer_id) is not None:
+        row = models.CustomerSales(customer_id=customer_id, order_count=0, units_ordered=0)
+    return row
+
+
+def top_items(db, limit: int = 10) -> List[models.ItemSales]:
+    return db.scalars(select(models.ItemSales).order_by(models.ItemSales.units_sold.desc()).limit(limit)).all()
+
+
+def top_customers(db, limit: int = 10) -> List[models.CustomerSales]:
+    return db.scalars(
+        select(models.CustomerSales).order_by(models.CustomerSales.units_ordered.desc()).limit(limit)
+    ).all()
+
+
+def daily_volume(db, day_from: Optional[date] = None, day_to: Optional[date] = None) -> List[models.DailyOrderVolume]:
+    """Per-day totals in [day_from, day_to), oldest first."""
+    query = select(models.DailyOrderVolume).order_by(models.DailyOrderVolume.day)
+    if day_from is not None:
+        query = query.where(models.DailyOrderVolume.day >= day_from)
+    if day_to is not None:
+        query = query.where(models.DailyOrderVolume.day < day_to)
+    return db.scalars(query).all()
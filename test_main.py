@@ -1,8 +1,38 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from main import app, get_db
+from sqlalchemy import create_engine, event, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+# The settings are read when the app is first built, which `from main import
+# app` does through create_app(); database.get_engines() then builds the app's
+# own engines (used by get_db and the background workers) from
+# OMS_DATABASE_URL. So point it at a scratch file before that import: tests
+# must never touch the committed order_management.db.
+os.environ.setdefault("OMS_DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='oms-test-')}/app.db")
+
+from main import MCP_OPERATIONS, app, get_db
+import archive, async_routes, changes, crud, export, idempotency, metrics, models, reorders, schemas, stats
+from cache import catalog
+from mcp_tools import TOOLS, InProcessMCP
+from responses import validated
+from write_queue import WriteCoalescer, get_write_coalescer
+import database
 from database import Base
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -11,8 +41,9 @@ engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+metrics.instrument(engine)
 
-Base.metadata.create_all(bind=engine)
+models.init_db(engine)
 
 def override_get_db():
     try:
@@ -28,6 +59,7 @@ client = TestClient(app)
 @pytest.fixture(scope="function")
 def db_session():
     Base.metadata.create_all(bind=engine)
+    catalog.clear()
     db = TestingSessionLocal()
     try:
         yield db
@@ -164,4 +196,1130 @@ def test_create_reorder_log(db_session):
     assert response.status_code == 200
     data = response.json()
     assert len(data) == 1
-    assert data[0]["item_id"] == item_id
\ No newline at end of file
+    assert data[0]["item_id"] == item_id
+
+
+def test_create_order_concurrent_no_oversell(db_session):
+    customer = crud.create_customer(
+        db_session, schemas.CustomerCreate(name="Test Customer", address="123 Test St", zip_code="12345")
+    )
+    item = crud.create_item(
+        db_session,
+        schemas.ItemCreate(
+            name="Hot Item",
+            description="A contended item",
+            manufacturer_name="Test Inc.",
+            manufacturer_email="test@example.com",
+            in_stock=50,
+            reorder_quantity=20,
+        ),
+    )
+    workers = 40
+    barrier = threading.Barrier(workers)
+
+    def place_order():
+        db = TestingSessionLocal()
+        try:
+            barrier.wait()
+            order = schemas.ItemOrderCreate(item_id=item.id, customer_id=customer.id, order_quantity=5)
+            return crud.create_order(db, order) is not None
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda _: place_order(), range(workers)))
+
+    db_session.expire_all()
+    assert results.count(True) == 10
+    assert crud.get_item(db_session, item.id).in_stock == 0
+    assert db_session.query(models.ItemOrder).count() == 10
+    # The orders that left stock under the threshold share one pending reorder.
+    assert db_session.query(models.ItemReorderLog).count() == 1
+
+def test_create_orders_batch_partial(db_session):
+    customer_id = client.post(
+        "/customers/",
+        json={"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"},
+    ).json()["id"]
+    item_id = client.post(
+        "/items/",
+        json={
+            "name": "Test Item",
+            "description": "A test item",
+            "manufacturer_name": "Test Inc.",
+            "manufacturer_email": "test@example.com",
+            "in_stock": 25,
+            "reorder_quantity": 20,
+        },
+    ).json()["id"]
+    response = client.post(
+        "/orders/batch",
+        json={
+            "all_or_nothing": False,
+            "orders": [
+                {"item_id": item_id, "customer_id": customer_id, "order_quantity": 10},
+                {"item_id": item_id, "customer_id": customer_id, "order_quantity": 20},
+                {"item_id": 9999, "customer_id": customer_id, "order_quantity": 1},
+                {"item_id": item_id, "customer_id": customer_id, "order_quantity": 15},
+            ],
+        },
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["accepted"] == 2
+    assert data["rejected"] == 2
+    assert [line["accepted"] for line in data["results"]] == [True, False, False, True]
+    assert data["results"][1]["detail"] == "Order quantity exceeds available stock"
+    assert data["results"][2]["detail"] == "Item not found"
+    assert data["results"][3]["order"]["order_quantity"] == 15
+    assert client.get(f"/items/{item_id}").json()["in_stock"] == 0
+    assert len(client.get("/orders/").json()) == 2
+    assert len(client.get("/reorder_logs/").json()) == 1
+
+def test_create_orders_batch_all_or_nothing(db_session):
+    customer_id = client.post(
+        "/customers/",
+        json={"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"},
+    ).json()["id"]
+    item_id = client.post(
+        "/items/",
+        json={
+            "name": "Test Item",
+            "description": "A test item",
+            "manufacturer_name": "Test Inc.",
+            "manufacturer_email": "test@example.com",
+            "in_stock": 25,
+            "reorder_quantity": 20,
+        },
+    ).json()["id"]
+    response = client.post(
+        "/orders/batch",
+        json={
+            "orders": [
+                {"item_id": item_id, "customer_id": customer_id, "order_quantity": 10},
+                {"item_id": item_id, "customer_id": customer_id, "order_quantity": 20},
+            ],
+        },
+    )
+    assert response.status_code == 400
+    results = response.json()["detail"]["results"]
+    assert [line["accepted"] for line in results] == [False, False]
+    assert results[0]["detail"] == "Batch rejected by another line"
+    assert client.get(f"/items/{item_id}").json()["in_stock"] == 25
+    line = {"item_id": item_id, "customer_id": customer_id, "order_quantity": 1}
+    assert client.post("/orders/batch", json={"orders": []}).status_code == 422
+    assert client.post("/orders/batch", json={"orders": [line] * 1001}).status_code == 422
+    assert client.get("/orders/").json() == []
+
+def test_read_customers_keyset_pagination(db_session):
+    for i in range(5):
+        client.post(
+            "/customers/",
+            json={"name": f"Customer {i}", "address": "123 Test St", "zip_code": "12345"},
+        )
+    response = client.get("/customers/", params={"after_id": 0, "limit": 2})
+    assert response.status_code == 200
+    assert [c["name"] for c in response.json()] == ["Customer 0", "Customer 1"]
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get("/customers/", params={"after_id": cursor, "limit": 2})
+    assert [c["name"] for c in response.json()] == ["Customer 2", "Customer 3"]
+    response = client.get("/customers/", params={"after_id": response.headers["X-Next-Cursor"], "limit": 2})
+    assert [c["name"] for c in response.json()] == ["Customer 4"]
+    assert "X-Next-Cursor" not in response.headers
+    # Offset paging still works and does not advertise a cursor.
+    response = client.get("/customers/", params={"skip": 3, "limit": 2})
+    assert [c["name"] for c in response.json()] == ["Customer 3", "Customer 4"]
+    assert "X-Next-Cursor" not in response.headers
+
+class count_queries:
+    """Count the SQL statements the test engine runs inside the block."""
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def _seed_order_history(items=3, orders_per_item=2):
+    customer_id = client.post(
+        "/customers/",
+        json={"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"},
+    ).json()["id"]
+    for i in range(items):
+        item_id = client.post(
+            "/items/",
+            json={
+                "name": f"Test Item {i}",
+                "description": "A test item",
+                "manufacturer_name": "Test Inc.",
+                "manufacturer_email": "test@example.com",
+                "in_stock": 25,
+                "reorder_quantity": 20,
+            },
+        ).json()["id"]
+        for _ in range(orders_per_item):
+            client.post(
+                "/orders/",
+                json={"item_id": item_id, "customer_id": customer_id, "order_quantity": 5},
+            )
+    return customer_id, item_id
+
+@pytest.mark.parametrize(
+    "path, embed, expected_queries",
+    [
+        ("/items/", "full", 3),
+        ("/items/", "counts", 1),
+        ("/items/", "none", 1),
+        ("/items/{item_id}", "full", 3),
+        ("/items/{item_id}", "counts", 1),
+        ("/items/by_name/Test", "full", 4),
+        ("/customers/", "full", 2),
+        ("/customers/", "counts", 1),
+        ("/customers/{customer_id}", "full", 2),
+        ("/customers/by_name/Test", "none", 2),
+    ],
+)
+def test_read_query_counts(db_session, path, embed, expected_queries):
+    customer_id, item_id = _seed_order_history()
+    with count_queries() as queries:
+        response = client.get(path.format(item_id=item_id, customer_id=customer_id), params={"embed": embed})
+    assert response.status_code == 200
+    assert queries.count == expected_queries
+
+def test_read_items_embed_modes(db_session):
+    _seed_order_history(items=1)
+    full = client.get("/items/").json()[0]
+    assert len(full["orders"]) == 2
+    assert len(full["reorder_logs"]) == 1
+    counts = client.get("/items/", params={"embed": "counts"}).json()[0]
+    assert counts["order_count"] == 2
+    assert counts["reorder_log_count"] == 1
+    assert "orders" not in counts
+    compact = client.get("/items/", params={"embed": "none"}).json()[0]
+    assert set(compact) == {"id", "name", "description", "manufacturer_name", "manufacturer_email", "in_stock", "reorder_quantity"}
+    customer = client.get("/customers/", params={"embed": "counts"}).json()[0]
+    assert customer["order_count"] == 2
+
+def test_lean_list_responses_and_sparse_fields(db_session):
+    _seed_order_history(items=2)
+    # The lean path returns exactly what the response schemas would.
+    expected = [schemas.ItemOrder.model_validate(order).model_dump(mode="json") for order in crud.get_orders(db_session)]
+    assert client.get("/orders/").json() == expected
+    expected = [schemas.ItemSummary.model_validate(item).model_dump(mode="json") for item in crud.get_items(db_session)]
+    assert client.get("/items/", params={"embed": "none"}).json() == expected
+    assert client.get("/items/low_stock").json() == expected
+
+    page = client.get("/orders/", params={"fields": "order_quantity", "after_id": 0, "limit": 2})
+    assert [set(order) for order in page.json()] == [{"id", "order_quantity"}] * 2
+    assert page.headers["X-Next-Cursor"] == str(page.json()[-1]["id"])
+    items = client.get("/items/", params={"fields": "name, in_stock"}).json()
+    assert items[0] == {"id": expected[0]["id"], "name": "Test Item 0", "in_stock": 15}
+    assert set(client.get("/items/low_stock", params={"fields": "in_stock"}).json()[0]) == {"id", "in_stock"}
+    assert set(client.get("/customers/", params={"fields": "zip_code"}).json()[0]) == {"id", "zip_code"}
+    assert client.get("/reorder_logs/", params={"fields": "status"}).json()[0]["status"] == "open"
+    response = client.get("/items/", params={"fields": "name,orders"})
+    assert response.status_code == 422
+    assert "orders" in response.json()["detail"]
+
+def test_read_item_by_name_search(db_session):
+    for name, description in [
+        ("Blue Widget", "A small widget"),
+        ("Red Gadget", "Works with any widget"),
+        ("Green Gizmo", "Nothing to see here"),
+    ]:
+        client.post(
+            "/items/",
+            json={
+                "name": name,
+                "description": description,
+                "manufacturer_name": "Test Inc.",
+                "manufacturer_email": "test@example.com",
+                "in_stock": 100,
+                "reorder_quantity": 20,
+            },
+        )
+    response = client.get("/items/by_name/WIDGET")
+    assert response.status_code == 200
+    # The name match ranks above the description match.
+    assert [item["name"] for item in response.json()] == ["Blue Widget", "Red Gadget"]
+    assert len(client.get("/items/by_name/widget", params={"limit": 1}).json()) == 1
+    assert [item["name"] for item in client.get("/items/by_name/widget", params={"match": "substring"}).json()] == ["Blue Widget"]
+    # Queries shorter than a trigram fall back to the substring match.
+    assert [item["name"] for item in client.get("/items/by_name/Gi").json()] == ["Green Gizmo"]
+
+    # The index follows updates and deletes.
+    gizmo = client.get("/items/by_name/gizmo").json()[0]
+    client.put(f"/items/{gizmo['id']}", json={**gizmo, "name": "Green Sprocket"})
+    assert client.get("/items/by_name/gizmo").status_code == 404
+    assert client.get("/items/by_name/sprocket").json()[0]["id"] == gizmo["id"]
+    client.delete(f"/items/{gizmo['id']}")
+    assert client.get("/items/by_name/sprocket").status_code == 404
+
+def test_read_customer_by_name_search(db_session):
+    client.post("/customers/", json={"name": "Ada Lovelace", "address": "12 Analytical Way", "zip_code": "12345"})
+    client.post("/customers/", json={"name": "Charles Babbage", "address": "1 Lovelace Lane", "zip_code": "54321"})
+    response = client.get("/customers/by_name/lovelace")
+    assert response.status_code == 200
+    assert [customer["name"] for customer in response.json()] == ["Ada Lovelace", "Charles Babbage"]
+
+async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+async_app = FastAPI()
+async_app.include_router(async_routes.router)
+async_app.dependency_overrides[async_routes.get_async_db] = override_get_async_db
+
+def test_async_handlers(db_session):
+    with TestClient(async_app) as async_client:
+        customer_id = async_client.post(
+            "/customers/",
+            json={"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"},
+        ).json()["id"]
+        response = async_client.post(
+            "/items/",
+            json={
+                "name": "Test Item",
+                "description": "A test item",
+                "manufacturer_name": "Test Inc.",
+                "manufacturer_email": "test@example.com",
+                "in_stock": 25,
+                "reorder_quantity": 20,
+            },
+        )
+        assert response.status_code == 200
+        item_id = response.json()["id"]
+        response = async_client.post(
+            "/orders/",
+            json={"item_id": item_id, "customer_id": customer_id, "order_quantity": 10},
+        )
+        assert response.status_code == 200
+        response = async_client.post(
+            "/orders/",
+            json={"item_id": item_id, "customer_id": customer_id, "order_quantity": 20},
+        )
+        assert response.status_code == 400
+
+        item = async_client.get(f"/items/{item_id}").json()
+        assert item["in_stock"] == 15
+        assert len(item["orders"]) == 1
+        assert len(item["reorder_logs"]) == 1
+        assert async_client.get("/customers/", params={"embed": "counts"}).json()[0]["order_count"] == 1
+        assert async_client.get("/items/by_name/test").json()[0]["id"] == item_id
+        assert async_client.put(
+            f"/customers/{customer_id}",
+            json={"name": "Updated Customer", "address": "456 Updated St", "zip_code": "54321"},
+        ).json()["orders"][0]["item_id"] == item_id
+        order_id = item["orders"][0]["id"]
+        assert async_client.delete(f"/orders/{order_id}").json()["id"] == order_id
+        assert async_client.get(f"/customers/{customer_id}").json()["orders"] == []
+
+def test_write_coalescer_batches_orders(db_session):
+    customer = crud.create_customer(
+        db_session, schemas.CustomerCreate(name="Test Customer", address="123 Test St", zip_code="12345")
+    )
+    item = crud.create_item(
+        db_session,
+        schemas.ItemCreate(
+            name="Hot Item",
+            description="A contended item",
+            manufacturer_name="Test Inc.",
+            manufacturer_email="test@example.com",
+            in_stock=50,
+            reorder_quantity=0,
+        ),
+    )
+    commits = []
+
+    def on_commit(connection):
+        commits.append(connection)
+
+    event.listen(engine, "commit", on_commit)
+    writes = WriteCoalescer(engine, window_ms=50, max_batch=100)
+    try:
+        order = schemas.ItemOrderCreate(item_id=item.id, customer_id=customer.id, order_quantity=5)
+        create = validated(crud.create_order, schemas.ItemOrder)
+        futures = [writes.submit(create, order) for _ in range(12)]
+        futures.append(writes.submit(lambda db: db.execute(text("select * from no_such_table"))))
+        results = [future.result() for future in futures[:-1]]
+        with pytest.raises(Exception):
+            futures[-1].result()
+    finally:
+        writes.close()
+        event.remove(engine, "commit", on_commit)
+
+    # Ten orders fit, the other two and the failing statement were rolled
+    # back on their own, and everything landed in a single commit.
+    assert sum(result is not None for result in results) == 10
+    assert len(commits) == 1
+    db_session.expire_all()
+    assert crud.get_item(db_session, item.id).in_stock == 0
+    assert db_session.query(models.ItemOrder).count() == 10
+
+def test_create_order_through_write_coalescer(db_session):
+    writes = WriteCoalescer(engine)
+    app.dependency_overrides[get_write_coalescer] = lambda: writes
+    try:
+        customer_id = client.post(
+            "/customers/",
+            json={"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"},
+        ).json()["id"]
+        item_id = client.post(
+            "/items/",
+            json={
+                "name": "Test Item",
+                "description": "A test item",
+                "manufacturer_name": "Test Inc.",
+                "manufacturer_email": "test@example.com",
+                "in_stock": 25,
+                "reorder_quantity": 20,
+            },
+        ).json()["id"]
+        response = client.post(
+            "/orders/",
+            json={"item_id": item_id, "customer_id": customer_id, "order_quantity": 10},
+        )
+        assert response.status_code == 200
+        assert response.json()["order_quantity"] == 10
+        response = client.post(
+            "/orders/",
+            json={"item_id": item_id, "customer_id": customer_id, "order_quantity": 20},
+        )
+        assert response.status_code == 400
+        response = client.put(
+            f"/items/{item_id}",
+            json={
+                "name": "Renamed Item",
+                "description": "A test item",
+                "manufacturer_name": "Test Inc.",
+                "manufacturer_email": "test@example.com",
+                "in_stock": 15,
+                "reorder_quantity": 20,
+            },
+        )
+        assert response.json()["name"] == "Renamed Item"
+        assert len(response.json()["reorder_logs"]) == 1
+        assert client.put("/customers/9999", json={"name": "x", "address": "y", "zip_code": "z"}).status_code == 404
+    finally:
+        del app.dependency_overrides[get_write_coalescer]
+        writes.close()
+
+def test_idempotency_key_replays_create_requests(db_session):
+    customer = {"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"}
+    first = client.post("/customers/", json=customer, headers={"Idempotency-Key": "customer-1"})
+    retry = client.post("/customers/", json=customer, headers={"Idempotency-Key": "customer-1"})
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers[idempotency.REPLAYED_HEADER] == "true"
+    assert idempotency.REPLAYED_HEADER not in first.headers
+    assert db_session.query(models.Customer).count() == 1
+    item_id = client.post(
+        "/items/",
+        json={
+            "name": "Hot Item",
+            "description": "A contended item",
+            "manufacturer_name": "Test Inc.",
+            "manufacturer_email": "test@example.com",
+            "in_stock": 50,
+            "reorder_quantity": 0,
+        },
+        headers={"Idempotency-Key": "item-1"},
+    ).json()["id"]
+    order = {"item_id": item_id, "customer_id": first.json()["id"], "order_quantity": 5}
+
+    # Concurrent retries of one order create it once, sync or coalesced.
+    writes = WriteCoalescer(engine)
+    for key, coalescer in (("order-1", None), ("order-2", writes)):
+        app.dependency_overrides[get_write_coalescer] = (lambda coalescer: lambda: coalescer)(coalescer)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(
+                lambda _: client.post("/orders/", json=order, headers={"Idempotency-Key": key}), range(8)
+            ))
+        assert {response.status_code for response in responses} == {200}
+        assert len({response.json()["id"] for response in responses}) == 1
+    del app.dependency_overrides[get_write_coalescer]
+    writes.close()
+    db_session.expire_all()
+    assert crud.get_item(db_session, item_id).in_stock == 40
+    assert db_session.query(models.ItemOrder).count() == 2
+
+    # The same key with a different body is refused; failures store nothing.
+    response = client.post("/orders/", json=dict(order, order_quantity=6), headers={"Idempotency-Key": "order-1"})
+    assert response.status_code == 422
+    too_many = dict(order, order_quantity=500)
+    assert client.post("/orders/", json=too_many, headers={"Idempotency-Key": "order-3"}).status_code == 400
+    assert db_session.get(models.IdempotencyKey, "order-3") is None
+    with TestClient(async_app) as async_client:
+        response = async_client.post("/orders/", json=order, headers={"Idempotency-Key": "order-1"})
+        assert response.headers[idempotency.REPLAYED_HEADER] == "true"
+        response = async_client.post("/orders/", json=order, headers={"Idempotency-Key": "order-4"})
+        assert idempotency.REPLAYED_HEADER not in response.headers
+        assert async_client.post("/orders/", json=order, headers={"Idempotency-Key": "order-4"}).json() == response.json()
+
+    # Expired keys are swept and no longer replayed.
+    db_session.execute(
+        update(models.IdempotencyKey)
+        .where(models.IdempotencyKey.key == "order-1")
+        .values(expires_at=datetime(2000, 1, 1))
+    )
+    db_session.commit()
+    assert idempotency.sweep(db_session) == 1
+    response = client.post("/orders/", json=order, headers={"Idempotency-Key": "order-1"})
+    assert idempotency.REPLAYED_HEADER not in response.headers
+    assert db_session.query(models.ItemOrder).count() == 4
+
+@pytest.fixture
+def catalog_cache(monkeypatch):
+    # The cache is off by default (OMS_CATALOG_CACHE); these tests turn it on.
+    monkeypatch.setattr(catalog, "max_entries", 1024)
+    catalog.clear()
+    yield catalog
+    catalog.clear()
+
+def test_catalog_cache_and_etags(db_session, catalog_cache):
+    customer_id = client.post(
+        "/customers/",
+        json={"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"},
+    ).json()["id"]
+    item_id = client.post(
+        "/items/",
+        json={
+            "name": "Test Item",
+            "description": "A test item",
+            "manufacturer_name": "Test Inc.",
+            "manufacturer_email": "test@example.com",
+            "in_stock": 25,
+            "reorder_quantity": 20,
+        },
+    ).json()["id"]
+    first = client.get(f"/items/{item_id}")
+    etag = first.headers["ETag"]
+    before = client.get("/cache/stats").json()
+    with count_queries() as queries:
+        second = client.get(f"/items/{item_id}")
+        not_modified = client.get(f"/items/{item_id}", headers={"If-None-Match": etag})
+    assert queries.count == 0
+    assert second.json() == first.json()
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    after = client.get("/cache/stats").json()
+    assert after["hits"] == before["hits"] + 2
+
+    # An order changes the item's stock and history and must show up at once.
+    client.get("/items/")
+    client.get(f"/customers/{customer_id}")
+    client.post("/orders/", json={"item_id": item_id, "customer_id": customer_id, "order_quantity": 10})
+    response = client.get(f"/items/{item_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["in_stock"] == 15
+    assert client.get("/items/").json()[0]["in_stock"] == 15
+    assert len(client.get(f"/customers/{customer_id}").json()["orders"]) == 1
+
+    # Renames show up in searches; deletes drop the item everywhere.
+    assert client.get("/items/by_name/test").status_code == 200
+    client.put(
+        f"/items/{item_id}",
+        json={
+            "name": "Renamed Thing",
+            "description": "Renamed",
+            "manufacturer_name": "Other Inc.",
+            "manufacturer_email": "other@example.com",
+            "in_stock": 15,
+            "reorder_quantity": 20,
+        },
+    )
+    assert client.get("/items/by_name/test").status_code == 404
+    client.post("/customers/", json={"name": "Second Customer", "address": "1 Main St", "zip_code": "11111"})
+    assert len(client.get("/customers/").json()) == 2
+
+    # A failed order changes nothing and keeps the cached entry.
+    etag = client.get(f"/items/{item_id}").headers["ETag"]
+    client.post("/orders/", json={"item_id": item_id, "customer_id": customer_id, "order_quantity": 100})
+    assert client.get(f"/items/{item_id}", headers={"If-None-Match": etag}).status_code == 304
+
+def test_catalog_cache_only_expires_writes_from_other_processes(db_session, catalog_cache, monkeypatch):
+    monkeypatch.setattr(catalog, "ttl", 0.5)
+    item_id = _low_stock_item()["id"]
+    assert client.get(f"/items/{item_id}").json()["in_stock"] == 25
+    # A write that never goes through this process's sessions, as one made
+    # by another worker, invalidates nothing: the cached body is served
+    # until its TTL runs out.
+    with engine.begin() as connection:
+        connection.execute(update(models.Item).where(models.Item.id == item_id).values(in_stock=3))
+    assert client.get(f"/items/{item_id}").json()["in_stock"] == 25
+    time.sleep(0.6)
+    assert client.get(f"/items/{item_id}").json()["in_stock"] == 3
+
+def test_read_orders_filters_by_customer_item_and_time(db_session):
+    customer_id, last_item_id = _seed_order_history(items=2, orders_per_item=2)
+    other_customer_id = client.post(
+        "/customers/",
+        json={"name": "Other Customer", "address": "1 Other St", "zip_code": "54321"},
+    ).json()["id"]
+    order = client.post(
+        "/orders/",
+        json={"item_id": last_item_id, "customer_id": other_customer_id, "order_quantity": 1},
+    ).json()
+    assert order["created_at"]
+    for order_id, day in ((1, 1), (2, 2), (3, 3), (4, 4), (5, 5)):
+        db_session.execute(
+            update(models.ItemOrder).where(models.ItemOrder.id == order_id).values(created_at=datetime(2024, 1, day))
+        )
+    db_session.commit()
+
+    def ids(**params):
+        return [order["id"] for order in client.get("/orders/", params=params).json()]
+
+    assert ids(customer_id=customer_id) == [1, 2, 3, 4]
+    assert ids(customer_id=other_customer_id) == [5]
+    assert ids(item_id=last_item_id) == [3, 4, 5]
+    assert ids(item_id=last_item_id, customer_id=customer_id, after_id=3) == [4]
+    assert ids(**{"from": "2024-01-02T00:00:00", "to": "2024-01-04T00:00:00"}) == [2, 3]
+    assert ids(**{"from": "2024-01-02T01:00:00+02:00", "to": "2024-01-03T00:00:00Z"}) == [2]
+
+    response = client.get("/export/orders", params={"from": "2024-01-05T00:00:00"})
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [5]
+
+def test_order_filters_use_indexes(db_session):
+    def plan(**filters):
+        query = db_session.query(models.ItemOrder).filter_by(**filters).order_by(models.ItemOrder.id)
+        compiled = query.statement.compile(engine, compile_kwargs={"literal_binds": True})
+        return " ".join(row[3] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+
+    assert "ix_item_orders_customer_id_id" in plan(customer_id=1)
+    assert "ix_item_orders_item_id_id" in plan(item_id=1)
+    assert "USE TEMP B-TREE" not in plan(customer_id=1)
+
+def test_init_db_adds_created_at_to_existing_orders_table():
+    old = create_engine("sqlite://")
+    with old.begin() as connection:
+        connection.exec_driver_sql(
+            "create table item_orders (id integer primary key, item_id integer, customer_id integer, order_quantity integer)"
+        )
+        connection.exec_driver_sql("insert into item_orders (item_id, customer_id, order_quantity) values (1, 1, 1)")
+    models.init_db(old)
+    with old.connect() as connection:
+        columns = [row[1] for row in connection.exec_driver_sql("pragma table_info(item_orders)")]
+        indexes = {row[1] for row in connection.exec_driver_sql("pragma index_list(item_orders)")}
+        assert connection.exec_driver_sql("select created_at from item_orders").scalar() is None
+    assert "created_at" in columns
+    assert {"ix_item_orders_customer_id_id", "ix_item_orders_item_id_id", "ix_item_orders_created_at"} <= indexes
+    with Session(old) as db:
+        db.add(models.ItemOrder(item_id=1, customer_id=1, order_quantity=2))
+        db.commit()
+        assert db.scalars(select(models.ItemOrder.created_at).order_by(models.ItemOrder.id.desc())).first()
+
+def test_stats_follow_order_writes(db_session):
+    customer_id, item_id = _seed_order_history(items=2, orders_per_item=2)
+    response = client.post(
+        "/orders/batch",
+        json={"orders": [{"item_id": item_id, "customer_id": customer_id, "order_quantity": 3}]},
+    )
+    assert response.status_code == 200
+    client.delete("/orders/1")
+
+    assert client.get(f"/stats/items/{item_id}").json() == {"item_id": item_id, "order_count": 3, "units_sold": 13}
+    assert client.get("/stats/items/1").json() == {"item_id": 1, "order_count": 1, "units_sold": 5}
+    assert client.get(f"/stats/customers/{customer_id}").json() == {
+        "customer_id": customer_id, "order_count": 4, "units_ordered": 18,
+    }
+    assert [row["item_id"] for row in client.get("/stats/items/top", params={"limit": 1}).json()] == [item_id]
+    today = client.get("/stats/daily").json()
+    assert [(row["order_count"], row["units"]) for row in today] == [(4, 18)]
+    assert stats.verify(db_session) == []
+
+    item = client.post(
+        "/items/",
+        json={
+            "name": "Unsold", "description": "", "manufacturer_name": "Test Inc.",
+            "manufacturer_email": "test@example.com", "in_stock": 1, "reorder_quantity": 0,
+        },
+    ).json()
+    assert client.get(f"/stats/items/{item['id']}").json()["order_count"] == 0
+    assert client.get("/stats/items/999").status_code == 404
+    crud.delete_customer(db_session, customer_id)
+    assert client.get(f"/stats/customers/{customer_id}").status_code == 404
+    assert stats.verify(db_session) == []
+
+def test_stats_rebuild_repairs_drift(db_session):
+    _, item_id = _seed_order_history(items=1, orders_per_item=3)
+    db_session.execute(update(models.ItemSales).values(units_sold=1))
+    db_session.execute(text("delete from daily_order_volume"))
+    db_session.commit()
+    drift = stats.verify(db_session)
+    assert {row["table"] for row in drift} == {"item_sales", "daily_order_volume"}
+    assert drift[0]["stored"] == (3, 1) and drift[0]["expected"] == (3, 15)
+    stats.rebuild(db_session)
+    db_session.commit()
+    assert stats.verify(db_session) == []
+    assert client.get(f"/stats/items/{item_id}").json()["units_sold"] == 15
+
+def _low_stock_item(in_stock=25, reorder_quantity=20, name="Test Item"):
+    return client.post(
+        "/items/",
+        json={
+            "name": name,
+            "description": "A test item",
+            "manufacturer_name": "Test Inc.",
+            "manufacturer_email": "test@example.com",
+            "in_stock": in_stock,
+            "reorder_quantity": reorder_quantity,
+        },
+    ).json()
+
+def test_reorder_lifecycle(db_session):
+    customer_id = client.post(
+        "/customers/",
+        json={"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"},
+    ).json()["id"]
+    item = _low_stock_item()
+    for _ in range(4):
+        client.post("/orders/", json={"item_id": item["id"], "customer_id": customer_id, "order_quantity": 2})
+    logs = client.get("/reorder_logs/").json()
+    assert [(log["item_id"], log["status"]) for log in logs] == [(item["id"], "open")]
+    log_id = logs[0]["id"]
+
+    assert client.post(f"/reorder_logs/{log_id}/acknowledge").json()["status"] == "acknowledged"
+    assert client.post(f"/reorder_logs/{log_id}/acknowledge").status_code == 200
+    client.post("/orders/", json={"item_id": item["id"], "customer_id": customer_id, "order_quantity": 2})
+    assert len(client.get("/reorder_logs/").json()) == 1
+
+    # Restocking resolves the pending reorder; the next shortfall opens a new one.
+    client.put(f"/items/{item['id']}", json={**item, "in_stock": 100})
+    assert client.get("/reorder_logs/", params={"status": "resolved"}).json()[0]["id"] == log_id
+    assert client.post(f"/reorder_logs/{log_id}/acknowledge").status_code == 409
+    assert client.post("/reorder_logs/999/resolve").status_code == 404
+    client.post("/orders/", json={"item_id": item["id"], "customer_id": customer_id, "order_quantity": 90})
+    pending = client.get("/reorder_logs/", params={"status": "open"}).json()
+    assert len(pending) == 1 and pending[0]["id"] != log_id
+    assert client.post(f"/reorder_logs/{pending[0]['id']}/resolve").json()["status"] == "resolved"
+    assert client.get(f"/items/{item['id']}").json()["reorder_logs"][-1]["status"] == "resolved"
+
+def test_read_low_stock_items(db_session):
+    _low_stock_item(in_stock=25, reorder_quantity=20, name="Fine")
+    short = _low_stock_item(in_stock=5, reorder_quantity=20, name="Short")
+    shorter = _low_stock_item(in_stock=0, reorder_quantity=30, name="Shorter")
+    response = client.get("/items/low_stock")
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()] == [shorter["id"], short["id"]]
+
+    query = db_session.query(models.Item).filter(models.STOCK_SHORTFALL < 0).order_by(models.STOCK_SHORTFALL)
+    compiled = query.statement.compile(engine, compile_kwargs={"literal_binds": True})
+    plan = " ".join(row[3] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+    assert "ix_items_stock_shortfall" in plan and "TEMP B-TREE" not in plan
+
+def test_reorder_worker_opens_reorders_after_commit(db_session, monkeypatch):
+    worker = reorders.ReorderWorker(engine, window_ms=1)
+    monkeypatch.setattr(reorders, "_worker", worker)
+    customer_id = client.post(
+        "/customers/",
+        json={"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"},
+    ).json()["id"]
+    item = _low_stock_item()
+    for _ in range(3):
+        client.post("/orders/", json={"item_id": item["id"], "customer_id": customer_id, "order_quantity": 3})
+    worker.close()
+    logs = client.get("/reorder_logs/").json()
+    assert [(log["item_id"], log["status"]) for log in logs] == [(item["id"], "open")]
+
+def test_init_db_collapses_duplicate_reorder_logs():
+    old = create_engine("sqlite://")
+    with old.begin() as connection:
+        connection.exec_driver_sql(
+            "create table items (id integer primary key, name varchar, description varchar, manufacturer_name varchar, "
+            "manufacturer_email varchar, in_stock integer, reorder_quantity integer)"
+        )
+        connection.exec_driver_sql(
+            "create table item_reorder_logs (id integer primary key, item_id integer, timestamp datetime)"
+        )
+        connection.exec_driver_sql("insert into items (id, in_stock, reorder_quantity) values (1, 5, 10), (2, 50, 10)")
+        connection.exec_driver_sql("insert into item_reorder_logs (item_id) values (1), (2), (1), (1)")
+    models.init_db(old)
+    with old.connect() as connection:
+        rows = connection.exec_driver_sql("select id, item_id, status from item_reorder_logs order by id").all()
+    assert rows == [(1, 1, "resolved"), (2, 2, "resolved"), (3, 1, "resolved"), (4, 1, "open")]
+
+def _sample(text, name, **labels):
+    selector = name + "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+    for line in text.splitlines():
+        if line.startswith(selector + " "):
+            return float(line.split()[-1])
+    return None
+
+def test_metrics_per_operation_and_source(db_session):
+    metrics.registry.clear()
+    _seed_order_history(items=2, orders_per_item=1)
+    client.get("/items/", params={"embed": "full"})
+    client.get("/items/999")
+    TestClient(app, base_url="http://apiserver").get("/orders/")
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+
+    http = {"operation": "read_items", "source": "http"}
+    assert _sample(text, "oms_requests_total", **http, status=200) == 1
+    assert _sample(text, "oms_request_duration_seconds_count", **http) == 1
+    assert _sample(text, "oms_request_duration_seconds_bucket", **http, le="+Inf") == 1
+    # One SELECT for the items and one per eager-loaded relationship.
+    assert _sample(text, "oms_request_sql_statements_total", **http) == 3
+    assert _sample(text, "oms_request_rows_total", **http) == 4
+    assert _sample(text, "oms_response_bytes_total", **http) > 0
+    assert _sample(text, "oms_requests_total", operation="read_item", source="http", status=404) == 1
+    assert _sample(text, "oms_requests_total", operation="create_order", source="http", status=200) == 2
+    assert _sample(text, "oms_requests_total", operation="read_orders", source="mcp", status=200) == 1
+    # The lean order list reads Core rows, which are counted too.
+    assert _sample(text, "oms_request_rows_total", operation="read_orders", source="mcp") == 2
+    assert _sample(text, "oms_requests_total", operation="read_orders", source="http", status=200) is None
+
+def test_mcp_tools_run_in_process(db_session):
+    # Every in-process handler is for an operation the MCP server exposes.
+    assert set(TOOLS) <= set(MCP_OPERATIONS)
+    tools = InProcessMCP(app, TestingSessionLocal, include_operations=MCP_OPERATIONS, page_size=2)
+
+    def call(tool_name, mcp=tools, **arguments):
+        content = asyncio.run(mcp._execute_api_tool(None, tool_name, arguments, mcp.operation_map))
+        return json.loads(content[0].text)
+
+    metrics.registry.clear()
+    customer_id, item_id = _seed_order_history(items=3)
+    page = call("read_items", limit=100)
+    assert len(page["results"]) == 2
+    assert "orders" not in page["results"][0]
+    assert page["next_after_id"] == page["results"][-1]["id"]
+    assert f"after_id={page['next_after_id']}" in page["summary"]
+    page = call("read_items", after_id=page["next_after_id"], fields="name")
+    assert page["results"] == [{"id": item_id, "name": "Test Item 2"}]
+    assert page["next_after_id"] is None
+    assert len(call("read_orders", customer_id=customer_id)["results"]) == 2
+    assert call("read_item_by_name", name="Test Item")["next_after_id"] is None
+
+    order = {"item_id": item_id, "customer_id": customer_id, "order_quantity": 1, "Idempotency-Key": "mcp-1"}
+    created = call("create_order", **order)
+    assert created["result"]["order_quantity"] == 1
+    assert call("create_order", **order)["result"] == created["result"]
+    assert client.get(f"/items/{item_id}").json()["in_stock"] == 14
+    with pytest.raises(Exception, match="Status code: 400"):
+        call("create_order", item_id=item_id, customer_id=customer_id, order_quantity=1000)
+    with pytest.raises(Exception, match="Status code: 422"):
+        call("create_customer", name="No address")
+
+    # Rows past the byte cap are left for the next page.
+    small = InProcessMCP(app, TestingSessionLocal, include_operations=MCP_OPERATIONS, max_result_bytes=400)
+    page = call("read_items", mcp=small)
+    assert len(page["results"]) == 1
+    assert "cut short" in page["summary"]
+    text = metrics.registry.render()
+    assert _sample(text, "oms_requests_total", operation="read_items", source="mcp", status=200) == 3
+    assert _sample(text, "oms_requests_total", operation="create_order", source="mcp", status=400) == 1
+
+def test_slow_query_log(caplog):
+    slow = create_engine("sqlite://")
+    metrics.instrument(slow, slow_query_ms=0)
+    before = metrics.registry.slow_queries
+    with caplog.at_level("WARNING", logger="oms.slow_query"), slow.connect() as connection:
+        # A failing statement leaves no start time behind for the next one.
+        with pytest.raises(OperationalError):
+            connection.execute(text("select * from missing_table"))
+        connection.execute(text("select :value"), {"value": "needle"})
+        assert "oms_started" not in connection.info
+    assert any("select ?" in record.getMessage() and "needle" in record.getMessage() for record in caplog.records)
+    assert metrics.registry.slow_queries == before + 1
+
+def test_get_requests_use_read_only_sessions():
+    class FakeRequest:
+        def __init__(self, method):
+            self.method = method
+
+    sessions = get_db(FakeRequest("GET"))
+    db = next(sessions)
+    assert db.get_bind() is database.read_engine
+    assert db.get_bind().url.database != "./order_management.db"
+    if database.TUNED:
+        assert db.execute(text("pragma journal_mode")).scalar() == "wal"
+        with pytest.raises(OperationalError, match="readonly"):
+            db.execute(text("create table scratch (id integer)"))
+    sessions.close()
+    sessions = get_db(FakeRequest("POST"))
+    assert next(sessions).get_bind() is database.engine
+    sessions.close()
+
+def test_export_orders_streams_ndjson_and_csv(db_session):
+    customer_id, item_id = _seed_order_history(items=2, orders_per_item=3)
+    response = client.get("/export/orders")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [1, 2, 3, 4, 5, 6]
+    assert rows[-1].pop("created_at")
+    assert rows[-1] == {"id": 6, "item_id": item_id, "customer_id": customer_id, "order_quantity": 5}
+
+    response = client.get("/export/orders", params={"format": "csv", "since_id": 4})
+    assert response.headers["content-type"].startswith("text/csv")
+    assert [row[:4] for row in csv.reader(io.StringIO(response.text))] == [
+        ["id", "item_id", "customer_id", "order_quantity"],
+        ["5", str(item_id), str(customer_id), "5"],
+        ["6", str(item_id), str(customer_id), "5"],
+    ]
+
+def test_export_and_list_agree_on_offset_time_windows(db_session):
+    _seed_order_history(items=1, orders_per_item=3)
+    for order_id, hour in ((1, 10), (2, 11), (3, 12)):
+        db_session.execute(
+            update(models.ItemOrder).where(models.ItemOrder.id == order_id).values(created_at=datetime(2024, 1, 1, hour))
+        )
+    db_session.commit()
+    # 10:30-11:30 UTC, given in +05:00.
+    window = {"from": "2024-01-01T15:30:00+05:00", "to": "2024-01-01T16:30:00+05:00"}
+    assert [order["id"] for order in client.get("/orders/", params=window).json()] == [2]
+    exported = client.get("/export/orders", params=window).text.splitlines()
+    assert [json.loads(line)["id"] for line in exported] == [2]
+
+def test_export_rows_in_keyset_chunks(db_session):
+    _seed_order_history(items=1, orders_per_item=5)
+    rows = list(export.iter_rows(engine, "orders", since_id=1, chunk_size=2))
+    assert [row["id"] for row in rows] == [2, 3, 4, 5]
+    logs = list(export.iter_rows(engine, "reorder_logs", created_to=datetime(2000, 1, 1)))
+    assert logs == []
+
+def test_change_feed_follows_mutations(db_session):
+    customer_id = client.post(
+        "/customers/",
+        json={"name": "Test Customer", "address": "123 Test St", "zip_code": "12345"},
+    ).json()["id"]
+    item = _low_stock_item(in_stock=22)
+    order_id = client.post("/orders/", json={"item_id": item["id"], "customer_id": customer_id, "order_quantity": 5}).json()["id"]
+    client.post("/orders/", json={"item_id": item["id"], "customer_id": customer_id, "order_quantity": 500})
+    page = client.get("/changes").json()
+    assert [(change["entity"], change["entity_id"], change["action"]) for change in page["changes"]] == [
+        ("customer", customer_id, "created"),
+        ("item", item["id"], "created"),
+        ("reorder_log", 1, "created"),
+        ("order", order_id, "created"),
+        ("item", item["id"], "updated"),
+    ]
+    assert page["changes"][-1]["data"] == {"in_stock": 17}
+    assert page["next_after"] == 5
+    assert client.get("/changes", params={"after": 5}).json() == {"changes": [], "next_after": 5}
+    assert [change["id"] for change in client.get("/changes", params={"entity": "item", "limit": 1}).json()["changes"]] == [2]
+
+    # A long-poll returns as soon as a change commits.
+    def place_order():
+        with TestingSessionLocal() as db:
+            crud.create_order(db, schemas.ItemOrderCreate(item_id=item["id"], customer_id=customer_id, order_quantity=1))
+    timer = threading.Timer(0.2, place_order)
+    timer.start()
+    response = client.get("/changes", params={"after": 5, "wait": 30})
+    timer.join()
+    assert response.elapsed.total_seconds() < 5
+    assert [change["entity"] for change in response.json()["changes"]][0] == "order"
+    with TestClient(async_app) as async_client:
+        assert async_client.get("/changes", params={"after": 5}).json()["changes"][0]["entity_id"] == order_id + 1
+
+    async def read(after, check=False):
+        return changes.read(engine, after, 100, None, check)
+    async def first_event():
+        return await anext(changes.events(read, 0, await read(0)))
+    assert asyncio.run(first_event()).startswith(b"id: 1\nevent: customer.created\ndata: {")
+
+    # Pruned entries leave the cursors before them expired; the newest entry stays.
+    db_session.execute(update(models.ChangeLog).values(created_at=datetime(2000, 1, 1)))
+    db_session.commit()
+    assert changes.prune(db_session) == 6
+    assert client.get("/changes", params={"after": 3}).status_code == 410
+    assert client.get("/changes/stream", headers={"Last-Event-ID": "3"}).json()["detail"]["latest"] == 7
+    assert [change["id"] for change in client.get("/changes", params={"after": 6}).json()["changes"]] == [7]
+
+def test_import_items_csv(db_session):
+    content = (
+        "name,description,manufacturer_name,manufacturer_email,in_stock,reorder_quantity\n"
+        "Widget,,Acme,acme@example.com,10,2\n"
+        "Gadget,Shiny,Acme,acme@example.com,not-a-number,2\n"
+        "Gizmo,Small,Acme,acme@example.com,5,1\n"
+    )
+    response = client.post("/items/import", files={"file": ("items.csv", content, "text/csv")})
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["updated"], report["failed"]) == (2, 0, 1)
+    assert report["errors"][0]["row"] == 2
+    items = client.get("/items/", params={"embed": "none"}).json()
+    assert [(item["name"], item["description"], item["in_stock"]) for item in items] == [
+        ("Widget", None, 10),
+        ("Gizmo", "Small", 5),
+    ]
+    # Imported rows are searchable straight away.
+    assert client.get("/items/by_name/gizmo").json()[0]["name"] == "Gizmo"
+    for chunk_size in (0, -1, 10001):
+        response = client.post(
+            "/items/import", params={"chunk_size": chunk_size}, files={"file": ("items.csv", content, "text/csv")}
+        )
+        assert response.status_code == 422
+
+def test_import_customers_ndjson_upsert(db_session):
+    client.post("/customers/", json={"name": "Ada", "address": "Old Address", "zip_code": "12345"})
+    content = "\n".join([
+        json.dumps({"name": "Ada", "address": "New Address", "zip_code": "12345"}),
+        json.dumps({"name": "Ada", "address": "Elsewhere", "zip_code": "99999"}),
+        "[1, 2]",
+        json.dumps({"name": "Grace"}),
+    ])
+    response = client.post(
+        "/customers/import",
+        params={"upsert": True},
+        files={"file": ("customers.ndjson", content, "application/x-ndjson")},
+    )
+    report = response.json()
+    assert (report["inserted"], report["updated"], report["failed"]) == (1, 1, 2)
+    assert [error["row"] for error in report["errors"]] == [3, 4]
+    customers = client.get("/customers/", params={"embed": "none"}).json()
+    assert [(c["name"], c["address"]) for c in customers] == [("Ada", "New Address"), ("Ada", "Elsewhere")]
+
+def test_bulk_delete_and_archive(db_session, tmp_path):
+    customer_id, _ = _seed_order_history(items=3, orders_per_item=3)
+    assert client.post("/orders/bulk_delete", json={"ids": [1, 2, 999]}).json() == {"deleted": 2}
+    assert client.post("/orders/bulk_delete", json={}).status_code == 422
+    assert client.post("/items/bulk_delete", json={"id_from": 1, "id_to": 1}).json() == {"deleted": 1}
+    assert client.post("/reorder_logs/bulk_delete", json={"ids": [1]}).json() == {"deleted": 1}
+    assert stats.verify(db_session) == []
+    feed = client.get("/changes", params={"limit": 1000}).json()["changes"]
+    assert [(change["entity"], change["entity_id"], change["action"]) for change in feed[-6:]] == [
+        ("order", 1, "deleted"),
+        ("order", 2, "deleted"),
+        ("item", 1, "deleted"),
+        ("order", 3, "updated"),
+        ("reorder_log", 1, "updated"),
+        ("reorder_log", 1, "deleted"),
+    ]
+    assert client.get("/orders/", params={"include_archive": True}).status_code == 400
+
+    # Orders 3-7 and the resolved log 2 are old enough to archive; log 3 is still open.
+    db_session.execute(update(models.ItemOrder).where(models.ItemOrder.id <= 7).values(created_at=datetime(2000, 1, 1)))
+    db_session.execute(update(models.ItemReorderLog).values(timestamp=datetime(2000, 1, 1)))
+    stats.rebuild(db_session)
+    db_session.commit()
+    client.post("/reorder_logs/2/resolve")
+    archive_engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+    database.attach_archive(archive_engine, str(tmp_path / "archive.db"))
+    models.init_db(archive_engine)
+    ArchiveSession = sessionmaker(autoflush=False, bind=archive_engine)
+
+    def archive_db():
+        with ArchiveSession() as db:
+            yield db
+
+    try:
+        with ArchiveSession() as db:
+            assert archive.archive_before(db, datetime(2001, 1, 1), chunk_size=2) == {"orders": 5, "reorder_logs": 1}
+            assert stats.verify(db) == []
+        app.dependency_overrides[get_db] = archive_db
+        assert [order["id"] for order in client.get("/orders/").json()] == [8, 9]
+        orders = client.get("/orders/", params={"include_archive": True}).json()
+        assert [order["id"] for order in orders] == [3, 4, 5, 6, 7, 8, 9]
+        assert [order["id"] for order in client.get(
+            "/orders/", params={"include_archive": True, "item_id": 2, "after_id": 4}
+        ).json()] == [5, 6]
+        assert [log["id"] for log in client.get("/reorder_logs/", params={"include_archive": True}).json()] == [2, 3]
+        # Deleting the customer detaches its archived orders as well.
+        assert client.post("/customers/bulk_delete", json={"ids": [customer_id]}).json() == {"deleted": 1}
+        with ArchiveSession() as db:
+            assert stats.verify(db) == []
+            assert db.scalar(select(archive.orders.c.customer_id).where(archive.orders.c.id == 4)) is None
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+        archive_engine.dispose()
+
+# Startup budgets, checked in a fresh interpreter on an empty database: a
+# plain `import main` (what every worker, test run and CLI tool pays) and the
+# first request once the app has started.
+IMPORT_BUDGET_SECONDS = 1.0
+FIRST_REQUEST_BUDGET_SECONDS = 0.25
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+import database, models, settings
+configured = settings._settings is not None or database._engines_built is not None
+from sqlalchemy import inspect
+tables = inspect(database.engine).get_table_names()
+mcp_imported = "fastapi_mcp" in sys.modules
+models.init_db(database.engine)
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    start = time.perf_counter()
+    status = client.get("/items/").status_code
+    first_request = time.perf_counter() - start
+    mounted = any(getattr(route, "path", None) == "/mcp" for route in main.app.routes)
+print(json.dumps({"import": imported, "configured": configured, "tables": tables, "mcp_imported": mcp_imported,
+                  "first_request": first_request, "status": status, "mounted": mounted}))
+"""
+
+# create_app with explicit settings, in a fresh interpreter since this one's
+# settings are already fixed: everything configured from them follows.
+FACTORY_SCRIPT = """
+import json, sys
+from sqlalchemy import create_engine
+import database, main, models
+from settings import Settings
+models.init_db(create_engine(sys.argv[1]))
+settings = Settings(database_url=sys.argv[1], storage_profile="default", mcp=False, metrics=False, async_handlers=True)
+app = main.create_app(settings)
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    orders = client.get("/orders/").status_code
+    metrics = client.get("/metrics").status_code
+engines = database.get_engines()
+try:
+    main.create_app(Settings(database_url="sqlite:///elsewhere.db"))
+    replaced = True
+except RuntimeError:
+    replaced = False
+print(json.dumps({
+    "orders": orders, "metrics": metrics, "mcp": getattr(app.state, "mcp", None) is not None,
+    "database": engines.engine.url.database, "tuned": engines.TUNED,
+    "async_connections": engines.async_engine.sync_engine.pool.checkedin(),
+    "sync_connections": engines.engine.pool.checkedin(),
+    "cache_entries": main.catalog.max_entries, "replaced": replaced,
+}))
+"""
+
+def _run_script(script, env, *args):
+    result = subprocess.run(
+        [sys.executable, "-c", script, *args], env={**os.environ, **env}, capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+def test_startup_budgets(tmp_path):
+    startup = _run_script(STARTUP_SCRIPT, {"OMS_DATABASE_URL": f"sqlite:///{tmp_path / 'startup.db'}"})
+    # Importing the app reads no configuration, creates no schema and does
+    # not load the MCP SDK...
+    assert not startup["configured"]
+    assert startup["tables"] == []
+    assert not startup["mcp_imported"]
+    assert startup["import"] < IMPORT_BUDGET_SECONDS
+    # ...which is mounted once it starts.
+    assert startup["mounted"]
+    assert startup["status"] == 200
+    assert startup["first_request"] < FIRST_REQUEST_BUDGET_SECONDS
+
+def test_create_app_from_settings(tmp_path):
+    path = tmp_path / "factory.db"
+    built = _run_script(FACTORY_SCRIPT, {"OMS_CATALOG_CACHE": "1"}, f"sqlite:///{path}")
+    assert (built["orders"], built["metrics"], built["mcp"]) == (200, 404, False)
+    # The engines come from the given settings, not the environment, and the
+    # request was served by the async handlers on the aiosqlite engine.
+    assert built["database"] == str(path)
+    assert not built["tuned"]
+    assert (built["async_connections"], built["sync_connections"]) == (1, 0)
+    assert built["cache_entries"] == 0
+    # Other settings are refused once the process is configured.
+    assert not built["replaced"]
@@ -0,0 +1,170 @@
+"""Group commit for SQLite writes.
+
+SQLite has a single writer and every commit pays for its own fsync, so under
+bursty load concurrent writers queue up on the database lock (and eventually
+fail with "database is locked"). The WriteCoalescer hands writes to one
+background thread that gathers whatever arrives within a short window and
+applies the whole batch in a single ``BEGIN IMMEDIATE`` transaction: one lock
+acquisition and one fsync for many callers.
+
+Each operation runs in its own Session joined to the batch connection with
+``join_transaction_mode="create_savepoint"``, so the crud functions' own
+commit()/rollback() calls only release or roll back a SAVEPOINT. A failing
+operation is rolled back on its own and its caller gets the exception, while
+the rest of the batch still commits. ``joined_transaction`` sets this up and
+is also used on its own by writes that must commit together with statements
+issued after the crud function returns (see idempotency.py).
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from sqlalchemy.orm import Session
+
+import changes, database, idempotency, reorders
+from cache import catalog
+from responses import validated
+from settings import get_settings
+
+_STOP = object()
+
+
+@contextmanager
+def joined_transaction(connection):
+    """Open a BEGIN IMMEDIATE transaction on `connection` and yield a factory
+    of Sessions joined to it by savepoint. The transaction commits when the
+    block exits normally (the connection's owner rolls it back otherwise);
+    cache invalidations, reorder and change feed notifications from the
+    Sessions wait for that commit."""
+    cache_tags = set()
+    reorder_items = set()
+    changed = set()
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+    yield lambda: Session(
+        bind=connection,
+        autoflush=False,
+        join_transaction_mode="create_savepoint",
+        info={"deferred_cache_tags": cache_tags, "deferred_reorder_items": reorder_items, "deferred_changes": changed},
+    )
+    connection.commit()
+    if cache_tags:
+        catalog.invalidate(*cache_tags)
+    if reorder_items:
+        reorders.get_reorder_worker().notify(reorder_items)
+    if changed:
+        changes.committed()
+
+
+def run_in_transaction(connection, operation, *args, **kwargs):
+    """Run operation(db, *args, **kwargs) alone in a joined_transaction on `connection`."""
+    with joined_transaction(connection) as session, session() as db:
+        return operation(db, *args, **kwargs)
+
+
+class WriteCoalescer:
+    def __init__(self, bind, window_ms: float = 2.0, max_batch: int = 64):
+        self._bind = bind
+        self._window = window_ms / 1000
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="oms-write-coalescer", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args, **kwargs) -> Future:
+        """Queue operation(db, *args, **kwargs) for the next batch.
+
+        The operation must not return ORM objects that still need lazy loads:
+        its Session is closed as soon as it finishes.
+        """
+        future = Future()
+        self._queue.put((operation, args, kwargs, future))
+        return future
+
+    def run(self, operation, *args, **kwargs):
+        """Submit an operation and block until its batch has committed."""
+        return self.submit(operation, *args, **kwargs).result()
+
+    def close(self):
+        """Apply whatever is queued, then stop the worker thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self._window
+            while len(batch) < self._max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._apply(batch)
+
+    def _apply(self, batch):
+        outcomes = []
+        try:
+            with self._bind.connect() as connection, joined_transaction(connection) as session:
+                for operation, args, kwargs, _ in batch:
+                    with session() as db:
+                        try:
+                            outcomes.append((True, operation(db, *args, **kwargs)))
+                        except Exception as exc:
+                            db.rollback()
+                            outcomes.append((False, exc))
+        except Exception as exc:
+            # The batch transaction itself failed, so nothing was written.
+            for *_, future in batch:
+                future.set_exception(exc)
+            return
+        for (ok, value), (*_, future) in zip(outcomes, batch):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_write_coalescer():
+    """Dependency: the process-wide coalescer, or None when OMS_WRITE_COALESCING is off."""
+    global _coalescer
+    settings = get_settings()
+    if not settings.write_coalescing:
+        return None
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = WriteCoalescer(database.engine, settings.write_batch_window_ms, settings.write_batch_max)
+    return _coalescer
+
+
+def write(db, writes, operation, schema, *args, idempotency_key=None):
+    """Run a crud mutation on the request session, or through the coalescer
+    when one is configured. Coalesced results come back as `schema`.
+
+    With an idempotency_key the mutation runs at most once per key and its
+    result comes back as a stored JSON Response (see idempotency.py)."""
+    if idempotency_key is not None:
+        replay = idempotency.lookup(db, idempotency_key, operation, args)
+        if replay is not None:
+            return replay
+        operation = idempotency.once(idempotency_key, operation, schema)
+        if writes is None:
+            with db.get_bind().connect() as connection:
+                return run_in_transaction(connection, operation, *args)
+        return writes.run(operation, *args)
+    if writes is None:
+        return operation(db, *args)
+    return writes.run(validated(operation, schema), *args)